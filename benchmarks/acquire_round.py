@@ -0,0 +1,56 @@
+"""
+Microbenchmark of the overhead of a single round of Lock._acquire.
+
+The lock is acquired on stub nodes that reply to every script call at once, so only
+the time spent in redlock_plus itself is measured. To compare two revisions, run it
+in a checkout of each::
+
+    python benchmarks/acquire_round.py
+    git checkout <revision> && python benchmarks/acquire_round.py
+
+Timings depend on the machine and on its load, so only compare runs made on the same
+machine, alternating between the revisions.
+"""
+
+import os
+import sys
+import timeit
+import argparse
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redlock_plus  # noqa: E402 # pylint: disable=wrong-import-position
+
+
+class StubNode:
+    # pylint: disable=too-few-public-methods
+    """
+    A redis node replying `1` to every command and script call, without any I/O
+    """
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--nodes", type=int, default=5, help="number of stub nodes")
+    parser.add_argument("--rounds", type=int, default=200_000, help="rounds per run")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs")
+    args = parser.parse_args()
+
+    lock = redlock_plus.Lock(
+        "benchmark", nodes=[StubNode() for _ in range(args.nodes)], retry_times=0
+    )
+    best = min(timeit.repeat(lock._acquire, number=args.rounds, repeat=args.repeat))
+    print(
+        f"{best / args.rounds * 1e6:.2f} us per _acquire round "
+        f"({args.nodes} nodes, best of {args.repeat} runs of {args.rounds})"
+    )
+
+
+if __name__ == "__main__":
+    main()
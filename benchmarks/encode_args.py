@@ -0,0 +1,78 @@
+"""
+Microbenchmark of encoding the script arguments of a lock for every node.
+
+Each cycle takes a new token and calls the acquire and release scripts on every node,
+the way a lock does, without going through the thread pool the nodes are otherwise
+requested in. The stub nodes pack each script call into a redis command like
+redis-py does before sending it, but without any I/O. To compare two revisions, run
+it in a checkout of each::
+
+    python benchmarks/encode_args.py
+    git checkout <revision> && python benchmarks/encode_args.py
+"""
+
+import os
+import sys
+import timeit
+import argparse
+from typing import Any, Callable, Sequence
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redlock_plus  # noqa: E402 # pylint: disable=wrong-import-position
+
+
+class StubNode:
+    # pylint: disable=too-few-public-methods
+    """
+    A redis node packing every script call into a command and replying `1`
+    """
+
+    def __init__(self) -> None:
+        self.connection_pool = redis.ConnectionPool()
+        self._connection = redis.connection.Connection()
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def call(
+            *_: Any, keys: Sequence[Any] = (), args: Sequence[Any] = (), **__: Any
+        ) -> int:
+            self._connection.pack_command("EVALSHA", name, len(keys), *keys, *args)
+            return 1
+
+        return call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--nodes", type=int, default=5, help="number of stub nodes")
+    parser.add_argument("--rounds", type=int, default=100_000, help="cycles per run")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs")
+    args = parser.parse_args()
+
+    lock = redlock_plus.Lock(
+        "benchmark", nodes=[StubNode() for _ in range(args.nodes)], retry_times=0
+    )
+
+    nodes = lock.redis_nodes
+
+    def cycle() -> None:
+        lock.lock_key = lock._generate_lock_key()
+        for node in nodes:
+            lock._acquire_node(node)
+        for node in nodes:
+            lock._release_node(node)
+
+    best = min(timeit.repeat(cycle, number=args.rounds, repeat=args.repeat))
+    print(
+        f"{best / args.rounds * 1e6:.2f} us per acquire and release cycle "
+        f"({args.nodes} nodes, best of {args.repeat} runs of {args.rounds})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Distributed locks using Redis.
+An Implementation of the `Redlock <http://redis.io/topics/distlock>`_ algorithm.
+
+The package re-exports the public API, which lives in submodules so each of them
+stays under the module line limit of the linter and can be read on its own:
+
+- :mod:`redlock_plus.lock`, :mod:`redlock_plus.rlock`: the locks, whose requests to
+  single nodes live in :mod:`redlock_plus._base`
+- :mod:`redlock_plus.factory`: the lock factories
+- :mod:`redlock_plus.autoextend`, :mod:`redlock_plus.clock`,
+  :mod:`redlock_plus.stats`, :mod:`redlock_plus.results`: what the locks build on
+- :mod:`redlock_plus.events`, :mod:`redlock_plus.election`,
+  :mod:`redlock_plus.ratelimit`: the primitives built on the redis nodes besides
+  locks
+- :mod:`redlock_plus.nodes`, :mod:`redlock_plus.scripts`,
+  :mod:`redlock_plus.exceptions`, :mod:`redlock_plus._util`: what all of the above
+  share
+
+None of the submodules import names from the package, so there are no import cycles.
+:mod:`redlock_plus.asyncio` and :mod:`redlock_plus.testing` are optional and not
+imported by the package.
+
+Patch module globals in the module that uses them. The exceptions are
+:data:`CLOCK_DRIFT_FACTOR` and :data:`NODE_TIMEOUT_FACTOR`, which are used by
+:mod:`redlock_plus._util`: the package forwards reading and assigning them to it, so
+``redlock_plus.CLOCK_DRIFT_FACTOR = 0.02`` keeps working. Locks take the values at the
+time their ttl is set.
+"""
+
+import sys
+import types
+from typing import TYPE_CHECKING, List
+
+if sys.version_info >= (3, 8):
+    import importlib.metadata as importlib_metadata  # pylint: disable=no-name-in-module, import-error  # noqa: E501
+else:
+    import importlib_metadata  # type: ignore # pylint: disable=import-error
+
+from redlock_plus import _util
+from redlock_plus._util import sleep_ms
+from redlock_plus.autoextend import RenewalPolicy
+from redlock_plus.clock import ClockDriftMonitor
+from redlock_plus.election import LeaderElection
+from redlock_plus.events import Condition, Event
+from redlock_plus.exceptions import (
+    InsufficientNodesError,
+    InvalidOperationError,
+    LockExpiredError,
+    RedlockError,
+)
+from redlock_plus.factory import LockFactory, RLockFactory, SingleNodeLockFactory
+from redlock_plus.lock import Lock, SingleNodeLock
+from redlock_plus.nodes import (
+    NODE_REGISTRY,
+    NodeLatency,
+    NodeRegistry,
+    init_redis_nodes,
+)
+from redlock_plus.ratelimit import (
+    RateLimiter,
+    RateLimitResult,
+    SlidingWindow,
+    TokenBucket,
+)
+from redlock_plus.results import (
+    AcquireResult,
+    HolderInfo,
+    Lease,
+    LockContention,
+    LockInfo,
+)
+from redlock_plus.rlock import RLock
+from redlock_plus.scripts import (
+    BUMP_LUA_SCRIPT,
+    FUNCTION_LIBRARY_NAME,
+    GET_TTL_LUA_SCRIPT,
+    RELEASE_LUA_SCRIPT,
+)
+from redlock_plus.stats import LockProfiler, LockStats, ResourceStats
+
+if TYPE_CHECKING:
+    from redlock_plus._util import CLOCK_DRIFT_FACTOR, NODE_TIMEOUT_FACTOR
+
+__version__ = importlib_metadata.version("redlock-plus")
+
+
+def _util_attribute(name: str) -> property:
+    """
+    :returns: A property reading and assigning the attribute `name` of
+        :mod:`redlock_plus._util`
+    """
+    return property(
+        lambda _: getattr(_util, name), lambda _, value: setattr(_util, name, value)
+    )
+
+
+class _Package(types.ModuleType):
+    """
+    Type of the package module, so the factors are only defined in
+    :mod:`redlock_plus._util`, but can still be assigned on the package
+    """
+
+    CLOCK_DRIFT_FACTOR = _util_attribute("CLOCK_DRIFT_FACTOR")
+    NODE_TIMEOUT_FACTOR = _util_attribute("NODE_TIMEOUT_FACTOR")
+
+    def __dir__(self) -> List[str]:
+        return sorted({*super().__dir__(), "CLOCK_DRIFT_FACTOR", "NODE_TIMEOUT_FACTOR"})
+
+
+sys.modules[__name__].__class__ = _Package
+
+__all__ = [
+    "Lock",
+    "RLock",
+    "SingleNodeLock",
+    "LockFactory",
+    "RLockFactory",
+    "SingleNodeLockFactory",
+    "Event",
+    "Condition",
+    "LeaderElection",
+    "RateLimiter",
+    "TokenBucket",
+    "SlidingWindow",
+    "RateLimitResult",
+    "Lease",
+    "LockContention",
+    "AcquireResult",
+    "HolderInfo",
+    "LockInfo",
+    "ClockDriftMonitor",
+    "RenewalPolicy",
+    "LockProfiler",
+    "ResourceStats",
+    "LockStats",
+    "init_redis_nodes",
+    "NodeLatency",
+    "NodeRegistry",
+    "NODE_REGISTRY",
+    "FUNCTION_LIBRARY_NAME",
+    "CLOCK_DRIFT_FACTOR",
+    "NODE_TIMEOUT_FACTOR",
+    "RELEASE_LUA_SCRIPT",
+    "GET_TTL_LUA_SCRIPT",
+    "BUMP_LUA_SCRIPT",
+    "sleep_ms",
+    "RedlockError",
+    "InsufficientNodesError",
+    "InvalidOperationError",
+    "LockExpiredError",
+]
@@ -0,0 +1,333 @@
+"""
+Requests a lock makes to single redis nodes.
+"""
+
+from typing import Union, Optional, Tuple, List, Any, Dict, Iterator, Callable, cast
+
+import redis
+
+from redlock_plus._util import (
+    _clock_drift,
+    _map_concurrently,
+    _map_hedged,
+    _monotonic_ms,
+    _new_lock_key,
+    _node_timeout,
+    _pack_holder_info,
+)
+from redlock_plus.clock import ClockDriftMonitor
+from redlock_plus.nodes import _TimeoutClient
+from redlock_plus.stats import _StatsRecorder
+
+
+class _TtlBase:
+    # pylint: disable=too-few-public-methods
+    """
+    The ttl of a lock and the timing derived from it, shared by :class:`Lock` and
+    :class:`~redlock_plus.asyncio.AsyncLock`
+    """
+
+    @property
+    def ttl(self) -> int:
+        """
+        Time in milliseconds until the lock expires
+        """
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, ttl: int) -> None:
+        # the clock drift only depends on the ttl, so compute it once here instead of
+        # on every round of acquiring, extending or checking the lock. The same goes
+        # for the time in seconds a single request to a node may take
+        self._ttl = ttl
+        self._drift = _clock_drift(ttl)
+        self._request_timeout = _node_timeout(ttl)
+        self._ttl_changed()
+
+    def _ttl_changed(self) -> None:
+        """
+        Update whatever else depends on the ttl, called whenever it is set
+        """
+
+
+class _LockBase(_TtlBase):
+    # pylint: disable=too-many-instance-attributes
+    """
+    The requests a :class:`Lock` makes to single redis nodes and the script arguments
+    it encodes for them
+    """
+
+    redis_nodes: List[redis.StrictRedis]
+    quorum: int
+    holder_info: bool
+    clock_monitor: Optional[ClockDriftMonitor]
+    hedge: bool
+    _encoding: Optional[Tuple[str, str]]
+    _lock_key: Optional[str]
+    _stats: Optional[_StatsRecorder]
+    _contended: List[Tuple[int, Union[str, bytes]]]
+
+    def _ttl_changed(self) -> None:
+        # pylint: disable=attribute-defined-outside-init
+        # the clients kept for acquiring are built with the request timeout
+        self._acquire_clients: Dict[redis.StrictRedis, _TimeoutClient] = {}
+        self._encode_args()
+
+    @property
+    def resource_name(self) -> str:
+        """
+        Global identifier of the lock, shared across all redis nodes
+        """
+        return self._resource_name
+
+    @resource_name.setter
+    def resource_name(self, resource_name: str) -> None:
+        self._resource_name = resource_name
+        self._keys_arg = [self._encode(resource_name)]
+
+    @property
+    def lock_key(self) -> Optional[str]:
+        """
+        The random token the lock is held with, `None` if it is not held
+        """
+        return self._lock_key
+
+    @lock_key.setter
+    def lock_key(self, lock_key: Optional[str]) -> None:
+        self._lock_key = lock_key
+        self._encode_args()
+
+    def _encode(self, value: str) -> Union[str, bytes]:
+        """
+        Encode a string argument like redis-py would, if all nodes share an encoding
+        """
+        if self._encoding is None:
+            return value
+        return value.encode(*self._encoding)
+
+    def _encode_args(self) -> None:
+        """
+        Build the arguments of the per-node scripts from the lock key and ttl. This
+        happens whenever either changes, e.g. once per acquire, instead of redis-py
+        encoding them again for every node and round. Bytes are passed on as they are.
+        """
+        # pylint: disable=attribute-defined-outside-init
+        lock_key = self._lock_key
+        token = self._encode(lock_key) if lock_key is not None else None
+        self._token_args = [token]
+        # redis-py encodes numbers with repr
+        self._token_ttl_args = [token, repr(self._ttl).encode()]
+
+    # The per-node helpers below are only ever called from methods that have already
+    # ensured the lock key is set, so they skip the `Lock._requires_key` check on
+    # purpose. They are called once per node and round, which makes them part of the
+    # hot path.
+
+    def _client(
+        self, node: redis.StrictRedis, deadline: Optional[float] = None
+    ) -> _TimeoutClient:
+        """
+        Return the client to make a single request to a node with, which times out
+        after the fraction of the ttl given by :data:`NODE_TIMEOUT_FACTOR`, or at
+        `deadline` if that comes first. The node and its connection pool are shared
+        with locks of other ttls, so the timeout applies to the request only.
+        """
+        return _TimeoutClient(node, self._request_timeout, deadline)
+
+    def _acquire_node(
+        self, node: redis.StrictRedis, deadline: Optional[float] = None
+    ) -> bool:
+        """
+        Attempt to lock a single redis node. If the node is locked by someone else,
+        record the reported time to live and token in :attr:`Lock._contended`
+
+        :param node: An initialised redis client instance
+        :param deadline: Point in time of :func:`time.monotonic` in seconds the
+            request must be done by, see :meth:`Lock._client`
+        :returns: `True` if the node was locked successfully, `False` otherwise
+        """
+        # acquiring is never done concurrently, so instead of building a client for
+        # every node and round like Lock._client, each node reuses its client
+        client = self._acquire_clients.get(node)
+        if client is None:
+            client = _TimeoutClient(node, self._request_timeout)
+            self._acquire_clients[node] = client
+        client.deadline = deadline
+        try:
+            result = node.redlock_acquire_script(  # type: ignore
+                keys=self._keys_arg, args=self._token_ttl_args, client=client
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            self._node_error(node)
+            return False
+        if isinstance(result, list):
+            self._contended.append((result[0], result[1]))
+            return False
+        return bool(result)
+
+    def _release_node(self, node: redis.StrictRedis) -> bool:
+        """
+        Release a single redis node
+
+        :param node: An initialised redis client instance
+        :returns: `True` if the node was released successfully, `False` otherwise
+        """
+        try:
+            return node.redlock_release_script(  # type: ignore
+                keys=self._keys_arg, args=self._token_args, client=self._client(node)
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            self._node_error(node)
+            return False
+
+    def _bump_node(self, node: redis.StrictRedis) -> bool:
+        """
+        Update the ttl of a single redis node
+
+        :param node: An initialised redis client instance
+        :returns: `True` if the ttl was updated successfully, `False` otherwise
+        """
+        try:
+            if self.clock_monitor is not None:
+                return bool(
+                    self._call_timed_script(
+                        node,
+                        node.redlock_bump_timed_script,  # type: ignore
+                        self._token_ttl_args,
+                    )
+                )
+            return node.redlock_bump_script(  # type: ignore
+                keys=self._keys_arg,
+                args=self._token_ttl_args,
+                client=self._client(node),
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            self._node_error(node)
+            return False
+
+    def _get_ttl_from_node(self, node: redis.StrictRedis) -> Union[float, None]:
+        """
+        Get the ttl of a single redis node
+
+        :param node: An initialised redis client instance
+        :returns: Time to live in milliseconds as a `float` if the request was s
+            uccessful, `None` otherwise
+        """
+        try:
+            if self.clock_monitor is not None:
+                return self._call_timed_script(
+                    node,
+                    node.redlock_get_ttl_timed_script,  # type: ignore
+                    self._token_args,
+                )
+            return node.redlock_get_ttl_script(  # type: ignore # noqa: E501
+                keys=self._keys_arg, args=self._token_args, client=self._client(node)
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            self._node_error(node)
+            return None
+
+    def _call_timed_script(
+        self, node: redis.StrictRedis, script: Callable, args: List[Any]
+    ) -> int:
+        """
+        Call a script returning the server time along with its result and record it in
+        :attr:`Lock.clock_monitor`
+
+        :param node: An initialised redis client instance
+        :param script: The script to call on the node
+        :param args: Arguments to pass to the script
+        :returns: The result of the script
+        """
+        start_time = _monotonic_ms()
+        result, seconds, microseconds = script(
+            keys=self._keys_arg, args=args, client=self._client(node)
+        )
+        end_time = _monotonic_ms()
+        cast(ClockDriftMonitor, self.clock_monitor).record(
+            node,
+            local_time=(start_time + end_time) / 2,
+            server_time=int(seconds) * 1000 + int(microseconds) / 1000,
+            round_trip_time=end_time - start_time,
+        )
+        return int(result)
+
+    def _transfer_node(
+        self, node: redis.StrictRedis, previous_lock_key: Union[str, bytes]
+    ) -> bool:
+        """
+        Replace the token of a lock held on a single redis node with the current
+        :attr:`Lock.lock_key` and reset its ttl
+
+        :param node: An initialised redis client instance
+        :param previous_lock_key: The token the lock is currently held with
+        :returns: `True` if the token was replaced successfully, `False` otherwise
+        """
+        try:
+            return node.redlock_transfer_script(  # type: ignore
+                keys=self._keys_arg,
+                args=[previous_lock_key, *self._token_ttl_args],
+                client=self._client(node),
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            self._node_error(node)
+            return False
+
+    def _node_error(self, node: redis.StrictRedis) -> None:
+        """
+        Record a failed request to a node, if the lock is created by a factory
+        """
+        if self._stats is not None:
+            self._stats.record_error(node)
+
+    def _get_drift(self) -> float:
+        """
+        Return the clock drift in milliseconds to account for when computing the
+        validity of the lock, as measured by :attr:`Lock.clock_monitor` if set
+        """
+        if self.clock_monitor is None:
+            return self._drift
+        return self.clock_monitor.drift(self.ttl, self.redis_nodes)
+
+    def _generate_lock_key(self) -> str:
+        """
+        Generate a new lock key, including holder metadata if :attr:`Lock.holder_info`
+        is set
+        """
+        if self.holder_info:
+            return _new_lock_key() + _pack_holder_info()
+        return _new_lock_key()
+
+    def _map_nodes(
+        self, func: Callable, nodes: Optional[List[redis.StrictRedis]] = None
+    ) -> Iterator[Any]:
+        """
+        Apply a function to redis nodes asynchronously using
+        :meth:`concurrent.futures.ThreadPoolExecutor.map`
+
+        :param func: Callable that accepts a node as its first parameter
+        :param nodes: Redis nodes to map. Defaults to :attr:`Lock.redis_nodes`
+        :returns: Result iterator for the created futures
+        """
+        if nodes is None:
+            nodes = self.redis_nodes
+        if self._stats is not None:
+            self._stats.record_requests(nodes)
+        return _map_concurrently(func, nodes)
+
+    def _map_quorum(self, func: Callable) -> List[Any]:
+        """
+        Apply a function to all redis nodes like :meth:`Lock._map_nodes`, whose
+        result only matters if it is truthy on a quorum of nodes. If
+        :attr:`Lock.hedge` is set, slow nodes are not waited for once that is
+        certain, see :func:`_map_hedged`
+
+        :param func: Callable that accepts a node as its first parameter
+        :returns: The results in the order of :attr:`Lock.redis_nodes`, `None` for
+            nodes not waited for
+        """
+        if not self.hedge:
+            return list(self._map_nodes(func))
+        if self._stats is not None:
+            self._stats.record_requests(self.redis_nodes)
+        return _map_hedged(func, self.redis_nodes, self.quorum)
@@ -0,0 +1,358 @@
+"""
+Helpers shared by the locks: timing, lock keys, concurrent requests to the nodes
+and fork safety.
+"""
+
+import os
+import sys
+import math
+import time
+import socket
+import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, wait as wait_futures
+from typing import (
+    Optional,
+    Tuple,
+    List,
+    Any,
+    Dict,
+    Type,
+    Iterable,
+    Iterator,
+    Callable,
+    TypeVar,
+)
+
+import redis
+
+if sys.version_info >= (3, 7):
+    from time import monotonic_ns  # pylint: disable=no-name-in-module
+
+    monotonic = monotonic_ns
+
+    def _monotonic_to_ms(_time: float) -> float:
+        return _time / 1_000_000
+
+
+else:
+    from time import monotonic
+
+    def _monotonic_to_ms(_time: float) -> float:
+        return _time * 1000
+
+
+DecoratorT = TypeVar("DecoratorT", bound=Callable[..., Any])
+
+T = TypeVar("T")
+
+
+def _monotonic_ms() -> float:
+    """
+    Return the current monotonic time in milliseconds using the most precise source
+    available. On Python => 3.7 use :func:`time.monotonic_ns`, below use
+    :func:`time.monotonic`
+    """
+    return _monotonic_to_ms(monotonic())
+
+
+def _monotonic_delta_ms(time_a: float, time_b: float) -> float:
+    """
+    Return the delta between two monotonic points in time acquired with
+    :func:`monotonic` in milliseconds. Always use this function when computing the delta
+    between two monotonic times since this assures the returned value will be in
+    milliseconds independent from the predicion of the monotonic source.
+    """
+    return _monotonic_to_ms(time_a - time_b)
+
+
+def _deadline(end_time: float, validity: float) -> float:
+    """
+    Return the point in time of :func:`time.monotonic` in seconds at which a lock
+    whose validity of `validity` milliseconds was computed at `end_time` (acquired
+    with :func:`monotonic`) runs out
+    """
+    return (_monotonic_to_ms(end_time) + validity) / 1000
+
+
+def _validity(ttl: float, drift: float, start_time: float, end_time: float) -> float:
+    """
+    Return the time in milliseconds a lock set with a ttl of `ttl` milliseconds by a
+    round of requests from `start_time` to `end_time` (acquired with
+    :func:`monotonic`) can be considered held, accounting for `drift` milliseconds of
+    clock drift. Not positive if the lock cannot be considered held at all
+    """
+    return ttl - (_monotonic_delta_ms(end_time, start_time) + drift)
+
+
+def _remaining_ttls(
+    ttls: Iterable[Optional[float]], drift: float, start_time: float, end_time: float
+) -> List[float]:
+    """
+    Return the times in milliseconds a lock can still be considered held on each node
+    that reported the remaining ttl in `ttls` during a round of requests from
+    `start_time` to `end_time`, like :func:`_validity`. Nodes that did not reply, or
+    whose key expired while the other nodes were queried, are left out
+    """
+    margin = _monotonic_delta_ms(end_time, start_time) + drift
+    return [
+        float(ttl - margin)
+        for ttl in ttls
+        if ttl is not None and ttl > 0 and ttl - margin > 0
+    ]
+
+
+def sleep_ms(milliseconds: float) -> None:
+    """
+    Convenience wrapper around :func:`time.sleep` that accepts input in miliseconds
+    """
+    time.sleep(milliseconds / 1000)
+
+
+def _remaining_ms(start_time: float, timeout: Optional[float]) -> Optional[float]:
+    """
+    Return the time in milliseconds left of a `timeout` in milliseconds that started
+    at `start_time` (acquired with :func:`monotonic`), `None` if there is no timeout
+    """
+    if timeout is None:
+        return None
+    return timeout - _monotonic_delta_ms(monotonic(), start_time)
+
+
+def _retry_delay_ms(
+    retry_delay: int, start_time: float, timeout: Optional[float]
+) -> Optional[int]:
+    """
+    Pick a random delay of up to `retry_delay` milliseconds to wait before retrying
+
+    :param retry_delay: Maximum delay in milliseconds
+    :param start_time: Point in time the `timeout` started, acquired with
+        :func:`monotonic`
+    :param timeout: Time in milliseconds all attempts may take, `None` for no limit
+    :returns: The delay, or `None` if the timeout would be exceeded before the next
+        attempt could start
+    """
+    delay = random.randint(0, retry_delay)
+    remaining = _remaining_ms(start_time, timeout)
+    if remaining is not None and delay >= remaining:
+        return None
+    return delay
+
+
+def _round_budget(
+    budget: float, start_time: float, timeout: Optional[float]
+) -> Optional[float]:
+    """
+    Return the time in milliseconds a round of requests may take, which is `budget`
+    unless less is left of `timeout`
+
+    :param budget: Time in milliseconds a round may take at most
+    :param start_time: Point in time the `timeout` started, acquired with
+        :func:`monotonic`
+    :param timeout: Time in milliseconds all rounds may take, `None` for no limit
+    :returns: The budget, or `None` if the timeout is exceeded
+    """
+    remaining = _remaining_ms(start_time, timeout)
+    if remaining is None:
+        return budget
+    if remaining <= 0:
+        return None
+    return min(budget, remaining)
+
+
+def _new_lock_key() -> str:
+    """
+    Return a new random token identifying a single lock acquisition. Equivalent in
+    entropy to ``uuid.uuid4().hex`` but without constructing an intermediate
+    :class:`uuid.UUID` object
+    """
+    return os.urandom(16).hex()
+
+
+_HOSTNAME: str = socket.gethostname()
+
+
+def _pack_holder_info() -> str:
+    """
+    Return holder metadata of the current process to be appended to a lock key, so it
+    can be unpacked again with :meth:`HolderInfo.from_lock_key`
+    """
+    return f":{os.getpid()}:{int(time.time() * 1000)}:{_HOSTNAME}"
+
+
+def _map_concurrently(func: Callable, nodes: List[redis.StrictRedis]) -> Iterator[Any]:
+    """
+    Apply a function to redis nodes asynchronously using
+    :meth:`concurrent.futures.ThreadPoolExecutor.map`
+
+    :param func: Callable that accepts a node as its first parameter
+    :param nodes: Redis nodes to map
+    :returns: Result iterator for the created futures
+    """
+    if len(nodes) == 1:
+        # nothing to overlap, so skip the cost of starting a thread
+        return iter([func(nodes[0])])
+    with ThreadPoolExecutor() as executor:
+        return executor.map(func, nodes)
+
+
+def _map_hedged(
+    func: Callable, nodes: List[redis.StrictRedis], quorum: int
+) -> List[Any]:
+    """
+    Apply a function to redis nodes concurrently like :func:`_map_concurrently`, but
+    stop waiting for the nodes that are slower than their usual p95 latency, as
+    estimated by the :class:`NodeLatency` of each node, once at least `quorum` nodes
+    returned a truthy result. The calls to such nodes are left running in the
+    background.
+
+    :param func: Callable that accepts a node as its first parameter
+    :param nodes: Redis nodes to map, initialised with :func:`init_redis_nodes`
+    :param quorum: Number of truthy results after which slow nodes are not waited for
+    :returns: The results in the order of `nodes`, `None` for nodes not waited for
+    """
+    # pylint: disable=too-many-locals
+    if len(nodes) == 1:
+        return [func(nodes[0])]
+
+    def timed(node: redis.StrictRedis) -> Any:
+        start_time = _monotonic_ms()
+        result = func(node)
+        node.redlock_latency.record(_monotonic_ms() - start_time)  # type: ignore
+        return result
+
+    results: List[Any] = [None] * len(nodes)
+    executor = ThreadPoolExecutor(max_workers=len(nodes))
+    start_time = _monotonic_ms()
+    indices = {executor.submit(timed, node): index for index, node in enumerate(nodes)}
+    # points in time after which each node is considered slow
+    slow_after = {
+        future: start_time + nodes[index].redlock_latency.p95  # type: ignore
+        for future, index in indices.items()
+    }
+    pending = set(indices)
+    successes = 0
+    try:
+        while pending:
+            timeout = None
+            slowest = max(slow_after[future] for future in pending)
+            # nodes without any recorded latency are always waited for
+            if successes >= quorum and slowest != math.inf:
+                timeout = slowest - _monotonic_ms()
+                if timeout <= 0:
+                    break
+                timeout /= 1000
+            done, pending = wait_futures(
+                pending, timeout=timeout, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                result = results[indices[future]] = future.result()
+                successes += bool(result)
+    finally:
+        executor.shutdown(wait=False)
+    return results
+
+
+# objects holding state that does not survive a fork, see _after_fork_in_child
+_FORK_SAFE: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    """
+    Reset the state of all locks, factories and monitors in a freshly forked child
+    process, by calling their ``_after_fork`` method
+    """
+    for obj in list(_FORK_SAFE):
+        obj._after_fork()  # pylint: disable=protected-access
+
+
+def _reset_connection_pools(nodes: List[redis.StrictRedis]) -> None:
+    """
+    Drop all connections inherited from the parent process from the connection pools
+    of `nodes`. redis-py does this lazily on the next command, but can deadlock if the
+    fork happened while another thread held the internal lock of the pool
+    """
+    for node in nodes:
+        pool = node.connection_pool
+        if hasattr(pool, "_fork_lock"):
+            pool._fork_lock = threading.Lock()  # pylint: disable=protected-access
+        pool.reset()
+
+
+def _nodes_encoding(nodes: List[redis.StrictRedis]) -> Optional[Tuple[str, str]]:
+    """
+    :returns: The encoding and error handling redis-py uses to encode strings for all
+        of the nodes, or `None` if they differ or cannot be determined
+    """
+    encodings = set()
+    for node in nodes:
+        try:
+            kwargs = node.connection_pool.connection_kwargs
+        except AttributeError:
+            return None
+        encodings.add(
+            (kwargs.get("encoding", "utf-8"), kwargs.get("encoding_errors", "strict"))
+        )
+    if len(encodings) != 1:
+        return None
+    encoding = encodings.pop()
+    return encoding if all(isinstance(value, str) for value in encoding) else None
+
+
+def _node_to_pool_details(node: redis.StrictRedis) -> Tuple[Type, Dict[str, Any]]:
+    """
+    Return the connection class and parameters of a node, from which an equivalent
+    node can be created with :func:`_node_from_pool_details`
+    """
+    pool = node.connection_pool
+    return pool.connection_class, dict(pool.connection_kwargs)
+
+
+def _node_from_pool_details(details: Tuple[Type, Dict[str, Any]]) -> redis.StrictRedis:
+    """
+    Create a node from the return value of :func:`_node_to_pool_details`
+    """
+    connection_class, connection_kwargs = details
+    return redis.StrictRedis(
+        connection_pool=redis.ConnectionPool(
+            connection_class=connection_class, **connection_kwargs
+        )
+    )
+
+
+#: Fraction of the ttl of a lock to account for as clock drift between the nodes when
+#: computing its validity
+CLOCK_DRIFT_FACTOR: float = 0.01
+
+#: Fraction of the ttl of a lock after which a request to a single node times out
+NODE_TIMEOUT_FACTOR: float = 0.005
+
+
+def _clock_drift(ttl: float) -> float:
+    """
+    Return the clock drift in milliseconds to account for when computing the validity
+    of a lock with the given ttl, using :data:`CLOCK_DRIFT_FACTOR`.
+    Add 2 milliseconds to the drift to account for Redis expires precision, which is 1
+    millisecond, plus 1 millisecond min drift for small TTLs.
+    """
+    return (ttl * CLOCK_DRIFT_FACTOR) + 2
+
+
+_DEFAULT_TTL: int = 120_000
+
+
+def _node_timeout(ttl: float) -> float:
+    """
+    Return the timeout in seconds for requests to the redis nodes of a lock
+    with the given ttl in milliseconds, using :data:`NODE_TIMEOUT_FACTOR`. As
+    recommended by the Redlock algorithm, this is small compared to the ttl, so an
+    unreachable node cannot eat up the validity of the lock, but at least 10
+    milliseconds.
+    """
+    return max(ttl * NODE_TIMEOUT_FACTOR, 10) / 1000
+
+
+if hasattr(os, "register_at_fork"):  # Python >= 3.7 on POSIX
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,709 @@
+"""
+Distributed locks for `anyio <https://anyio.readthedocs.io>`_, running on asyncio
+as well as on trio. Requires `anyio`, install it with
+``pip install redlock-plus[async]``.
+"""
+
+import time
+import random
+import urllib.parse
+from typing import Union, Optional, Tuple, List, Any, Dict, Sequence, Callable, cast
+
+import redis
+
+try:
+    import anyio
+    import anyio.streams.buffered
+except ImportError as exc:  # pragma: no cover
+    raise ImportError(
+        "redlock_plus.asyncio requires anyio, install it with "
+        "'pip install redlock-plus[async]'"
+    ) from exc
+
+from redlock_plus._base import _TtlBase
+from redlock_plus._util import (
+    _DEFAULT_TTL,
+    _deadline,
+    _monotonic_delta_ms,
+    _new_lock_key,
+    _node_timeout,
+    _remaining_ms,
+    _remaining_ttls,
+    _retry_delay_ms,
+    _round_budget,
+    _validity,
+    monotonic,
+)
+from redlock_plus.autoextend import RenewalPolicy
+from redlock_plus.exceptions import (
+    InsufficientNodesError,
+    InvalidOperationError,
+    LockExpiredError,
+)
+from redlock_plus.results import AcquireResult, _contention
+from redlock_plus.scripts import (
+    ACQUIRE_LUA_SCRIPT,
+    BUMP_LUA_SCRIPT,
+    GET_TTL_LUA_SCRIPT,
+    RELEASE_LUA_SCRIPT,
+    _script_sha,
+)
+
+
+def _pack_command(args: Sequence[Any], encoding: str) -> bytes:
+    """
+    Encode a command as RESP array of bulk strings
+    """
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode(encoding)
+        elif not isinstance(arg, bytes):
+            arg = repr(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+_RESPONSE_ERROR_PARSER = redis.connection.BaseParser()
+
+
+class _AsyncConnection:
+    """
+    A single connection of an :class:`AsyncRedisNode`
+    """
+
+    def __init__(self, stream: Any, encoding: str, decode_responses: bool) -> None:
+        self._stream = stream
+        self._buffered = anyio.streams.buffered.BufferedByteReceiveStream(stream)
+        self._encoding = encoding
+        self._decode_responses = decode_responses
+
+    async def aclose(self) -> None:
+        """
+        Close the connection
+        """
+        await self._stream.aclose()
+
+    async def request(self, *args: Any) -> Any:
+        """
+        Send a command and read its reply
+
+        :raises redis.exceptions.ConnectionError: If the connection broke
+        :raises redis.exceptions.ResponseError: If redis replied with an error
+        """
+        try:
+            await self._stream.send(_pack_command(args, self._encoding))
+            reply = await self._read_reply()
+        except (
+            OSError,
+            anyio.EndOfStream,
+            anyio.IncompleteRead,
+            anyio.BrokenResourceError,
+            anyio.ClosedResourceError,
+            anyio.DelimiterNotFound,
+        ) as error:
+            raise redis.exceptions.ConnectionError(
+                f"Error while talking to redis: {error!r}"
+            ) from error
+        if isinstance(reply, redis.exceptions.ResponseError):
+            raise reply
+        return reply
+
+    async def _read_reply(self) -> Any:
+        # pylint: disable=too-many-return-statements
+        line = await self._buffered.receive_until(b"\r\n", 65536)
+        kind, rest = line[:1], line[1:]
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = await self._buffered.receive_exactly(length + 2)
+            return self._decode(data[:-2])
+        if kind == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        if kind == b"+":
+            return self._decode(rest)
+        if kind == b"-":
+            return _RESPONSE_ERROR_PARSER.parse_error(  # type: ignore
+                rest.decode(self._encoding)
+            )
+        raise redis.exceptions.InvalidResponse(f"Protocol error: {line!r}")
+
+    def _decode(self, data: bytes) -> Union[str, bytes]:
+        return data.decode(self._encoding) if self._decode_responses else data
+
+
+# parameters of AsyncRedisNode that can be given in a URL
+_ASYNC_NODE_URL_OPTIONS: Tuple[str, ...] = (
+    "host",
+    "port",
+    "db",
+    "username",
+    "password",
+    "socket_timeout",
+    "encoding",
+    "decode_responses",
+)
+
+
+class AsyncRedisNode:
+    """
+    A minimal asynchronous redis client for :class:`AsyncLock`, built on `anyio
+    <https://anyio.readthedocs.io>`_ streams, so it runs on asyncio as well as on
+    trio. It only implements what the lock needs: sending commands and reading their
+    replies over a pool of connections. Any other client with an awaitable
+    ``execute_command`` method, such as ``redis.asyncio.Redis``, can be used instead.
+
+    :param host: Hostname of the redis server
+    :param port: Port of the redis server
+    :param db: Database to select after connecting
+    :param username: Username to authenticate with
+    :param password: Password to authenticate with
+    :param socket_timeout: Time in seconds after which connecting or a request times
+        out, raising :class:`redis.exceptions.TimeoutError`
+    :param encoding: Encoding of strings sent to and received from redis
+    :param decode_responses: If `True`, decode strings received from redis with
+        `encoding`, else return them as bytes, like redis-py does
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        socket_timeout: Optional[float] = None,
+        encoding: str = "utf-8",
+        decode_responses: bool = False,
+    ):
+        # pylint: disable=too-many-arguments
+        self.host = host
+        self.port = port
+        self.db = db
+        self.username = username
+        self.password = password
+        self.socket_timeout = socket_timeout
+        self.encoding = encoding
+        self.decode_responses = decode_responses
+        self._idle: List[_AsyncConnection] = []
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "AsyncRedisNode":
+        """
+        Create a node from a ``redis://`` URL. Keyword arguments are passed on to the
+        node, overridden by the parameters given in the URL. Parameters the node does
+        not support are ignored.
+
+        :raises ValueError: If the URL has another scheme, since TLS and unix socket
+            connections are not supported
+        """
+        scheme = urllib.parse.urlparse(url).scheme
+        if scheme != "redis":
+            raise ValueError(
+                f"AsyncRedisNode only supports redis:// URLs, not {scheme}://"
+            )
+        options = {
+            name: value
+            for name, value in redis.ConnectionPool.from_url(
+                url
+            ).connection_kwargs.items()
+            if name in _ASYNC_NODE_URL_OPTIONS and value is not None
+        }
+        if "decode_responses" in options:
+            options["decode_responses"] = redis.connection.to_bool(
+                options["decode_responses"]
+            )
+        return cls(**{**kwargs, **options})
+
+    async def _connect(self) -> _AsyncConnection:
+        try:
+            stream = await anyio.connect_tcp(self.host, self.port)
+        except OSError as error:
+            raise redis.exceptions.ConnectionError(
+                f"Error connecting to {self.host}:{self.port}: {error!r}"
+            ) from error
+        connection = _AsyncConnection(stream, self.encoding, self.decode_responses)
+        try:
+            if self.password is not None:
+                credentials = [self.username] if self.username else []
+                await connection.request("AUTH", *credentials, self.password)
+            if self.db:
+                await connection.request("SELECT", self.db)
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await connection.aclose()
+            raise
+        return connection
+
+    async def execute_command(self, *args: Any) -> Any:
+        """
+        Send a command to redis and return its reply
+
+        :raises redis.exceptions.ConnectionError: If redis cannot be reached
+        :raises redis.exceptions.TimeoutError: If the request timed out
+        :raises redis.exceptions.ResponseError: If redis replied with an error
+        """
+        connection = self._idle.pop() if self._idle else None
+        try:
+            with anyio.fail_after(self.socket_timeout):
+                if connection is None:
+                    connection = await self._connect()
+                reply = await connection.request(*args)
+        except redis.exceptions.ResponseError:
+            # the reply was read completely, so the connection can be reused
+            self._idle.append(cast(_AsyncConnection, connection))
+            raise
+        except BaseException as error:
+            if connection is not None:
+                with anyio.CancelScope(shield=True):
+                    await connection.aclose()
+            if isinstance(error, TimeoutError):
+                raise redis.exceptions.TimeoutError(
+                    f"Request to {self.host}:{self.port} timed out"
+                ) from error
+            raise
+        self._idle.append(connection)
+        return reply
+
+    async def aclose(self) -> None:
+        """
+        Close all idle connections
+        """
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await connection.aclose()
+
+
+async def _call_script(node: Any, source: str, keys: List[Any], args: List[Any]) -> Any:
+    """
+    Call a lua script on an asynchronous node by its hash, loading it with `EVAL` if
+    the node does not know it yet
+    """
+    try:
+        return await node.execute_command(
+            "EVALSHA", _script_sha(source), len(keys), *keys, *args
+        )
+    except redis.exceptions.NoScriptError:
+        return await node.execute_command("EVAL", source, len(keys), *keys, *args)
+
+
+async def _map_async(
+    func: Callable[[Any], Any], nodes: List[Any], timeout: Optional[float] = None
+) -> List[Any]:
+    """
+    Apply an async function to nodes concurrently, each in a task of its own task
+    group.
+
+    :param func: Async callable that accepts a node as its first parameter
+    :param nodes: Nodes to map
+    :param timeout: Time in seconds after which nodes that did not reply yet are
+        cancelled
+    :returns: The results in the order of `nodes`, `None` for cancelled nodes
+    """
+    results: List[Any] = [None] * len(nodes)
+
+    async def run(index: int, node: Any) -> None:
+        results[index] = await func(node)
+
+    with anyio.move_on_after(timeout):
+        async with anyio.create_task_group() as task_group:
+            for index, node in enumerate(nodes):
+                task_group.start_soon(run, index, node)
+    return results
+
+
+class AsyncLock(_TtlBase):
+    """
+    A distributed lock for `anyio <https://anyio.readthedocs.io>`_, and therefore
+    asyncio as well as trio, following the same Redlock algorithm as
+    :class:`~redlock_plus.Lock`. Requests to the nodes are sent concurrently from a task
+    group, and the nodes that did not reply before the lock would have become useless
+    are cancelled and count as failed.
+
+    The lock is extended in the background while used as an async context manager. The
+    renewal task runs in a task group wrapping the body, which is cancelled if the lock
+    is lost, raising :class:`~redlock_plus.LockExpiredError` when the body is left::
+
+        async with lock as validity:
+            # do some work
+
+    Requires `anyio` to be installed.
+
+    :param resource_name: Global identifier to be used for the lock
+    :param connection_details: A list of dicts with the parameters of
+        :class:`AsyncRedisNode`, or a ``url``. Unless a dict sets ``socket_timeout``,
+        requests time out after a fraction of `ttl` given by
+        :data:`~redlock_plus.NODE_TIMEOUT_FACTOR`. Requests of the lock never take
+        longer than that, whatever the timeout of the node. If `None`, `nodes` must not
+        be `None`
+    :param nodes: A list of asynchronous redis clients. Takes precedence over
+        `connection_details`
+    :param retry_times: Amount of times to retry acquiring a lock after a failed attempt
+    :param retry_delay: Time in milliseconds between retry attempts to acquire a lock
+    :param ttl: Time in milliseconds until the lock should expire
+    :param renewal_policy: The :class:`~redlock_plus.RenewalPolicy` scheduling renewals
+        of the lock while used as a context manager. Defaults to a new
+        :class:`~redlock_plus.RenewalPolicy` per lock
+
+    .. attribute:: deadline
+
+        Point in time of :func:`time.monotonic` in seconds after which the lock can
+        not be considered held anymore, or `None` if it is not held
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    #: Minimum number of redis nodes a lock of this class can be created with
+    min_nodes: int = 3
+
+    def __init__(
+        self,
+        resource_name: str,
+        connection_details: Optional[List[Dict[str, Any]]] = None,
+        nodes: Optional[List[Any]] = None,
+        retry_times: int = 3,
+        retry_delay: int = 200,
+        ttl: int = _DEFAULT_TTL,
+        renewal_policy: Optional[RenewalPolicy] = None,
+    ):
+        # pylint: disable=too-many-arguments
+        if nodes is None:
+            if connection_details is None:
+                raise ValueError(
+                    "Either 'connection_details' or 'nodes' must be specified"
+                )
+            nodes = _init_async_nodes(connection_details, _node_timeout(ttl))
+        if len(nodes) < self.min_nodes:
+            raise InsufficientNodesError(len(nodes), min_nodes=self.min_nodes)
+        self.resource_name = resource_name
+        self.redis_nodes = nodes
+        self.quorum: int = max(self.min_nodes, len(nodes) // 2 + 1)
+        self.retry_times = retry_times
+        self.retry_delay = retry_delay
+        self.ttl = ttl  # also sets AsyncLock._drift
+        self.renewal_policy = renewal_policy or RenewalPolicy()
+        self.lock_key: Optional[str] = None
+        self.deadline: Optional[float] = None
+        self._contended: List[Tuple[int, Union[str, bytes]]] = []
+        self._task_group: Any = None
+        self._lost = False
+
+    async def __aenter__(self) -> AcquireResult:
+        validity = await self.acquire()
+        self._lost = False
+        self._task_group = anyio.create_task_group()
+        await self._task_group.__aenter__()
+        self._task_group.start_soon(self._autoextend, validity)
+        return validity
+
+    async def __aexit__(self, *exc_info: Any) -> Optional[bool]:
+        task_group, self._task_group = self._task_group, None
+        task_group.cancel_scope.cancel()
+        try:
+            suppress = await task_group.__aexit__(*exc_info)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.release()
+        if self._lost:
+            raise LockExpiredError(
+                f"Lock for {self.resource_name!r} expired before the context was left"
+            )
+        return cast(Optional[bool], suppress)
+
+    def _require_key(self) -> None:
+        if self.lock_key is None:
+            raise InvalidOperationError("Lock was not acquired")
+
+    async def _call_script(self, node: Any, source: str, args: List[Any]) -> Any:
+        """
+        Call a lua script on a node for the resource of the lock. The request times
+        out after the socket timeout derived from the ttl of the lock, even if the
+        node allows more, e.g. because it is shared with locks of a greater ttl
+
+        :raises redis.exceptions.TimeoutError: If the request timed out
+        """
+        try:
+            with anyio.fail_after(self._request_timeout):
+                result = await _call_script(node, source, [self.resource_name], args)
+        except TimeoutError as error:
+            raise redis.exceptions.TimeoutError(
+                f"Request for {self.resource_name!r} timed out"
+            ) from error
+        return result
+
+    async def _acquire_node(self, node: Any) -> bool:
+        try:
+            result = await self._call_script(
+                node, ACQUIRE_LUA_SCRIPT, [self.lock_key, self.ttl]
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return False
+        if not isinstance(result, list):
+            return bool(result)
+        self._contended.append((result[0], result[1]))
+        return False
+
+    async def _release_node(self, node: Any) -> bool:
+        try:
+            return bool(
+                await self._call_script(node, RELEASE_LUA_SCRIPT, [self.lock_key])
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return False
+
+    async def _bump_node(self, node: Any) -> bool:
+        try:
+            return bool(
+                await self._call_script(
+                    node, BUMP_LUA_SCRIPT, [self.lock_key, self.ttl]
+                )
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return False
+
+    async def _get_ttl_from_node(self, node: Any) -> Optional[int]:
+        try:
+            return cast(
+                Optional[int],
+                await self._call_script(node, GET_TTL_LUA_SCRIPT, [self.lock_key]),
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return None
+
+    async def _release_all(self) -> List[Any]:
+        # release even if the calling task is being cancelled
+        with anyio.CancelScope(shield=True):
+            results = await _map_async(
+                self._release_node, self.redis_nodes, self.ttl / 1000
+            )
+        return results
+
+    async def _acquire(
+        self, retry_times: Optional[int] = None, timeout: Optional[float] = None
+    ) -> AcquireResult:
+        """
+        Acquire the lock like :meth:`~redlock_plus.Lock._acquire`, requesting all nodes
+        concurrently
+
+        :param retry_times: Amount of times to retry after a failed attempt to acquire.
+            Defaults to :attr:`AsyncLock.retry_times`
+        :param timeout: Time in milliseconds all attempts together may take at most
+        """
+        if retry_times is None:
+            retry_times = self.retry_times
+        drift = self._drift
+        self._contended = []
+        call_start_time = monotonic()
+        for attempt in range(retry_times + 1):
+            delay = (
+                _retry_delay_ms(self.retry_delay, call_start_time, timeout)
+                if attempt
+                else 0
+            )
+            if delay is None:
+                break
+            if delay:
+                await anyio.sleep(delay / 1000)
+            budget = _round_budget(self.ttl - drift, call_start_time, timeout)
+            if budget is None:
+                break
+            previous_lock_key = self.lock_key
+            self.lock_key = _new_lock_key()
+            self._contended = []
+            start_time = monotonic()
+            results = await _map_async(
+                self._acquire_node, self.redis_nodes, budget / 1000
+            )
+            end_time = monotonic()
+            validity = _validity(self.ttl, drift, start_time, end_time)
+            if sum(1 for result in results if result) >= self.quorum and validity > 0:
+                self.deadline = _deadline(end_time, validity)
+                return validity
+            await self._release_all()
+            self.lock_key = previous_lock_key
+        return _contention(self._contended, len(self.redis_nodes), self.quorum)
+
+    async def acquire(
+        self, blocking: bool = True, timeout: float = -1
+    ) -> AcquireResult:
+        """
+        Attempt to acquire the lock, blocking or non-blocking. Unlike
+        :meth:`~redlock_plus.Lock.acquire`, this does not extend the lock automatically,
+        use the lock as an async context manager for that.
+
+        :param blocking: If `True`, block until the lock can be acquired
+        :param timeout: If `blocking` is `True` and `timeout` is a positive value,
+            in the case a request would block, block at most `timeout` seconds
+        :returns: See :meth:`~redlock_plus.Lock.acquire`
+        :raises ValueError: If `blocking` is `False` and `timeout` is a positive value
+        """
+        if not blocking:
+            if timeout != -1:
+                raise ValueError("Timout must be -1 when requiring non-blocking")
+            return await self._acquire()
+        timeout_ms = timeout * 1000 if timeout > 0 else None
+        time_start = monotonic()
+        while True:
+            validity = await self._acquire(
+                retry_times=0, timeout=_remaining_ms(time_start, timeout_ms)
+            )
+            delay = _retry_delay_ms(self.retry_delay, time_start, timeout_ms)
+            if validity or delay is None:
+                return validity
+            await anyio.sleep(delay / 1000)
+
+    async def extend(
+        self, retry_times: Optional[int] = None, retry_delay: Optional[int] = None
+    ) -> Union[bool, float]:
+        """
+        Extend the acquired lock, see :meth:`~redlock_plus.Lock.extend`
+
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        self._require_key()
+        if retry_times is None:
+            retry_times = self.retry_times
+        if retry_delay is None:
+            retry_delay = self.retry_delay
+        for _ in range(retry_times + 1):
+            start_time = monotonic()
+            results = await _map_async(
+                self._bump_node, self.redis_nodes, self.ttl / 1000
+            )
+            end_time = monotonic()
+            validity = _validity(self.ttl, self._drift, start_time, end_time)
+            if sum(1 for result in results if result) >= self.quorum and validity > 0:
+                self.deadline = _deadline(end_time, validity)
+                return validity
+            await anyio.sleep(random.randint(0, retry_delay) / 1000)
+        return False
+
+    async def release(self) -> bool:
+        """
+        Release the lock, see :meth:`~redlock_plus.Lock.release`
+
+        :returns: Whether or not the lock was successfully released
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        self._require_key()
+        self.deadline = None
+        return sum(1 for result in await self._release_all() if result) >= self.quorum
+
+    async def locked(self) -> bool:
+        """
+        Check if the lock is still held on a quorum of nodes, see
+        :meth:`~redlock_plus.Lock.locked`
+        """
+        if self.lock_key is None:
+            return False
+        start_time = monotonic()
+        ttls = await _map_async(
+            self._get_ttl_from_node, self.redis_nodes, self.ttl / 1000
+        )
+        valid = _remaining_ttls(ttls, self._drift, start_time, monotonic())
+        return len(valid) >= self.quorum
+
+    async def _autoextend(self, validity: float) -> None:
+        """
+        Extend the lock as scheduled by :attr:`AsyncLock.renewal_policy` until
+        cancelled. If the lock expires, cancel the task group
+        """
+        policy = self.renewal_policy
+        while True:
+            await anyio.sleep(policy.renewal_delay(validity) / 1000)
+            while True:
+                start_time = monotonic()
+                validity = await self.extend(retry_times=0, retry_delay=0)
+                policy.record(_monotonic_delta_ms(monotonic(), start_time))
+                if validity:
+                    break
+                deadline = self.deadline
+                delay = policy.retry_delay(
+                    (deadline - time.monotonic()) * 1000 if deadline is not None else 0
+                )
+                if delay is None:
+                    self._lost = True
+                    self._task_group.cancel_scope.cancel()
+                    return
+                await anyio.sleep(delay / 1000)
+
+
+def _init_async_nodes(
+    connection_details: List[Dict[str, Any]], socket_timeout: Optional[float]
+) -> List[AsyncRedisNode]:
+    """
+    Create :class:`AsyncRedisNode` instances from connection details, see
+    :func:`~redlock_plus.init_redis_nodes`
+    """
+    nodes = []
+    for conn in connection_details:
+        conn = {"socket_timeout": socket_timeout, **conn}
+        if "url" in conn:
+            nodes.append(AsyncRedisNode.from_url(conn.pop("url"), **conn))
+        else:
+            nodes.append(AsyncRedisNode(**conn))
+    return nodes
+
+
+class AsyncLockFactory:
+    """
+    Create new :class:`AsyncLock` instances sharing the same nodes. Use as an async
+    context manager or call :meth:`AsyncLockFactory.aclose` to close the connections
+    to the nodes created from connection details.
+
+    :param connection_details: See :class:`AsyncLock`
+    :param nodes: See :class:`AsyncLock`
+    :param kwargs: Default values for keyword arguments to pass to each created
+        :class:`AsyncLock` instance
+    """
+
+    def __init__(
+        self,
+        connection_details: Optional[List[Dict[str, Any]]] = None,
+        nodes: Optional[List[Any]] = None,
+        **kwargs: Any,
+    ):
+        if nodes is None:
+            if connection_details is None:
+                raise ValueError(
+                    "Either 'connection_details' or 'nodes' must be specified"
+                )
+            nodes = _init_async_nodes(
+                connection_details, _node_timeout(kwargs.get("ttl", _DEFAULT_TTL))
+            )
+        if len(nodes) < AsyncLock.min_nodes:
+            raise InsufficientNodesError(len(nodes))
+        self.redis_nodes = nodes
+        self.lock_kwargs = kwargs
+
+    def __call__(self, resource_name: str, **kwargs: Any) -> AsyncLock:
+        """
+        Create a new :class:`AsyncLock`. Takes the same arguments as
+        :class:`AsyncLock`
+        """
+        return AsyncLock(
+            resource_name, nodes=self.redis_nodes, **{**self.lock_kwargs, **kwargs}
+        )
+
+    async def __aenter__(self) -> "AsyncLockFactory":
+        return self
+
+    async def __aexit__(self, *a: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Close the idle connections of the nodes that are :class:`AsyncRedisNode`
+        instances
+        """
+        for node in self.redis_nodes:
+            if isinstance(node, AsyncRedisNode):
+                await node.aclose()
@@ -0,0 +1,178 @@
+"""
+Renewing held locks in the background.
+"""
+
+import math
+import time
+import random
+import threading
+import collections
+from typing import TYPE_CHECKING, Optional, Deque
+
+from redlock_plus._util import _monotonic_delta_ms, monotonic
+
+if TYPE_CHECKING:
+    from redlock_plus.lock import Lock
+
+
+class _AutoextendThread(threading.Thread):
+    def __init__(
+        self, lock: "Lock", timeout: Optional[float] = None,
+    ):
+        """
+        Renew `lock` as scheduled by its :attr:`Lock.renewal_policy` until released
+
+        :param lock: Lock instance
+        :param timeout: Maximum time after which the lock will not be renewed again in
+            seconds
+        """
+        self.lock = lock
+        self.timeout_ms = timeout * 1000 if timeout else None
+        self.released: threading.Event = threading.Event()
+        super().__init__(daemon=True)
+
+    def run(self) -> None:
+        time_start = monotonic()
+        if self.lock.deadline is not None:
+            expected_ttl = (self.lock.deadline - time.monotonic()) * 1000
+        else:
+            expected_ttl = min(self.lock.check_times()[1] or [0])
+        while not self.released.is_set():
+            ms_to_wait = self.lock.renewal_policy.renewal_delay(expected_ttl)
+            if (
+                not expected_ttl >= 2  # sleep for at least 2ms to account for overhead
+                or (
+                    self.timeout_ms is not None
+                    and _monotonic_delta_ms(monotonic(), time_start) + ms_to_wait
+                    > self.timeout_ms
+                )
+            ):
+                break
+            if self.released.wait(ms_to_wait / 1000):
+                break
+            expected_ttl = self.renew()
+            if not expected_ttl and not self.released.is_set():
+                if self.lock.on_lost is not None:
+                    self.lock.on_lost(self.lock)
+                break
+
+    def renew(self) -> float:
+        """
+        Extend the lock, see :func:`_renew`
+
+        :returns: The validity of the lock in milliseconds, `0` if it expired or the
+            thread was stopped
+        """
+        return _renew(self.lock, self.released)
+
+
+def _renew(lock: "Lock", stopped: threading.Event) -> float:
+    """
+    Extend a lock in single rounds, retrying as scheduled by the :class:`RenewalPolicy`
+    of the lock until it succeeds or the lock expires.
+
+    :param lock: The lock to extend
+    :param stopped: Event interrupting the retries once set
+    :returns: The validity of the lock in milliseconds, `0` if it expired or `stopped`
+        was set
+    """
+    policy = lock.renewal_policy
+    while True:
+        start_time = monotonic()
+        validity = lock.extend(retry_times=0, retry_delay=0)
+        policy.record(_monotonic_delta_ms(monotonic(), start_time))
+        if validity:
+            return validity
+        deadline = lock.deadline
+        delay = policy.retry_delay(
+            (deadline - time.monotonic()) * 1000 if deadline is not None else 0
+        )
+        if delay is None or stopped.wait(delay / 1000):
+            return 0
+
+
+class RenewalPolicy:
+    """
+    Decide when the autoextend thread of a lock renews it and how it retries failed
+    renewals.
+
+    Instead of renewing at a fixed fraction of the validity, which makes locks with
+    the same ttl that were acquired in a burst renew in synchronised spikes, renewals
+    are spread randomly over the `jitter` fraction of the validity before `renew_at`.
+    The renewal is also scheduled early enough to leave `rtt_safety` times the 99th
+    percentile of the measured round trip times of renewals before the lock expires.
+
+    A failed renewal is retried with a random delay of at most `max_retry_delay`
+    milliseconds. The delay shrinks as the lock gets closer to expiring, and once less
+    than the reserved round trip time is left, it retries immediately.
+
+    A policy can be shared between locks, e.g. by passing it to a
+    :class:`LockFactory`, which pools their round trip times::
+
+        factory = LockFactory(nodes, renewal_policy=RenewalPolicy())
+
+    :param renew_at: Fraction of the validity after which the lock is renewed at the
+        latest
+    :param jitter: Fraction of the validity over which renewals are spread
+    :param rtt_safety: Multiple of the 99th percentile of round trip times to reserve
+        before the lock expires
+    :param max_retry_delay: Maximum time in milliseconds between retries of a failed
+        renewal
+    :param window: Number of round trip times to keep for computing the percentile
+    """
+
+    def __init__(
+        self,
+        renew_at: float = 0.75,
+        jitter: float = 0.1,
+        rtt_safety: float = 3.0,
+        max_retry_delay: float = 200,
+        window: int = 100,
+    ):
+        # pylint: disable=too-many-arguments
+        self.renew_at = renew_at
+        self.jitter = jitter
+        self.rtt_safety = rtt_safety
+        self.max_retry_delay = max_retry_delay
+        self._round_trip_times: Deque[float] = collections.deque(maxlen=window)
+
+    def record(self, round_trip_time: float) -> None:
+        """
+        Record the duration of a renewal.
+
+        :param round_trip_time: Duration of the renewal in milliseconds
+        """
+        self._round_trip_times.append(round_trip_time)
+
+    @property
+    def rtt_p99(self) -> float:
+        """
+        99th percentile of the recorded round trip times in milliseconds, `0` if none
+        were recorded yet
+        """
+        round_trip_times = sorted(self._round_trip_times)
+        if not round_trip_times:
+            return 0.0
+        return round_trip_times[math.ceil(len(round_trip_times) * 0.99) - 1]
+
+    def renewal_delay(self, validity: float) -> float:
+        """
+        :param validity: Time in milliseconds the lock can be considered held
+        :returns: Time in milliseconds to wait before renewing the lock
+        """
+        reserve = self.rtt_safety * self.rtt_p99
+        latest = min(validity * self.renew_at, validity - reserve)
+        return max(latest - random.uniform(0, validity * self.jitter), 0.0)
+
+    def retry_delay(self, remaining: float) -> Optional[float]:
+        """
+        :param remaining: Time in milliseconds the lock can still be considered held
+        :returns: Time in milliseconds to wait before retrying a failed renewal, or
+            `None` if the lock expired
+        """
+        if remaining <= 0:
+            return None
+        reserve = self.rtt_safety * self.rtt_p99
+        if remaining <= reserve:
+            return 0.0
+        return random.uniform(0, min(self.max_retry_delay, (remaining - reserve) / 2))
@@ -0,0 +1,120 @@
+"""
+Measuring the clock drift of the redis nodes.
+"""
+
+import threading
+from typing import Optional, Tuple, List, Any, Dict
+
+import redis
+
+from redlock_plus._util import _FORK_SAFE, _clock_drift
+
+
+class ClockDriftMonitor:
+    """
+    Measure the clock rate of each redis node against the local monotonic clock, to
+    replace the fixed :data:`CLOCK_DRIFT_FACTOR` with a measured bound. This allows
+    locks with long ttls to be considered valid for longer.
+
+    Samples of the server time are taken from the scripts run when extending a lock
+    or checking its ttl, so no additional requests are made. Once every node has been
+    observed for at least `min_window` milliseconds, the drift factor becomes the
+    largest measured rate deviation of any node, including the uncertainty caused by
+    request round trip times, multiplied by `safety_factor`. Until then,
+    :data:`CLOCK_DRIFT_FACTOR` is used.
+
+    A monitor is meant to be shared between locks, e.g. by passing it to a
+    :class:`LockFactory`::
+
+        factory = LockFactory(nodes, clock_monitor=ClockDriftMonitor())
+
+    :param min_window: Minimum time in milliseconds a node has to be observed before
+        its measurement is used
+    :param safety_factor: Factor to multiply the measured drift with
+    :param min_drift_factor: Lower bound for the drift factor
+    """
+
+    def __init__(
+        self,
+        min_window: float = 60_000,
+        safety_factor: float = 2.0,
+        min_drift_factor: float = 0.001,
+    ):
+        self.min_window = min_window
+        self.safety_factor = safety_factor
+        self.min_drift_factor = min_drift_factor
+        # first sample of each node: local time, server time and round trip time in ms
+        self._first_samples: Dict[redis.StrictRedis, Tuple[float, float, float]] = {}
+        self._drift_factors: Dict[redis.StrictRedis, float] = {}
+        self._lock = threading.Lock()
+        _FORK_SAFE.add(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # samples are keyed by the nodes of this process, start over when unpickled
+        state = self.__dict__.copy()
+        state.update(_first_samples={}, _drift_factors={})
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state, _lock=threading.Lock())
+        _FORK_SAFE.add(self)
+
+    def record(
+        self,
+        node: redis.StrictRedis,
+        local_time: float,
+        server_time: float,
+        round_trip_time: float,
+    ) -> None:
+        """
+        Record a sample of the server time of a node.
+
+        :param node: The node the sample was taken from
+        :param local_time: Local monotonic time in milliseconds at the middle of the
+            request
+        :param server_time: Time in milliseconds reported by the node
+        :param round_trip_time: Duration of the request in milliseconds
+        """
+        with self._lock:
+            (
+                first_local,
+                first_server,
+                first_round_trip_time,
+            ) = self._first_samples.setdefault(
+                node, (local_time, server_time, round_trip_time)
+            )
+            window = local_time - first_local
+            if window <= 0 or window < self.min_window:
+                return
+            # the server time was taken at some point during the request, so each
+            # sample is uncertain by half its round trip time
+            uncertainty = (first_round_trip_time + round_trip_time) / 2 / window
+            rate = (server_time - first_server) / window
+            self._drift_factors[node] = abs(rate - 1) + uncertainty
+
+    def drift_factor(self, nodes: List[redis.StrictRedis]) -> Optional[float]:
+        """
+        :param nodes: The nodes to get the drift factor for
+        :returns: The measured drift factor for the given nodes or `None` if not all of
+            them have been observed long enough
+        """
+        try:
+            factor = max(self._drift_factors[node] for node in nodes)
+        except KeyError:
+            return None
+        return max(factor * self.safety_factor, self.min_drift_factor)
+
+    def drift(self, ttl: float, nodes: List[redis.StrictRedis]) -> float:
+        """
+        Return the clock drift in milliseconds to account for when computing the
+        validity of a lock held on the given nodes. Like :func:`_clock_drift`, but using
+        the measured drift factor if available.
+        """
+        factor = self.drift_factor(nodes)
+        if factor is None:
+            return _clock_drift(ttl)
+        return (ttl * factor) + 2
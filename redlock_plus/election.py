@@ -0,0 +1,227 @@
+"""
+Leader election on top of a lock.
+"""
+
+import random
+import threading
+import functools
+from typing import Optional, Any, Callable, cast
+
+import redis
+
+from redlock_plus._util import _map_concurrently
+from redlock_plus.autoextend import _renew
+from redlock_plus.exceptions import InvalidOperationError
+from redlock_plus.lock import Lock
+from redlock_plus.results import LockContention
+
+
+class LeaderElection:
+    """
+    Elect a single leader among all candidates campaigning with a lock on the same
+    resource. Each candidate runs a single background thread, which campaigns for the
+    lock while another candidate leads and renews it while leading, retrying failed
+    renewals as scheduled by the :class:`RenewalPolicy` of the lock.
+
+    A candidate whose campaign fails retries as soon as the lease of the current
+    leader would run out, as reported by :attr:`LockContention.retry_after`, so a
+    crashed leader is replaced within the ttl of the lock. Shorter ttls mean faster
+    failover at the cost of more frequent renewals.
+
+    Every time a candidate is elected it starts a new term, a number that is greater
+    than any term before it. Pass it along with writes to other systems to fence off
+    a previous leader that does not know yet it was demoted::
+
+        election = factory.leader_election("scheduler", ttl=10_000)
+        with election:
+            while election.is_leader:
+                storage.write(data, fencing_token=election.term)
+
+    The election supports the context manager protocol, starting to campaign on entry
+    and resigning on exit.
+
+    :param lock: The lock to campaign with. It must not be acquired otherwise
+    :param on_elected: Callable to be called with the election from the background
+        thread when the candidate became leader
+    :param on_demoted: Callable to be called with the election from the background
+        thread when the candidate stopped being leader, because it lost the lock or
+        resigned
+    :param name: Global identifier to be used for the term counter. Defaults to the
+        resource name of the lock with a ``:term`` suffix
+    """
+
+    def __init__(
+        self,
+        lock: Lock,
+        on_elected: Optional[Callable[["LeaderElection"], Any]] = None,
+        on_demoted: Optional[Callable[["LeaderElection"], Any]] = None,
+        name: Optional[str] = None,
+    ):
+        self.lock = lock
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.name = name if name is not None else f"{lock.resource_name}:term"
+        #: The term of the current leadership, `None` if not leading
+        self.term: Optional[int] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "LeaderElection":
+        self.start()
+        return self
+
+    def __exit__(self, *a: Any) -> None:
+        self.stop()
+
+    @property
+    def is_leader(self) -> bool:
+        """
+        `True` while the candidate leads and its lease is valid. This is checked
+        locally, without a request to redis
+        """
+        return self.term is not None and self.lock.is_valid
+
+    def start(self) -> None:
+        """
+        Start campaigning in a background thread
+
+        :raises InvalidOperationError: If the candidate is already campaigning
+        """
+        if self._thread is not None:
+            raise InvalidOperationError("Election has already been started")
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop campaigning and resign if leading, releasing the lock so another candidate
+        can take over right away.
+        """
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopped.set()
+        if thread is not threading.current_thread():
+            thread.join()
+
+    def _read_term_node(self, node: redis.StrictRedis) -> Optional[int]:
+        """
+        Read the term counter of a single redis node
+
+        :param node: An initialised redis client instance
+        :returns: The last term started on the node, `0` if none was, or `None` if the
+            node could not be reached
+        """
+        # pylint: disable=protected-access
+        try:
+            return int(self.lock._client(node).execute_command("GET", self.name) or 0)
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return None
+
+    def _new_term_node(self, node: redis.StrictRedis, lock_key: str, term: int) -> int:
+        """
+        Raise the term counter on a single redis node to `term`, unless it is higher
+
+        :param node: An initialised redis client instance
+        :param lock_key: Token of the held lock
+        :param term: The term to start
+        :returns: The term counter of the node, or `0` if the lock is not held or the
+            node could not be reached
+        """
+        try:
+            return int(
+                node.redlock_term_script(  # type: ignore
+                    keys=[self.lock.resource_name, self.name],
+                    args=[lock_key, term],
+                    client=self.lock._client(node),  # pylint: disable=protected-access
+                )
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return 0
+
+    def _new_term(self) -> Optional[int]:
+        """
+        Start a new term in two phases: read the counters of a majority of nodes, then
+        raise the counters to one more than the highest of them while holding the lock.
+        The term is only started if a majority of nodes accepted it. As any two
+        majorities of nodes overlap, every term started later reads a counter at least
+        as high as this one and is greater.
+
+        :returns: The new term, or `None` if it could not be started on the majority of
+            nodes
+        """
+        lock_key = self.lock.lock_key
+        if lock_key is None:
+            return None
+        nodes = self.lock.redis_nodes
+        quorum = self.lock.quorum
+        counters = [
+            counter
+            for counter in _map_concurrently(self._read_term_node, nodes)
+            if counter is not None
+        ]
+        if len(counters) < quorum:
+            return None
+        term = max(counters) + 1
+        accepted = sum(
+            counter == term
+            for counter in _map_concurrently(
+                functools.partial(self._new_term_node, lock_key=lock_key, term=term),
+                nodes,
+            )
+        )
+        return term if accepted >= quorum else None
+
+    def _campaign(self) -> float:
+        """
+        Attempt to become leader once
+
+        :returns: The validity of the lock in milliseconds if elected, else `0` after
+            waiting until the next attempt is due
+        """
+        result = self.lock.acquire(blocking=False, autoextend=False)
+        if result:
+            term = self._new_term()
+            if term is not None:
+                self.term = term
+                if self.on_elected is not None:
+                    self.on_elected(self)
+                return cast(float, result)
+            self.lock.release()
+        retry_after = result.retry_after if isinstance(result, LockContention) else None
+        # spread out candidates waking up at the same time
+        delay: float = random.randint(0, self.lock.retry_delay)
+        if retry_after is not None:
+            delay += retry_after
+        self._stopped.wait(delay / 1000)
+        return 0
+
+    def _demote(self) -> None:
+        """
+        Stop leading and notify the candidate
+        """
+        self.term = None
+        if self.on_demoted is not None:
+            self.on_demoted(self)
+
+    def _run(self) -> None:
+        validity = 0.0
+        while not self._stopped.is_set():
+            if self.term is None:
+                validity = self._campaign()
+                continue
+            delay = self.lock.renewal_policy.renewal_delay(validity)
+            if self._stopped.wait(delay / 1000):
+                break
+            try:
+                validity = _renew(self.lock, self._stopped)
+            except InvalidOperationError:
+                # the lock was released or disowned, e.g. by closing its factory
+                validity = 0
+            if not validity and not self._stopped.is_set():
+                self._demote()
+        if self.term is not None:
+            if self.lock.lock_key is not None:
+                self.lock.release()
+            self._demote()
@@ -0,0 +1,432 @@
+"""
+Events and conditions shared across processes through the redis nodes.
+"""
+
+import threading
+import functools
+from typing import Union, Optional, Tuple, List, Any, Dict, Callable
+
+import redis
+
+from redlock_plus._util import (
+    _DEFAULT_TTL,
+    _map_concurrently,
+    _monotonic_ms,
+    _new_lock_key,
+    _node_timeout,
+)
+from redlock_plus.exceptions import InsufficientNodesError, InvalidOperationError
+from redlock_plus.lock import Lock
+from redlock_plus.nodes import (
+    NODE_REGISTRY,
+    _NodeSubscriber,
+    _TimeoutClient,
+    _bounded_pipeline,
+    _shared_nodes,
+)
+from redlock_plus.results import AcquireResult
+
+
+class _NodeSignal(threading.Event):
+    """
+    Event set by the messages from a single node of a :class:`_Subscription`, which
+    also sets the event shared by all of its nodes
+    """
+
+    def __init__(self, shared: threading.Event) -> None:
+        super().__init__()
+        self.shared = shared
+
+    def set(self) -> None:
+        super().set()
+        self.shared.set()
+
+
+class _Subscription:
+    """
+    Subscribe to a channel on multiple redis nodes, setting :attr:`received` whenever
+    a message arrives on any of them. Nodes that cannot be reached are skipped.
+    Use as a context manager to unsubscribe when done. Subscriptions share the
+    pub/sub connection of each node, see :class:`_NodeSubscriber`.
+    """
+
+    def __init__(self, nodes: List[redis.StrictRedis], channel: str) -> None:
+        self.nodes = nodes
+        self.channel = channel
+        self.received = threading.Event()
+        self._signals: List[Tuple[_NodeSubscriber, _NodeSignal]] = []
+
+    def __enter__(self) -> "_Subscription":
+        for node in self.nodes:
+            subscriber: _NodeSubscriber = node.redlock_subscriber  # type: ignore
+            signal = _NodeSignal(self.received)
+            try:
+                subscriber.subscribe(self.channel, signal)
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                continue
+            self._signals.append((subscriber, signal))
+        return self
+
+    def __exit__(self, *a: Any) -> None:
+        for subscriber, signal in self._signals:
+            subscriber.unsubscribe(self.channel, signal)
+        self._signals = []
+
+    def received_from(self) -> int:
+        """
+        :returns: The number of nodes a message arrived from
+        """
+        return len([signal for _, signal in self._signals if signal.is_set()])
+
+
+class Event:
+    """
+    A distributed version of :class:`threading.Event`, sharing the same API.
+    An event is considered set if its flag is set on the majority of redis nodes.
+    Waiting does not poll redis, waiters are woken up via pub/sub as soon as the event
+    is set.
+
+    :param name: Global identifier to be used for the event. This will be shared across
+        all redis nodes
+    :param connection_details: A list containing either redis client instances or dicts
+        that can be used to create a redis client. If `None`, `nodes` must not be `None`
+    :param nodes: A list containing already initialised redis nodes. Takes precedence
+        over `connection_details`. If `None`, `connection_details` must not be `None`
+    :param request_timeout: Time in seconds after which a request to a single node
+        times out. Defaults to the timeout of the requests of a :class:`Lock` with the
+        default ttl
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connection_details: Union[List[Dict[str, Any]], None] = None,
+        nodes: Optional[List[redis.StrictRedis]] = None,
+        request_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.request_timeout = (
+            _node_timeout(_DEFAULT_TTL) if request_timeout is None else request_timeout
+        )
+
+        nodes, self._finalizer = _shared_nodes(self, connection_details, nodes)
+
+        if len(nodes) < 3:
+            raise InsufficientNodesError(len(nodes))
+
+        self.redis_nodes: List[redis.StrictRedis] = nodes
+        self.quorum: int = max(3, len(self.redis_nodes) // 2 + 1)
+
+    def close(self) -> None:
+        """
+        Give up the reference to the redis nodes shared through
+        :data:`NODE_REGISTRY`, if the event was created from connection details. This
+        happens automatically once the event is garbage collected.
+        """
+        if self._finalizer is not None and self._finalizer.detach():
+            NODE_REGISTRY.release(self.redis_nodes)
+
+    def _quorum_of(self, func: Callable[[redis.StrictRedis], bool]) -> bool:
+        """
+        Apply a function to all redis nodes asynchronously
+
+        :returns: `True` if it returned `True` for the majority of nodes
+        """
+        results = _map_concurrently(func, self.redis_nodes)
+        return len([result for result in results if result]) >= self.quorum
+
+    def _set_node(self, node: redis.StrictRedis) -> bool:
+        """
+        Set the flag on a single redis node and notify waiters
+
+        :param node: An initialised redis client instance
+        :returns: `True` if the flag was set successfully, `False` otherwise
+        """
+        try:
+            node.redlock_event_set_script(  # type: ignore
+                keys=[self.name], client=_TimeoutClient(node, self.request_timeout)
+            )
+            return True
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return False
+
+    def _clear_node(self, node: redis.StrictRedis) -> bool:
+        """
+        Reset the flag on a single redis node
+
+        :param node: An initialised redis client instance
+        :returns: `True` if the request was successful, `False` otherwise
+        """
+        try:
+            _TimeoutClient(node, self.request_timeout).execute_command("DEL", self.name)
+            return True
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return False
+
+    def _is_set_node(self, node: redis.StrictRedis) -> bool:
+        """
+        Check the flag on a single redis node
+
+        :param node: An initialised redis client instance
+        :returns: `True` if the flag is set, `False` if it is not or the node could not
+            be reached
+        """
+        try:
+            client = _TimeoutClient(node, self.request_timeout)
+            return bool(client.execute_command("EXISTS", self.name))
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return False
+
+    def is_set(self) -> bool:
+        """
+        :returns: `True` if the flag is set on the majority of nodes
+        """
+        return self._quorum_of(self._is_set_node)
+
+    def set(self) -> bool:
+        """
+        Set the flag and wake up all waiting clients.
+
+        :returns: `True` if the flag could be set on the majority of nodes
+        """
+        return self._quorum_of(self._set_node)
+
+    def clear(self) -> bool:
+        """
+        Reset the flag.
+
+        :returns: `True` if the flag could be reset on the majority of nodes
+        """
+        return self._quorum_of(self._clear_node)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the flag is set.
+
+        :param timeout: If not `None`, block at most this many seconds
+        :returns: `True` if the flag is set, `False` if the timeout was exceeded
+        """
+        deadline = _monotonic_ms() + timeout * 1000 if timeout is not None else None
+        with _Subscription(self.redis_nodes, self.name) as subscription:
+            while True:
+                # reset before checking, so a set in between is not missed
+                subscription.received.clear()
+                if self.is_set():
+                    return True
+                remaining = None
+                if deadline is not None:
+                    remaining = (deadline - _monotonic_ms()) / 1000
+                    if remaining <= 0:
+                        return False
+                subscription.received.wait(remaining)
+
+
+class Condition:
+    """
+    A distributed version of :class:`threading.Condition`, sharing the same API and
+    bound to a :class:`Lock`. Waiters are woken up via pub/sub, in the order they
+    started waiting. The lock must not be held recursively while waiting.
+
+    The condition supports the context manager protocol, acquiring and releasing the
+    underlying lock::
+
+        with condition:
+            condition.wait_for(resource_is_available)
+
+    Waiters that crashed are not counted or woken up once `waiter_ttl` elapsed, live
+    waiters refresh it while waiting. Registering and notifying waiters times out like
+    the requests of the lock.
+
+    :param lock: The lock to bind the condition to
+    :param name: Global identifier to be used for the condition. Defaults to the
+        resource name of the lock with a ``:condition`` suffix
+    :param waiter_ttl: Time in milliseconds after which a waiter that stopped
+        refreshing its registration is considered gone
+    """
+
+    def __init__(
+        self, lock: Lock, name: Optional[str] = None, waiter_ttl: int = 10_000
+    ):
+        self.lock = lock
+        self.name = name if name is not None else f"{lock.resource_name}:condition"
+        self.waiter_ttl = waiter_ttl
+
+    def __enter__(self) -> AcquireResult:
+        return self.lock.__enter__()
+
+    def __exit__(self, *a: Any) -> None:
+        self.lock.__exit__(*a)
+
+    @property
+    def _quorum(self) -> int:
+        """
+        Number of nodes that must notify a waiter for it to wake up
+        """
+        return len(self.lock.redis_nodes) // 2 + 1
+
+    def acquire(self, *args: Any, **kwargs: Any) -> AcquireResult:
+        """
+        Acquire the underlying lock. Takes the same arguments as :meth:`Lock.acquire`
+        """
+        return self.lock.acquire(*args, **kwargs)
+
+    def release(self) -> bool:
+        """
+        Release the underlying lock
+        """
+        return self.lock.release()
+
+    def _pipeline(self, node: redis.StrictRedis) -> redis.client.Pipeline:
+        """
+        :returns: A pipeline to `node` whose requests time out like those of the lock
+        """
+        # pylint: disable=protected-access
+        return _bounded_pipeline(node, self.lock._request_timeout)
+
+    def _add_waiter_node(self, node: redis.StrictRedis, waiter: str) -> None:
+        pipeline = self._pipeline(node)
+        pipeline.rpush(self.name, waiter)
+        pipeline.set(f"{self.name}:{waiter}", 1, px=self.waiter_ttl)
+        pipeline.pexpire(self.name, self.waiter_ttl)
+        try:
+            pipeline.execute()
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            pass
+
+    def _refresh_waiter_node(self, node: redis.StrictRedis, waiter: str) -> None:
+        pipeline = self._pipeline(node)
+        pipeline.pexpire(f"{self.name}:{waiter}", self.waiter_ttl)
+        pipeline.pexpire(self.name, self.waiter_ttl)
+        try:
+            pipeline.execute()
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            pass
+
+    def _remove_waiter_node(self, node: redis.StrictRedis, waiter: str) -> None:
+        pipeline = self._pipeline(node)
+        pipeline.lrem(self.name, 0, waiter)
+        pipeline.delete(f"{self.name}:{waiter}")
+        try:
+            pipeline.execute()
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            pass
+
+    def _notify_node(self, node: redis.StrictRedis, count: int) -> int:
+        try:
+            return int(
+                node.redlock_notify_script(  # type: ignore
+                    keys=[self.name],
+                    args=[count],
+                    client=self.lock._client(node),  # pylint: disable=protected-access
+                )
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return 0
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Release the underlying lock, block until notified or the timeout is exceeded
+        and acquire the lock again, autoextending it if it was autoextended before.
+        The waiter counts as notified once the majority of nodes notified it.
+
+        :param timeout: If not `None`, block at most this many seconds
+        :returns: `True` if the waiter was notified, `False` if the timeout was exceeded
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        if not self.lock.lock_key:
+            raise InvalidOperationError("Cannot wait on un-acquired lock")
+        thread = self.lock._autoextend_thread  # pylint: disable=protected-access
+        autoextend = thread is not None and thread.is_alive()
+        autoextend_timeout = (
+            thread.timeout_ms / 1000 if autoextend and thread.timeout_ms else None
+        )
+        deadline = _monotonic_ms() + timeout * 1000 if timeout is not None else None
+        waiter = _new_lock_key()
+        nodes = self.lock.redis_nodes
+        quorum = self._quorum
+        refresh_interval = self.waiter_ttl / 3
+        with _Subscription(nodes, f"{self.name}:{waiter}") as subscription:
+            _map_concurrently(
+                functools.partial(self._add_waiter_node, waiter=waiter), nodes
+            )
+            self.lock.release()
+            next_refresh = _monotonic_ms() + refresh_interval
+            while True:
+                # reset before counting, so a notification in between is not missed
+                subscription.received.clear()
+                notified = subscription.received_from() >= quorum
+                now = _monotonic_ms()
+                if notified or (deadline is not None and now >= deadline):
+                    break
+                if now >= next_refresh:
+                    _map_concurrently(
+                        functools.partial(self._refresh_waiter_node, waiter=waiter),
+                        nodes,
+                    )
+                    next_refresh = now + refresh_interval
+                wait_ms = next_refresh - now
+                if deadline is not None:
+                    wait_ms = min(wait_ms, deadline - now)
+                subscription.received.wait(wait_ms / 1000)
+            # nodes that did not notify the waiter, e.g. because they registered the
+            # waiters in a different order, must not notify it later on
+            _map_concurrently(
+                functools.partial(self._remove_waiter_node, waiter=waiter), nodes
+            )
+        self.lock.acquire(autoextend=autoextend, autoextend_timeout=autoextend_timeout)
+        return notified
+
+    def wait_for(
+        self, predicate: Callable[[], Any], timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Wait until `predicate` evaluates to a truthy value.
+
+        :param predicate: Callable to check the condition
+        :param timeout: If not `None`, wait at most this many seconds
+        :returns: The last return value of `predicate`
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        deadline = _monotonic_ms() + timeout * 1000 if timeout is not None else None
+        result = predicate()
+        while not result:
+            remaining = None
+            if deadline is not None:
+                remaining = (deadline - _monotonic_ms()) / 1000
+                if remaining <= 0:
+                    break
+            self.wait(remaining)
+            result = predicate()
+        return result
+
+    def notify(self, n: int = 1) -> int:
+        """
+        Wake up at most `n` waiters, as long as the nodes agree on the order the
+        waiters started waiting in. A node that missed registrations, e.g. because it
+        was unreachable for a while, may notify different waiters than the others,
+        which only wake up once notified by the majority of nodes.
+
+        :param n: Maximum number of waiters to wake up
+        :returns: The number of waiters that were woken up according to a majority of
+            nodes
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        if not self.lock.lock_key:
+            raise InvalidOperationError("Cannot notify on un-acquired lock")
+        notified: List[int] = sorted(
+            _map_concurrently(
+                functools.partial(self._notify_node, count=n), self.lock.redis_nodes
+            ),
+            reverse=True,
+        )
+        # the greatest number that at least a majority of nodes reported
+        return notified[min(self._quorum, len(notified)) - 1]
+
+    def notify_all(self) -> int:
+        """
+        Wake up all waiters.
+
+        :returns: The number of waiters that were woken up
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        return self.notify(-1)
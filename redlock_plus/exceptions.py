@@ -0,0 +1,43 @@
+"""
+Exceptions raised by the locks.
+"""
+
+from typing import Any
+
+
+class RedlockError(Exception):
+    """
+    Base redlock exception
+    """
+
+
+class InvalidOperationError(RedlockError):
+    """
+    An operation was performed on the lock which the current state of the lock does not
+    allow
+    """
+
+
+class InsufficientNodesError(RedlockError):
+    """
+    Raised if the minimum amount of nodes, 3 unless stated otherwise, was not met
+
+    :param node_count: Number of nodes that were passed
+    :param min_nodes: Number of nodes that are required
+    """
+
+    def __init__(self, node_count: int, *args: Any, min_nodes: int = 3) -> None:
+        msg = (
+            f"At least {min_nodes} redis nodes are required for redlock to work, got "
+            f"{node_count}. If you need a distributed lock with lesser guarantees, "
+            "consider using SingleNodeLock"
+        )
+        super().__init__(msg, *args)
+        self.node_count = node_count
+        self.min_nodes = min_nodes
+
+
+class LockExpiredError(RedlockError):
+    """
+    The validity of a lock ran out while guarded work was still in progress
+    """
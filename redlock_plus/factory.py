@@ -0,0 +1,482 @@
+"""
+Factories sharing redis nodes among the locks they create.
+"""
+
+import time
+import weakref
+from typing import Optional, List, Any, Dict, Type, Iterator, Iterable, Callable, cast
+
+import redis
+
+from redlock_plus._util import (
+    _DEFAULT_TTL,
+    _FORK_SAFE,
+    _deadline,
+    _map_concurrently,
+    _node_timeout,
+    _remaining_ttls,
+    _reset_connection_pools,
+    _validity,
+    monotonic,
+)
+from redlock_plus.election import LeaderElection
+from redlock_plus.events import Event
+from redlock_plus.exceptions import InsufficientNodesError, InvalidOperationError
+from redlock_plus.lock import Lock, SingleNodeLock
+from redlock_plus.nodes import (
+    NODE_REGISTRY,
+    _TimeoutClient,
+    _bounded_pipeline,
+    _is_unknown_command,
+    _load_function_library,
+    _register_scripts,
+)
+from redlock_plus.ratelimit import SlidingWindow, TokenBucket
+from redlock_plus.results import HolderInfo, LockInfo
+from redlock_plus.rlock import RLock
+from redlock_plus.stats import LockStats, _HISTOGRAM_BUCKETS, _StatsRecorder
+
+
+class LockFactory:
+    """
+    Create new :class:`Lock` instances from a fixed configuration.
+
+    :param connection_details: An iterable of connection parameters. See
+        :class:`Lock` for details. Locks of any `ttl` share the same nodes, the
+        timeout of their requests is derived from the `ttl` of each lock. Requests
+        of the factory itself and of the events and rate limiters it creates time out
+        after :attr:`LockFactory.request_timeout` by default
+    :param lock_class: The class of the created locks, overriding
+        :attr:`LockFactory.lock_class`
+    :param functions: If `True`, install and call the scripts as a redis function
+        library. See :func:`init_redis_nodes`
+    :param kwargs: Default values for keyword arguments to pass to each created
+        :class:`Lock` instance
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    lock_class: Type[Lock] = Lock
+
+    def __init__(
+        self,
+        connection_details: List[Dict[str, Any]],
+        lock_class: Optional[Type[Lock]] = None,
+        functions: bool = False,
+        **kwargs: Any,
+    ):
+        if lock_class is not None:
+            self.lock_class = lock_class
+        min_nodes = self.lock_class.min_nodes
+        if len(connection_details) < min_nodes:
+            raise InsufficientNodesError(len(connection_details), min_nodes=min_nodes)
+        self.redis_nodes = NODE_REGISTRY.acquire(connection_details, functions)
+        self._finalizer = weakref.finalize(
+            self, NODE_REGISTRY.release_later, self.redis_nodes
+        )
+        self.lock_kwargs = kwargs
+        #: Time in seconds after which a request to a single node times out, unless
+        #: given otherwise. Derived from the default `ttl` of the locks like theirs
+        self.request_timeout: float = _node_timeout(kwargs.get("ttl", _DEFAULT_TTL))
+        self.closed = False
+        self._locks: "weakref.WeakSet[Lock]" = weakref.WeakSet()
+        self._elections: "weakref.WeakSet[LeaderElection]" = weakref.WeakSet()
+        self._stats = _StatsRecorder()
+        _FORK_SAFE.add(self)
+
+    def _after_fork(self) -> None:
+        _reset_connection_pools(self.redis_nodes)
+
+    def __call__(self, resource_name: str, **kwargs: Any) -> "Lock":
+        """
+        Create a new :class:`Lock` object and reuse stored Redis clients.
+        Takes the same arguments as :class:`Lock`
+
+        :raises InvalidOperationError: If the factory was closed
+        """
+        if self.closed:
+            raise InvalidOperationError("Cannot create locks from a closed factory")
+        lock_kwargs = {**self.lock_kwargs}
+        lock_kwargs.update(kwargs)
+        lock = self.lock_class(
+            resource_name=resource_name, nodes=self.redis_nodes, **lock_kwargs
+        )
+        lock._stats = self._stats  # pylint: disable=protected-access
+        self._locks.add(lock)
+        return lock
+
+    def __enter__(self) -> "LockFactory":
+        return self
+
+    def __exit__(self, *a: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop all leader elections and autoextending all locks created by this factory,
+        release the held locks with a single request per node and give up the
+        reference to the redis nodes shared through :data:`NODE_REGISTRY`. Once no
+        other lock or factory uses them, their connection pools are disconnected in
+        parallel. Clients passed as instances are owned by the caller and stay
+        connected.
+
+        The factory also supports the context manager protocol, closing it on exit::
+
+            with LockFactory(connection_details) as factory:
+                with factory("my_resource"):
+                    # do some work
+        """
+        # pylint: disable=protected-access
+        if self.closed:
+            return
+        self.closed = True
+        for election in list(self._elections):
+            election.stop()
+        locks = list(self._locks)
+        for lock in locks:
+            lock.stop_autoextend()
+        held = [lock for lock in locks if lock.lock_key is not None]
+        if held:
+            self._release_many(
+                [lock.resource_name for lock in held],
+                [cast(str, lock.lock_key) for lock in held],
+                min(lock._request_timeout for lock in held),
+            )
+        for lock in held:
+            lock._disown()
+        if self._finalizer.detach():
+            NODE_REGISTRY.release(self.redis_nodes)
+
+    def _release_many(self, keys: List[str], tokens: List[str], timeout: float) -> None:
+        """
+        Release locks on all nodes, using a single request per node
+
+        :param keys: Resource names of the locks
+        :param tokens: Lock keys of the locks, in the same order as `keys`
+        :param timeout: Time in seconds the request to each node may take
+        """
+
+        def release_node(node: redis.StrictRedis) -> None:
+            try:
+                node.redlock_release_many_script(  # type: ignore
+                    keys=keys, args=tokens, client=_TimeoutClient(node, timeout)
+                )
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
+
+        list(self._map_nodes(release_node))
+
+    def _map_nodes(self, func: Callable) -> Iterator[Any]:
+        """
+        Apply a function to :attr:`LockFactory.redis_nodes` asynchronously
+
+        :param func: Callable that accepts a node as its first parameter
+        :returns: Result iterator for the created futures
+        """
+        return _map_concurrently(func, self.redis_nodes)
+
+    def inspect(
+        self, resource_names: Iterable[str], timeout: Optional[float] = None
+    ) -> Dict[str, List[Optional[LockInfo]]]:
+        """
+        Inspect the current state of locks on all nodes. The reads are pipelined,
+        making a single round trip per node regardless of the number of locks.
+
+        :param resource_names: Names of the resources to inspect
+        :param timeout: Time in seconds after which reading from a node times out.
+            Defaults to :attr:`LockFactory.request_timeout`
+        :returns: A mapping of resource names to a list with a :class:`LockInfo` for
+            each node, in the order of :attr:`LockFactory.redis_nodes`. An entry is
+            `None` if the resource is not locked on that node or the node could not
+            be reached
+        """
+        names = list(dict.fromkeys(resource_names))
+        timeout = self.request_timeout if timeout is None else timeout
+
+        def inspect_node(node: redis.StrictRedis) -> List[Optional[LockInfo]]:
+            pipeline = _bounded_pipeline(node, timeout)
+            for name in names:
+                pipeline.get(name)
+                pipeline.pttl(name)
+            try:
+                replies = pipeline.execute()
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                return [None] * len(names)
+            infos: List[Optional[LockInfo]] = []
+            for lock_key, ttl in zip(replies[::2], replies[1::2]):
+                if lock_key is None:
+                    infos.append(None)
+                    continue
+                if isinstance(lock_key, bytes):
+                    lock_key = lock_key.decode(errors="replace")
+                infos.append(
+                    LockInfo(
+                        lock_key=lock_key,
+                        ttl=ttl,
+                        holder=HolderInfo.from_lock_key(lock_key),
+                    )
+                )
+            return infos
+
+        node_infos = list(self._map_nodes(inspect_node))
+        return {
+            name: [infos[i] for infos in node_infos] for i, name in enumerate(names)
+        }
+
+    def check_all(
+        self, locks: Iterable[Lock], timeout: Optional[float] = None
+    ) -> Dict[Lock, float]:
+        """
+        Check if many locks are still held, like :meth:`Lock.check_times`, but with
+        the checks of all locks pipelined into a single request per node. This keeps
+        the number of round trips independent of the number of locks, e.g. for health
+        checks of a worker holding many locks. Locks that were not acquired are not
+        checked.
+
+        :param locks: Locks created from this factory
+        :param timeout: Time in seconds after which reading from a node times out.
+            Defaults to :attr:`LockFactory.request_timeout`
+        :returns: A mapping of each lock to the minimal time in milliseconds it can
+            still be considered held, accounting for clock drift and request time, or
+            `0.0` if it is not held
+        :raises ValueError: If a lock does not use the nodes of this factory
+        """
+        results = dict.fromkeys(locks, 0.0)
+        if any(lock.redis_nodes is not self.redis_nodes for lock in results):
+            raise ValueError("All locks must be created from this factory")
+        # read the keys once, they may change while the requests are in flight
+        held = [(lock, lock.lock_key) for lock in results if lock.lock_key is not None]
+        if not held:
+            return results
+        timeout = self.request_timeout if timeout is None else timeout
+
+        def get_ttls(node: redis.StrictRedis) -> List[Optional[int]]:
+            pipeline = _bounded_pipeline(node, timeout)
+            for lock, lock_key in held:
+                node.redlock_get_ttl_script(  # type: ignore
+                    keys=[lock.resource_name], args=[lock_key], client=pipeline
+                )
+            return pipeline.execute()
+
+        def check_node(node: redis.StrictRedis) -> List[Optional[int]]:
+            try:
+                try:
+                    return get_ttls(node)
+                except redis.exceptions.ResponseError as error:
+                    # pipelined calls cannot fall back to scripts or reinstall the
+                    # function library themselves, e.g. if the node was replaced by
+                    # an empty one
+                    if _is_unknown_command(error):
+                        _register_scripts(node)
+                    elif "Function not found" in str(error):
+                        client = _TimeoutClient(node, timeout)
+                        _load_function_library(client)  # type: ignore
+                    else:
+                        raise
+                    return get_ttls(node)
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                return [None] * len(held)
+
+        start_time = monotonic()
+        node_ttls = list(self._map_nodes(check_node))
+        end_time = monotonic()
+
+        for (lock, _), ttls in zip(held, zip(*node_ttls)):
+            drift = lock._get_drift()  # pylint: disable=protected-access
+            times = _remaining_ttls(ttls, drift, start_time, end_time)
+            if len(times) >= lock.quorum:
+                results[lock] = min(times)
+        return results
+
+    def stats(self) -> LockStats:
+        """
+        Aggregate the statistics recorded by the locks created by this factory since
+        it was created. Recording costs the locks no synchronisation, as each thread
+        counts separately, and the counts are only summed up here.
+
+        :returns: The current statistics
+        """
+        merged = self._stats.merged()
+        now = time.monotonic()
+        return LockStats(
+            active_locks=sum(
+                1
+                for lock in list(self._locks)
+                if lock.deadline is not None and lock.deadline > now
+            ),
+            acquires=merged.acquires,
+            acquire_failures=merged.acquire_failures,
+            acquire_latency=dict(zip(_HISTOGRAM_BUCKETS, merged.acquire_latency)),
+            retries=dict(sorted(merged.retries.items())),
+            validity=dict(zip(_HISTOGRAM_BUCKETS, merged.validity)),
+            extends=merged.extends,
+            extend_failures=merged.extend_failures,
+            node_requests=[
+                merged.nodes.get(id(node), [0, 0])[0] for node in self.redis_nodes
+            ],
+            node_errors=[
+                merged.nodes.get(id(node), [0, 0])[1] for node in self.redis_nodes
+            ],
+        )
+
+    def try_acquire_any(
+        self,
+        resource_names: Iterable[str],
+        limit: Optional[int] = None,
+        autoextend: bool = True,
+        autoextend_timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> List[Lock]:
+        """
+        Attempt to acquire as many of the given resources as possible, without
+        blocking, in a single round trip per node. Resources that were acquired on a
+        majority of nodes are considered won, up to `limit` of them in the order they
+        were passed in. All other resources are released again in a single batched
+        request per node. That takes a second round trip, since whether a resource is
+        won depends on the replies of all nodes, which are only known once the first
+        round is done. Each lock records the attempt like :meth:`Lock.acquire`, as a
+        single round.
+
+        :param resource_names: Names of the resources to try to acquire
+        :param limit: Maximum number of locks to return. If `None`, return all locks
+            that could be acquired
+        :param autoextend: If `True` start a thread for each acquired lock that
+            extends it as scheduled by its :class:`RenewalPolicy`
+        :param autoextend_timeout: Timeout in seconds after which the autoextend
+            threads will terminate regardless of the lock status
+        :param kwargs: Passed on to the created :class:`Lock` instances. See
+            :meth:`LockFactory.__call__`
+        :returns: A list of the acquired locks
+        """
+        # pylint: disable=protected-access,too-many-locals
+        locks = [self(name, **kwargs) for name in dict.fromkeys(resource_names)]
+        if not locks:
+            return []
+        # all locks are created with the same arguments, so they share these values
+        ttl, drift, quorum = locks[0].ttl, locks[0]._get_drift(), locks[0].quorum
+        keys = [lock.resource_name for lock in locks]
+        tokens = [lock._generate_lock_key() for lock in locks]
+
+        def acquire_node(node: redis.StrictRedis) -> List[int]:
+            try:
+                return node.redlock_acquire_many_script(  # type: ignore
+                    keys=keys, args=[ttl, *tokens], client=locks[0]._client(node)
+                )
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                locks[0]._node_error(node)
+                return [0] * len(keys)
+
+        start_time = monotonic()
+        self._stats.record_requests(self.redis_nodes)
+        node_results = list(self._map_nodes(acquire_node))
+        end_time = monotonic()
+        validity = _validity(ttl, drift, start_time, end_time)
+
+        won: List[int] = []
+        if validity > 0:
+            won = [
+                i
+                for i, acquired_count in enumerate(map(sum, zip(*node_results)))
+                if acquired_count >= quorum
+            ][:limit]
+
+        won_indices = set(won)
+        lost = [i for i in range(len(locks)) if i not in won_indices]
+        if lost:
+            self._release_many(
+                [keys[i] for i in lost],
+                [tokens[i] for i in lost],
+                locks[0]._request_timeout,
+            )
+
+        # the locks were just acquired, so there is no need to check on them again
+        deadline = _deadline(end_time, validity)
+        for i in won:
+            locks[i]._own(tokens[i], deadline)
+            locks[i]._record_acquire(start_time, 1, validity)
+            if autoextend:
+                locks[i]._start_autoextend_thread(autoextend_timeout)
+        for i in lost:
+            locks[i]._record_acquire(start_time, 1, False)
+        return [locks[i] for i in won]
+
+    def event(self, name: str, request_timeout: Optional[float] = None) -> "Event":
+        """
+        Create a new :class:`Event` object and reuse stored Redis clients.
+
+        :param name: Global identifier to be used for the event
+        :param request_timeout: See :class:`Event`. Defaults to
+            :attr:`LockFactory.request_timeout`
+        """
+        if request_timeout is None:
+            request_timeout = self.request_timeout
+        return Event(name, nodes=self.redis_nodes, request_timeout=request_timeout)
+
+    def leader_election(
+        self,
+        name: str,
+        on_elected: Optional[Callable[["LeaderElection"], Any]] = None,
+        on_demoted: Optional[Callable[["LeaderElection"], Any]] = None,
+        **kwargs: Any,
+    ) -> "LeaderElection":
+        """
+        Create a new :class:`LeaderElection` campaigning with a new lock that reuses
+        stored Redis clients.
+
+        :param name: Name of the resource to elect a leader for
+        :param on_elected: See :class:`LeaderElection`
+        :param on_demoted: See :class:`LeaderElection`
+        :param kwargs: Passed on to the created :class:`Lock`. See
+            :meth:`LockFactory.__call__`
+        """
+        election = LeaderElection(
+            self(name, **kwargs), on_elected=on_elected, on_demoted=on_demoted
+        )
+        self._elections.add(election)
+        return election
+
+    def token_bucket(
+        self, name: str, capacity: int, rate: float, **kwargs: Any
+    ) -> "TokenBucket":
+        """
+        Create a new :class:`TokenBucket` object and reuse stored Redis clients.
+
+        :param name: Global identifier to be used for the limiter
+        :param capacity: Maximum number of tokens in the bucket
+        :param rate: Number of tokens added per second
+        :param kwargs: Passed on to :class:`TokenBucket`. `request_timeout` defaults
+            to :attr:`LockFactory.request_timeout`
+        """
+        kwargs.setdefault("request_timeout", self.request_timeout)
+        return TokenBucket(name, capacity, rate, nodes=self.redis_nodes, **kwargs)
+
+    def sliding_window(
+        self, name: str, limit: int, window: int, **kwargs: Any
+    ) -> "SlidingWindow":
+        """
+        Create a new :class:`SlidingWindow` object and reuse stored Redis clients.
+
+        :param name: Global identifier to be used for the limiter
+        :param limit: Maximum number of tokens per window
+        :param window: Length of the window in milliseconds
+        :param kwargs: Passed on to :class:`SlidingWindow`. `request_timeout` defaults
+            to :attr:`LockFactory.request_timeout`
+        """
+        kwargs.setdefault("request_timeout", self.request_timeout)
+        return SlidingWindow(name, limit, window, nodes=self.redis_nodes, **kwargs)
+
+
+class RLockFactory(LockFactory):
+    # pylint: disable=too-few-public-methods
+    """
+    Convenience subclass of :class:`LockFactory`, to create RLocks.
+    """
+    lock_class: Type[RLock] = RLock
+
+
+class SingleNodeLockFactory(LockFactory):
+    # pylint: disable=too-few-public-methods
+    """
+    Convenience subclass of :class:`LockFactory`, to create SingleNodeLocks.
+    """
+    lock_class: Type[SingleNodeLock] = SingleNodeLock
@@ -0,0 +1,816 @@
+"""
+The distributed locks.
+"""
+
+import time
+import random
+import threading
+import weakref
+import functools
+import contextlib
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Union, Optional, Tuple, List, Any, Dict, Iterator, Callable, cast
+
+import redis
+
+from redlock_plus._base import _LockBase
+from redlock_plus._util import (
+    DecoratorT,
+    T,
+    _DEFAULT_TTL,
+    _FORK_SAFE,
+    _deadline,
+    _monotonic_delta_ms,
+    _node_from_pool_details,
+    _node_to_pool_details,
+    _nodes_encoding,
+    _remaining_ms,
+    _remaining_ttls,
+    _reset_connection_pools,
+    _retry_delay_ms,
+    _round_budget,
+    _validity,
+    monotonic,
+    sleep_ms,
+)
+from redlock_plus.autoextend import RenewalPolicy, _AutoextendThread
+from redlock_plus.clock import ClockDriftMonitor
+from redlock_plus.exceptions import (
+    InsufficientNodesError,
+    InvalidOperationError,
+    LockExpiredError,
+)
+from redlock_plus.nodes import NODE_REGISTRY, _shared_nodes, _uses_functions
+from redlock_plus.results import AcquireResult, Lease, _contention
+from redlock_plus.stats import LockProfiler, _StatsRecorder
+
+
+class Lock(_LockBase):
+    """
+    A distributed lock implementation based on Redis.
+    It shares the same API as Python's :class:`threading.Lock` and behaves mostly the
+    same. Generally this can be used as a drop-in replacement, given the lock is
+    provided from a :class:`LockFactory`.
+
+    The lock supports the context manager protocol, which is the preferred way to use it
+    ::
+
+        with Lock("my_resource"):
+            # do some work
+
+        # this is equivalent to
+
+        lock = Lock("my_resource")
+        lock.acquire()
+        # do some stuff
+        lock.release()
+
+    :param resource_name: Global identifier to be used for the lock. This will be shared
+        across all redis nodes
+    :param connection_details: A list containing either redis client instances or dicts
+        that can be used to create a redis client. Clients created from equal dicts are
+        shared process wide, see :class:`NodeRegistry`. If `None`, `nodes` must not be
+        `None`
+    :param nodes: A list containing already initialised redis nodes. Takes precedence
+        over `connection_details`. If `None`, `connection_details` must not be `None`
+    :param retry_times: Amount of times to retry acquiring a lock after a failed attempt
+    :param retry_delay: Time in milliseconds between retry attempts to acquire a lock
+    :param ttl: Time in seconds until the lock should expire. This should be set to a
+        relatively high amount compared to the time it takes to complete the work for
+        which the lock should be held. Default is 120_000 milliseconds (2 minutes).
+        Requests to the nodes time out after the fraction of it given by
+        :data:`NODE_TIMEOUT_FACTOR`
+    :param holder_info: If `True`, store the hostname, process id and time of
+        acquisition alongside the token of the lock, so it can be inspected with
+        :meth:`LockFactory.inspect` or from a :class:`LockContention`
+    :param clock_monitor: If set, use the clock drift measured by the
+        :class:`ClockDriftMonitor` instead of :data:`CLOCK_DRIFT_FACTOR` and feed it
+        with the server time reported when extending or checking the lock
+    :param renewal_policy: The :class:`RenewalPolicy` scheduling renewals of the
+        autoextend thread. Defaults to a new :class:`RenewalPolicy` per lock
+    :param on_lost: Callable to be called with the lock from the autoextend thread if
+        the lock expired because it could not be renewed in time
+    :param profiler: If set, record usage statistics of the lock with the
+        :class:`LockProfiler`
+    :param hedge: If `True`, stop waiting for nodes slower than their usual p95
+        latency when checking, extending or releasing the lock, once a quorum of the
+        other nodes succeeded. With many nodes, this keeps a single slow node from
+        setting the tail latency. See :class:`NodeLatency`
+
+    Locks are fork safe: a child process neither owns the lock acquired by its parent
+    nor extends it, and reconnects to redis. Locks can also be pickled, e.g. to pass
+    them to a :class:`concurrent.futures.ProcessPoolExecutor`. The unpickled lock
+    connects to the same redis nodes and owns the lock if it was held when pickled,
+    but is not autoextended by the receiving process. Locks whose nodes are shared
+    through :data:`NODE_REGISTRY` share them in the receiving process as well. The
+    clock drift measurements of a :class:`ClockDriftMonitor`, `on_lost`, `profiler`
+    and `renewal_policy` are not pickled, the unpickled lock uses their defaults.
+
+    .. attribute:: deadline
+
+        Point in time of :func:`time.monotonic` in seconds after which the lock can
+        not be considered held anymore, or `None` if it is not held. This is updated
+        locally whenever the lock is acquired, extended (also by the autoextend
+        thread) or adopted, so reading it costs no request to redis
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    #: Minimum number of redis nodes a lock of this class can be created with
+    min_nodes: int = 3
+
+    def __init__(
+        self,
+        resource_name: str,
+        connection_details: Union[List[Dict[str, Any]], None] = None,
+        nodes: Optional[List[redis.StrictRedis]] = None,
+        retry_times: int = 3,
+        retry_delay: int = 200,
+        ttl: int = _DEFAULT_TTL,
+        holder_info: bool = False,
+        clock_monitor: Optional[ClockDriftMonitor] = None,
+        renewal_policy: Optional[RenewalPolicy] = None,
+        on_lost: Optional[Callable[["Lock"], Any]] = None,
+        profiler: Optional[LockProfiler] = None,
+        hedge: bool = False,
+    ):
+        # pylint: disable=too-many-arguments
+        # arguments of the scripts are encoded as soon as the nodes are known
+        self._encoding: Optional[Tuple[str, str]] = None
+        self._lock_key: Optional[str] = None
+        self.deadline: Optional[float] = None
+        self.retry_times = retry_times
+        self.retry_delay = retry_delay
+        self.ttl = ttl  # also sets Lock._drift
+        self.holder_info = holder_info
+        self.clock_monitor = clock_monitor
+        self.renewal_policy = renewal_policy or RenewalPolicy()
+        self.on_lost = on_lost
+        self.profiler = profiler
+        self.hedge = hedge
+        # monotonic time at which a lock sampled by the profiler was acquired
+        self._held_since: Optional[float] = None
+        # set by the LockFactory creating the lock, see LockFactory.stats
+        self._stats: Optional[_StatsRecorder] = None
+        # rounds taken by the current call to acquire
+        self._rounds = 0
+        self._autoextend_thread: Optional[_AutoextendThread] = None
+        # replies of nodes held by someone else during the last acquire round
+        self._contended: List[Tuple[int, Union[str, bytes]]] = []
+
+        nodes, self._finalizer = _shared_nodes(self, connection_details, nodes)
+
+        if len(nodes) < self.min_nodes:
+            raise InsufficientNodesError(len(nodes), min_nodes=self.min_nodes)
+
+        self.redis_nodes: List[redis.StrictRedis] = nodes
+        self.quorum: int = max(self.min_nodes, len(self.redis_nodes) // 2 + 1)
+        self._encoding = _nodes_encoding(nodes)
+        self.resource_name = resource_name
+        _FORK_SAFE.add(self)
+
+    def close(self) -> None:
+        """
+        Stop autoextending the lock and give up the reference to the redis nodes
+        shared through :data:`NODE_REGISTRY`, if the lock was created from connection
+        details. This happens automatically once the lock is garbage collected. The
+        lock is not released.
+        """
+        self.stop_autoextend()
+        if self._finalizer is not None and self._finalizer.detach():
+            NODE_REGISTRY.release(self.redis_nodes)
+
+    def _disown(self) -> None:
+        """
+        Forget about holding the lock, without releasing it
+        """
+        self._autoextend_thread = None
+        self.lock_key = None
+        self.deadline = None
+        self._held_since = None
+
+    def _own(self, lock_key: str, deadline: float) -> None:
+        """
+        Take ownership of a lock that was acquired on the nodes with `lock_key`
+        other than by :meth:`Lock.acquire`, valid until `deadline`
+        """
+        self.lock_key = lock_key
+        self.deadline = deadline
+
+    def _after_fork(self) -> None:
+        """
+        Reset the lock in a forked child process. The child does not own the lock of
+        the parent process and has no autoextend thread
+        """
+        self._disown()
+        _reset_connection_pools(self.redis_nodes)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        # callbacks like lambdas cannot be pickled, and the policy and profiler
+        # collect statistics of this process
+        del state["on_lost"], state["profiler"], state["renewal_policy"]
+        state["connection_details"] = NODE_REGISTRY.connection_details(self.redis_nodes)
+        state["redis_nodes"] = [_node_to_pool_details(n) for n in self.redis_nodes]
+        state["functions"] = _uses_functions(self.redis_nodes)
+        state["_autoextend_thread"] = None
+        state["_finalizer"] = None
+        state["_stats"] = None
+        state["_acquire_clients"] = {}
+        # monotonic time is not comparable across machines, use wall clock time
+        deadline = state.pop("deadline")
+        state["expires_at"] = (
+            None if deadline is None else time.time() + deadline - time.monotonic()
+        )
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state = {**state}
+        expires_at = state.pop("expires_at")
+        state["deadline"] = (
+            None if expires_at is None else time.monotonic() + expires_at - time.time()
+        )
+        connection_details = state.pop("connection_details", None)
+        nodes = NODE_REGISTRY.acquire(
+            connection_details
+            or [_node_from_pool_details(details) for details in state["redis_nodes"]],
+            functions=state.pop("functions", False),
+        )
+        if connection_details:
+            state["_finalizer"] = weakref.finalize(
+                self, NODE_REGISTRY.release_later, nodes
+            )
+        state.update(
+            redis_nodes=nodes,
+            on_lost=None,
+            profiler=None,
+            renewal_policy=RenewalPolicy(),
+        )
+        self.__dict__.update(state)
+        _FORK_SAFE.add(self)
+
+    @property
+    def is_valid(self) -> bool:
+        """
+        Whether the lock can still be considered held according to
+        :attr:`Lock.deadline`. Unlike :meth:`Lock.locked` this makes no request to
+        redis, and relies on the deadline being kept up to date by extending the lock,
+        e.g. with autoextend.
+        """
+        deadline = self.deadline
+        return deadline is not None and time.monotonic() < deadline
+
+    def __enter__(self) -> AcquireResult:
+        return self.acquire()
+
+    def __exit__(self, *a: Any) -> None:
+        self.release()
+
+    def _requires_key(func: DecoratorT) -> DecoratorT:  # type: ignore
+        """
+        Mark a function as requiring :attr:`Lock.key` to be set.
+        If the function is called without the key being present, raise an
+        `InvalidOperationError`
+
+        The typing is currently a bit whacky, since mypy doesn't have great support for
+        constructs like this. See https://github.com/python/mypy/issues/7778,
+        https://github.com/python/mypy/issues/1927
+
+        """
+        # pylint: disable=no-self-argument,not-callable
+        @functools.wraps(func)
+        def wrapped(self, *args, **kwargs):  # type: ignore
+            if not self.lock_key:
+                raise InvalidOperationError("Invalid operation on not-acquired lock")
+            return func(self, *args, **kwargs)
+
+        return cast(DecoratorT, wrapped)
+
+    def start_autoextend(self, timeout: Optional[float] = None) -> threading.Thread:
+        """
+        Start an autoextending thread which will attempt to extend the lock before it
+        expires, as scheduled by :attr:`Lock.renewal_policy`.
+
+        :param timeout: Timeout in seconds until the thread terminates. If `None`, the
+            lock will be extended indefinitely (i.e. as long as the main thread is
+            running)
+        :returns: The autoextending thread
+        :raises InvalidOperationError: If the lock was not previously acquired or
+            expired already
+        """
+        if self.deadline is None or self.deadline <= time.monotonic():
+            raise InvalidOperationError("Cannot autoextend un-acquired lock")
+        return self._start_autoextend_thread(timeout)
+
+    def _start_autoextend_thread(self, timeout: Optional[float]) -> threading.Thread:
+        """
+        Start an autoextending thread like :meth:`Lock.start_autoextend`, without
+        checking :attr:`Lock.deadline`
+        """
+        self.stop_autoextend()
+        self._autoextend_thread = _AutoextendThread(self, timeout=timeout)
+        self._autoextend_thread.start()
+        return self._autoextend_thread
+
+    def stop_autoextend(self) -> None:
+        """
+        Stop the autoextending thread
+        """
+        if self._autoextend_thread:
+            self._autoextend_thread.released.set()
+            self._autoextend_thread = None
+
+    def _acquire(
+        self, retry_times: Optional[int] = None, timeout: Optional[float] = None
+    ) -> AcquireResult:
+        """
+        Perform the actions necessary to acquire a lock.
+        If the lock could not be acquired, release all possibly acquired nodes. If
+        `retry_times` is set to a positive integer, sleep :attr:`Lock.retry_delay`
+        miliseconds before trying to acquire it again.
+
+        Each attempt has a deadline after which the lock would be of no use anymore:
+        once the ttl minus the clock drift, or what is left of `timeout`, elapsed.
+        Each request to a node times out at that deadline at the latest, a node that
+        does not reply in time counts as failed and the remaining nodes are not
+        requested. No attempt or delay is started that would end after `timeout`.
+
+        :param retry_times: Amount of times to retry after a failed attempt to acquire.
+            Defaults to :attr:`Lock.retry_times`
+        :param timeout: Time in milliseconds all attempts together may take at most.
+            If `None`, only the ttl bounds each attempt
+        :returns: A float indicating the minimal time in milliseconds the lock can be
+            considered held in case the lock could be acquired. If it could not be
+            acquired because it is held by someone else, a :class:`LockContention`
+            describing the last attempt, else `False`
+        """
+        # pylint: disable=too-many-locals
+        if retry_times is None:
+            retry_times = self.retry_times
+        # bind everything that is constant across rounds to local names once
+        nodes = self.redis_nodes
+        quorum = self.quorum
+        acquire_node = self._acquire_node
+        stats = self._stats
+        ttl = self.ttl
+        drift = self._get_drift()
+        self._contended = []
+        call_start_time = monotonic()
+        for attempt in range(retry_times + 1):
+            if attempt:
+                delay = _retry_delay_ms(self.retry_delay, call_start_time, timeout)
+                if delay is None:
+                    break
+                sleep_ms(delay)
+            budget = _round_budget(ttl - drift, call_start_time, timeout)
+            if budget is None:
+                break
+            previous_lock_key = self.lock_key
+            self.lock_key = self._generate_lock_key()
+            self._contended = []
+            acquired_node_count = 0
+            self._rounds += 1
+            if stats is not None:
+                stats.record_requests(nodes)
+            start_time = end_time = monotonic()
+            deadline = _deadline(start_time, budget)
+
+            for node in nodes:
+                acquired = acquire_node(node, deadline)
+                end_time = monotonic()
+                if _monotonic_delta_ms(end_time, start_time) >= budget:
+                    break
+                if acquired:
+                    acquired_node_count += 1
+
+            validity = _validity(ttl, drift, start_time, end_time)
+
+            if acquired_node_count >= quorum and validity > 0:
+                self.deadline = _deadline(end_time, validity)
+                return validity
+
+            self._map_nodes(self._release_node)
+            self.lock_key = previous_lock_key
+        return _contention(self._contended, len(nodes), quorum)
+
+    def _acquire_blocking(self, timeout: float = -1) -> AcquireResult:
+        """
+        Make a call to :meth:`Lock._acquire` blocking
+
+        :param timeout: If set to a positive value, block for at most this many
+            seconds. If set to `-1`, block indefinitely
+        :returns: Minimal ttl in milliseconds if a lock could be acquired, else the
+            result of the last attempt
+        """
+        timeout_ms = timeout * 1000 if timeout > 0 else None
+
+        time_start = monotonic()
+        while True:  # try to acquire until success or timeout exceeded
+            validity = self._acquire(  # no need to retry in _acquire
+                retry_times=0, timeout=_remaining_ms(time_start, timeout_ms)
+            )
+            if validity:
+                return validity
+            delay = _retry_delay_ms(self.retry_delay, time_start, timeout_ms)
+            if delay is None:
+                return validity
+            sleep_ms(delay)
+
+    def acquire(
+        self,
+        blocking: bool = True,
+        timeout: float = -1,
+        autoextend: bool = True,
+        autoextend_timeout: Optional[float] = None,
+    ) -> AcquireResult:
+        """
+        Attempt to acquire a new lock, blocking or non-blocking.
+
+        :param blocking: If `True`, block until the lock can be acquired
+        :param timeout: If `blocking` is `True` and `timeout` is a positive value,
+            in the case a request would block, block at most `timeout` seconds
+        :param autoextend: If `True` start a thread once the lock is acquired that
+            extends the lock as scheduled by its :class:`RenewalPolicy`
+        :param autoextend_timeout: Timeout in seconds after which the autoextend thread
+            will terminate regardless of the lock status
+        :returns: A float indicating the minimal time the lock can be considered held in
+            milliseconds in case the lock could be acquired. If it could not be acquired
+            because it is held by someone else, a falsy :class:`LockContention`
+            describing the current holder, else `False`
+        :raises ValueError: If `blocking` is `False` and `timeout` is a positive value
+        """
+        start_time = monotonic()
+        self._rounds = 0
+        if blocking:
+            validity = self._acquire_blocking(timeout=timeout)
+        else:
+            if timeout != -1:
+                raise ValueError("Timout must be -1 when requiring non-blocking")
+            validity = self._acquire()
+        self._record_acquire(start_time, self._rounds, validity)
+        if autoextend and validity:
+            self.start_autoextend(timeout=autoextend_timeout)
+
+        return validity
+
+    def _record_acquire(
+        self, start_time: float, rounds: int, validity: AcquireResult
+    ) -> None:
+        """
+        Record a call to acquire the lock with :attr:`Lock.profiler` and the
+        statistics of the factory that created the lock
+
+        :param start_time: Point in time the call started, acquired with
+            :func:`monotonic`
+        :param rounds: Number of rounds the call took
+        :param validity: The result of the call
+        """
+        if self.profiler is not None and self.profiler.sample():
+            end_time = monotonic()
+            self.profiler.record_acquire(
+                self.resource_name,
+                bool(validity),
+                _monotonic_delta_ms(end_time, start_time),
+            )
+            if validity:
+                self._held_since = end_time
+        if self._stats is not None:
+            self._stats.record_acquire(
+                _monotonic_delta_ms(monotonic(), start_time), rounds, validity
+            )
+
+    @_requires_key
+    def extend(
+        self, retry_times: Optional[int] = None, retry_delay: Optional[int] = None
+    ) -> Union[bool, float]:
+        """
+        Extend an acquired lock.
+
+        :param retry_times: Amount of times to retry after a failed attempt to extend.
+            Defaults to :attr:`Lock.retry_times`
+        :param retry_delay: Maximum time in milliseconds to sleep after a failed
+            attempt. Defaults to :attr:`Lock.retry_delay`
+        :returns: A float indicating the minimal time the lock can be considered held
+            in milliseconds in case the lock could be acquired, else `False`
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        if retry_times is None:
+            retry_times = self.retry_times
+        if retry_delay is None:
+            retry_delay = self.retry_delay
+        if self.profiler is not None and self.profiler.sample():
+            self.profiler.record_extend(self.resource_name)
+        for _ in range(retry_times + 1):
+            start_time = monotonic()
+            bumped_count = len([n for n in self._map_quorum(self._bump_node) if n])
+            end_time = monotonic()
+            validity = _validity(self.ttl, self._get_drift(), start_time, end_time)
+            if bumped_count >= self.quorum and validity > 0:
+                self.deadline = _deadline(end_time, validity)
+                if self._stats is not None:
+                    self._stats.record_extend(True)
+                return validity
+            sleep_ms(random.randint(0, retry_delay))
+        if self._stats is not None:
+            self._stats.record_extend(False)
+        return False
+
+    def acquire_or_extend(
+        self,
+        blocking: bool = True,
+        timeout: float = -1,
+        autoextend: bool = True,
+        autoextend_timeout: Optional[float] = None,
+    ) -> AcquireResult:
+        """
+        If the lock is currently not held, try to acquire it. If it is held, extend it.
+        `blocking`, `timeout`, `autoextend` and `autoextend_timeout` will be passed to
+        :meth:`Lock.acquire`.
+
+        :returns: A float indicating the minimal time the lock can be considered held
+            in milliseconds in case the lock could be acquired, else `False`
+        """
+        if self.locked():
+            extended = self.extend()
+            if extended:
+                return extended
+        return self.acquire(
+            blocking=blocking,
+            timeout=timeout,
+            autoextend=autoextend,
+            autoextend_timeout=autoextend_timeout,
+        )
+
+    @_requires_key
+    def handoff(self) -> Lease:
+        """
+        Give up ownership of the lock without releasing it, so that it can be adopted
+        by another :class:`Lock` instance, possibly in another process, via
+        :meth:`Lock.adopt`. This avoids the window in which another client could
+        acquire the lock between a :meth:`Lock.release` and a new :meth:`Lock.acquire`.
+
+        After a successful handoff this instance no longer considers itself the owner
+        of the lock and autoextending is stopped.
+
+        :returns: A :class:`Lease` describing the held lock
+        :raises InvalidOperationError: If the lock was not previously acquired or is
+            not held anymore
+        """
+        self.stop_autoextend()
+        locked, validity_times = self.check_times()
+        if not locked:
+            raise InvalidOperationError("Cannot hand off a lock that is not held")
+        lease = Lease(
+            resource_name=self.resource_name,
+            lock_key=cast(str, self.lock_key),
+            expires_at=time.time() + min(validity_times) / 1000,
+        )
+        self.lock_key = None
+        self.deadline = None
+        self._held_since = None
+        return lease
+
+    def adopt(
+        self,
+        lease: Lease,
+        transfer: bool = False,
+        autoextend: bool = True,
+        autoextend_timeout: Optional[float] = None,
+    ) -> Union[bool, float]:
+        """
+        Take over ownership of a lock handed off with :meth:`Lock.handoff`.
+
+        If `transfer` is `False`, the token of the lease is simply reused and no
+        request to redis is made. If it is `True`, the token is atomically replaced
+        with a new one on each node and the ttl is reset, which makes sure the previous
+        owner cannot interfere with the lock anymore. This costs a single round trip.
+        If the token could not be replaced on a majority of nodes, the nodes that were
+        already transferred are released.
+
+        :param lease: The lease as returned by :meth:`Lock.handoff`
+        :param transfer: If `True`, replace the token of the lock with a new one
+        :param autoextend: If `True` start a thread once the lock is adopted that
+            extends the lock as scheduled by its :class:`RenewalPolicy`
+        :param autoextend_timeout: Timeout in seconds after which the autoextend thread
+            will terminate regardless of the lock status
+        :returns: A float indicating the minimal time the lock can be considered held
+            in milliseconds in case the lock could be adopted, else `False`
+        :raises ValueError: If the lease was created for a different resource
+        """
+        if lease.resource_name != self.resource_name:
+            raise ValueError(
+                f"Cannot adopt lease for {lease.resource_name!r} on lock for "
+                f"{self.resource_name!r}"
+            )
+
+        if not transfer:
+            end_time = monotonic()
+            validity = (lease.expires_at - time.time()) * 1000
+            if validity <= 0:
+                return False
+            self.lock_key = lease.lock_key
+        else:
+            previous_lock_key = self.lock_key
+            self.lock_key = self._generate_lock_key()
+            start_time = monotonic()
+            transferred_count = len(
+                [
+                    n
+                    for n in self._map_nodes(
+                        functools.partial(
+                            self._transfer_node,
+                            previous_lock_key=self._encode(lease.lock_key),
+                        )
+                    )
+                    if n
+                ]
+            )
+            end_time = monotonic()
+            validity = _validity(self.ttl, self._get_drift(), start_time, end_time)
+            if transferred_count < self.quorum or validity <= 0:
+                self._map_nodes(self._release_node)
+                self.lock_key = previous_lock_key
+                return False
+
+        self.deadline = _deadline(end_time, validity)
+        if autoextend:
+            self.start_autoextend(timeout=autoextend_timeout)
+        return validity
+
+    @_requires_key
+    def check_times(self) -> Tuple[bool, List[float]]:
+        """
+        Check if the lock is still held and the time to live on each node, accounting
+        for clock drift and request time.
+
+        :returns: A tuple consisting of a boolean, indicating if the lock can still be
+            considered held and a list of the reported times in milliseconds of each
+            node
+        :raises InvalidOperationError: If the lock was not previously acquired
+        """
+        start_time = monotonic()
+        reported_ttls = self._map_quorum(self._get_ttl_from_node)
+        end_time = monotonic()
+        # Compute times taking into account how long it took to query all
+        # the nodes as well as clock drift constant
+        times = _remaining_ttls(reported_ttls, self._get_drift(), start_time, end_time)
+        if len(times) > 0:
+            return min(times) > 0 and len(times) >= self.quorum, times
+        return False, []
+
+    @_requires_key
+    def release(self) -> bool:
+        """
+        Release the lock.
+        A lock is considered released if the action to release it could be performed
+        sucessfully on the majority of redis nodes. So unlike Python's
+        :class:`threading.Lock` this can fail for reasons other than the lock not being
+        held in the first place.
+
+        :raises InvalidOperationError: If the lock was not previously acquired
+        :returns: Whether or not the lock was successfully released
+        """
+        self.stop_autoextend()
+        self.deadline = None
+        if self.profiler is not None and self._held_since is not None:
+            self.profiler.record_release(
+                self.resource_name, _monotonic_delta_ms(monotonic(), self._held_since)
+            )
+            self._held_since = None
+        released_nodes = self._map_quorum(self._release_node)
+        return len([x for x in released_nodes if x]) >= self.quorum
+
+    def locked(self) -> bool:
+        """
+        Check if the lock is still held.
+
+        :returns: `True` if the lock has previously been acquired and the smallest
+            reported time to live of any node is positive, `False` otherwise.
+        """
+        return self.lock_key is not None and self.check_times()[0]
+
+    def _require_deadline(self) -> float:
+        """
+        :returns: :attr:`Lock.deadline`
+        :raises InvalidOperationError: If the lock is not held
+        """
+        if self.deadline is None:
+            raise InvalidOperationError("Cannot guard work without holding the lock")
+        return self.deadline
+
+    @contextlib.contextmanager
+    def guard(
+        self, on_expire: Optional[Callable[[], Any]] = None, margin: float = 0.0
+    ) -> Iterator[threading.Event]:
+        """
+        Guard a critical section against running past the validity of the lock.
+        A watcher thread waits until :attr:`Lock.deadline` minus `margin` is reached,
+        following updates of the deadline by extending the lock. If the section is
+        still running then, `on_expire` is called from the watcher thread and the
+        yielded event is set, so long running work can check it and abort early.
+        Leaving the section after the lock expired raises a
+        :class:`LockExpiredError` ::
+
+            with lock:
+                with lock.guard() as expired:
+                    for item in items:
+                        if expired.is_set():
+                            break
+                        process(item)
+
+        No requests to redis are made to track the deadline.
+
+        :param on_expire: Callable without arguments to be called once the lock
+            expired
+        :param margin: Time in seconds before the deadline at which the lock should
+            already be considered expired
+        :returns: An event which is set once the lock expired
+        :raises InvalidOperationError: If the lock is not held
+        :raises LockExpiredError: If the lock expired before the section was left
+        """
+        self._require_deadline()
+        expired = threading.Event()
+        done = threading.Event()
+
+        def watch() -> None:
+            while True:
+                deadline = self.deadline
+                if deadline is None:
+                    return  # released from within the section
+                if done.wait(max(deadline - margin - time.monotonic(), 0)):
+                    return
+                if self.deadline == deadline:  # not extended in the meantime
+                    break
+            expired.set()
+            if on_expire is not None:
+                on_expire()
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        try:
+            yield expired
+        finally:
+            done.set()
+            watcher.join()
+        if expired.is_set():
+            raise LockExpiredError(
+                f"Lock for {self.resource_name!r} expired before the guarded section "
+                "was left"
+            )
+
+    def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run `func` with the given arguments in a worker thread and wait for it to
+        finish as long as the lock is valid, following updates of
+        :attr:`Lock.deadline` by extending the lock. No requests to redis are made
+        to track the deadline.
+
+        Since threads cannot be killed, the worker keeps running in the background
+        if the lock expires. Use :meth:`Lock.guard` if the work should be able to
+        abort itself.
+
+        :param func: Callable to run
+        :returns: The return value of `func`. Exceptions raised by it are re-raised
+        :raises InvalidOperationError: If the lock is not held
+        :raises LockExpiredError: If the lock expired before `func` returned
+        """
+        deadline: Optional[float] = self._require_deadline()
+        future: "Future[T]" = Future()
+
+        def work() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as exc:  # pylint: disable=broad-except
+                future.set_exception(exc)
+
+        threading.Thread(target=work, daemon=True).start()
+        while deadline is not None:
+            try:
+                return future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FuturesTimeoutError:
+                if self.deadline == deadline:  # not extended in the meantime
+                    break
+                deadline = self.deadline
+        raise LockExpiredError(
+            f"Lock for {self.resource_name!r} expired before {func!r} returned"
+        )
+
+
+class SingleNodeLock(Lock):
+    # pylint: disable=too-few-public-methods
+    """
+    A :class:`Lock` that can be used with a single redis node, with the same API,
+    scripts and autoextend behaviour at one round trip per operation without
+    starting any threads for the request.
+
+    This gives up the guarantees of redlock: if the node fails over to a replica
+    before the lock was replicated, or loses its data on restart, the lock can be
+    acquired by another client while it is still held. Only use it for resources where
+    latency matters more than safety. If created with more than one node, a majority
+    of them is required.
+    """
+
+    min_nodes = 1
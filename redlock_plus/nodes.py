@@ -0,0 +1,773 @@
+"""
+Initialisation and process wide sharing of the redis nodes.
+"""
+
+import math
+import time
+import threading
+import weakref
+import functools
+import collections
+from typing import (
+    Union,
+    Optional,
+    Tuple,
+    List,
+    Any,
+    Dict,
+    Deque,
+    Sequence,
+    Set,
+    Type,
+)
+
+import redis
+
+from redlock_plus._util import (
+    _FORK_SAFE,
+    _map_concurrently,
+    _node_to_pool_details,
+    _reset_connection_pools,
+)
+from redlock_plus.scripts import (
+    FUNCTION_LIBRARY_CODE,
+    FUNCTION_LIBRARY_NAME,
+    _FUNCTION_LIBRARY_PATTERN,
+    _NODE_SCRIPTS,
+    _function_name,
+)
+
+
+class NodeLatency:
+    """
+    Estimate the latency of requests to a redis node from an exponentially weighted
+    moving average of their durations and of their deviation from it, the way TCP
+    estimates round trip times. Every node initialised by :func:`init_redis_nodes`
+    has one as its ``redlock_latency`` attribute, used by locks created with
+    ``hedge=True``.
+
+    Updates are not synchronised, so concurrent updates may occasionally be lost,
+    which an estimate can tolerate.
+
+    :param alpha: Weight of a new duration in the average
+    :param beta: Weight of a new deviation in the average deviation
+    """
+
+    def __init__(self, alpha: float = 0.125, beta: float = 0.25):
+        self.alpha = alpha
+        self.beta = beta
+        #: Average duration of a request in milliseconds, `None` before the first
+        self.mean: Optional[float] = None
+        #: Average deviation of a request from :attr:`NodeLatency.mean`
+        self.deviation = 0.0
+
+    def record(self, duration: float) -> None:
+        """
+        Record the duration of a request.
+
+        :param duration: Duration of the request in milliseconds
+        """
+        mean = self.mean
+        if mean is None:
+            self.mean = duration
+            self.deviation = duration / 2
+            return
+        self.deviation += self.beta * (abs(duration - mean) - self.deviation)
+        self.mean = mean + self.alpha * (duration - mean)
+
+    @property
+    def p95(self) -> float:
+        """
+        Estimated 95th percentile of the duration of a request in milliseconds,
+        infinite before the first request was recorded
+        """
+        if self.mean is None:
+            return math.inf
+        # for normally distributed durations, the 95th percentile is 1.645 standard
+        # deviations above the mean, which is about twice the mean absolute deviation
+        return self.mean + 2 * self.deviation
+
+
+def init_redis_nodes(
+    connection_details: Sequence[Union[Dict[str, Any], redis.StrictRedis]],
+    functions: bool = False,
+) -> List[redis.StrictRedis]:
+    """
+    Initialise redis nodes by adding lua scripts to release, bump and check locks,
+    a :class:`NodeLatency` estimating their latency, a subscriber sharing a single
+    pub/sub connection between all waiters on the node and the clients sending
+    requests that time out, with a connection pool per timeout.
+    If passed a list of dictionaries, create :class:`redis.StrictRedis` instances
+    from them first.
+
+    :param connection_details: Redis client instances or dicts that can be used to
+        create a redis client
+    :param functions: If `True`, install the scripts as the redis function library
+        :data:`FUNCTION_LIBRARY_NAME` and call them with `FCALL`. Unlike scripts
+        called with `EVALSHA`, functions are persisted and replicated, so they do not
+        need to be loaded again after a restart or failover. Nodes running a version
+        of Redis before 7 fall back to scripts
+    """
+
+    redis_nodes: List[redis.StrictRedis] = []
+
+    for conn in connection_details:
+        if isinstance(conn, redis.StrictRedis):
+            node = conn
+        elif "url" in conn:
+            conn = {**conn}
+            node = redis.StrictRedis.from_url(conn.pop("url"), **conn)
+        else:
+            node = redis.StrictRedis(**conn)
+        if not hasattr(node, "redlock_latency"):
+            node.redlock_latency = NodeLatency()  # type: ignore
+        if not hasattr(node, "redlock_subscriber"):
+            node.redlock_subscriber = _NodeSubscriber(node)  # type: ignore
+        if not hasattr(node, "redlock_bounded_clients"):
+            node.redlock_bounded_clients = _BoundedClients(node)  # type: ignore
+        if functions and _load_function_library(node, delete_other_versions=True):
+            for attribute in _NODE_SCRIPTS:
+                setattr(node, attribute, _FunctionCaller(node, attribute))
+        else:
+            _register_scripts(node)
+        redis_nodes.append(node)
+    return redis_nodes
+
+
+def _register_scripts(node: redis.StrictRedis) -> None:
+    """
+    Add the lua scripts of :data:`_NODE_SCRIPTS` to a node, called with `EVALSHA`
+
+    :param node: A redis client instance
+    """
+    for attribute, source in _NODE_SCRIPTS.items():
+        setattr(node, attribute, node.register_script(source))
+
+
+def _is_unknown_command(error: redis.exceptions.ResponseError) -> bool:
+    """
+    :returns: Whether the error was returned by a node not supporting the command,
+        e.g. `FCALL` on a version of Redis before 7
+    """
+    return "unknown command" in str(error).lower()
+
+
+def _load_function_library(
+    node: redis.StrictRedis, delete_other_versions: bool = False
+) -> bool:
+    """
+    Install the function library on a node unless it is already installed
+
+    :param node: A redis client instance
+    :param delete_other_versions: If `True` and the library was installed, delete the
+        libraries of other versions, see :func:`_delete_function_libraries`
+    :returns: `False` if the node does not support functions, `True` otherwise. If the
+        node could not be reached, the library is installed on first use instead, and
+        a node not supporting functions falls back to scripts then
+    """
+    try:
+        node.execute_command("FUNCTION", "LOAD", FUNCTION_LIBRARY_CODE)  # type: ignore
+    except redis.exceptions.ResponseError as error:
+        if _is_unknown_command(error):
+            return False
+        if "already exists" not in str(error):
+            raise
+    except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+        pass
+    else:
+        if delete_other_versions:
+            _delete_function_libraries(node)
+    return True
+
+
+def _delete_function_libraries(node: redis.StrictRedis) -> None:
+    """
+    Delete the function libraries of versions other than :data:`FUNCTION_LIBRARY_NAME`
+    from a node, so they do not pile up with every upgrade. This is only done when
+    initialising nodes: a client reinstalling its library on a call, because a newer
+    version deleted it, must not delete the newer one in turn.
+
+    :param node: A redis client instance
+    """
+    try:
+        libraries = node.execute_command(  # type: ignore
+            "FUNCTION", "LIST", "LIBRARYNAME", "redlock_plus_*"
+        )
+        for library in libraries:
+            info = {
+                key.decode() if isinstance(key, bytes) else key: value
+                for key, value in zip(library[::2], library[1::2])
+            }
+            name = info.get("library_name")
+            if isinstance(name, bytes):
+                name = name.decode(errors="replace")
+            if name == FUNCTION_LIBRARY_NAME or not (
+                isinstance(name, str) and _FUNCTION_LIBRARY_PATTERN.fullmatch(name)
+            ):
+                continue
+            try:
+                node.execute_command("FUNCTION", "DELETE", name)  # type: ignore
+            except redis.exceptions.ResponseError as error:
+                # deleted by another client in the meantime
+                if "not found" not in str(error).lower():
+                    raise
+    except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+        pass
+
+
+class _FunctionCaller:
+    # pylint: disable=too-few-public-methods
+    """
+    Call a function of the library installed by :func:`init_redis_nodes`. Shares the
+    call signature of :class:`redis.client.Script`, so it can be used in its place.
+    If the node turns out not to support functions, because it could not be reached
+    when it was initialised, all scripts of the node are registered as
+    :class:`redis.client.Script` instead and the call is retried with those
+
+    :param node: The redis client to call the function on by default
+    :param attribute: Key of the script in _NODE_SCRIPTS
+    """
+
+    def __init__(self, node: redis.StrictRedis, attribute: str):
+        self.node = node
+        self.attribute = attribute
+        self.name = _function_name(attribute)
+
+    def __call__(
+        self,
+        keys: Sequence[Any] = (),
+        args: Sequence[Any] = (),
+        client: Optional[redis.StrictRedis] = None,
+    ) -> Any:
+        client = client if client is not None else self.node
+        command = ("FCALL", self.name, len(keys), *keys, *args)
+        if isinstance(client, redis.client.Pipeline):
+            return client.execute_command(*command)  # type: ignore
+        try:
+            return client.execute_command(*command)  # type: ignore
+        except redis.exceptions.ResponseError as error:
+            if _is_unknown_command(error):
+                _register_scripts(self.node)
+                script = getattr(self.node, self.attribute)
+                return script(keys=keys, args=args, client=client)
+            # the node lost its data, e.g. if it was replaced by an empty one
+            if "Function not found" not in str(error):
+                raise
+            _load_function_library(client)
+            return client.execute_command(*command)  # type: ignore
+
+
+class _BoundedClient(redis.StrictRedis):
+    """
+    Client with a connection pool of its own, created from the connection details of
+    a node, whose connections give up waiting for a reply after `timeout` seconds.
+    Created by :class:`_BoundedClients`, so locks with different ttls share the
+    connection pool of the node itself and only requests with the same timeout share
+    these.
+
+    Connecting keeps the ``socket_connect_timeout`` of the node: with short ttls the
+    timeout of a request can be as low as 10 milliseconds, which a TCP or TLS
+    handshake with a remote node may not finish in, so every new connection would
+    fail. Set ``socket_connect_timeout`` on the node to bound connecting as well.
+    Connections over unix sockets connect with the socket timeout, i.e. `timeout`.
+
+    :param node: The redis client whose connection details to use
+    :param timeout: Time in seconds each read may take
+    """
+
+    def __init__(self, node: redis.StrictRedis, timeout: float):
+        connection_class, connection_kwargs = _node_to_pool_details(node)
+        connection_kwargs["socket_timeout"] = timeout
+        connection_kwargs["retry_on_timeout"] = False
+        super().__init__(
+            connection_pool=redis.ConnectionPool(
+                connection_class=connection_class, **connection_kwargs
+            )
+        )
+        self.timeout = timeout
+
+    def execute_within(self, timeout: float, *args: Any, **options: Any) -> Any:
+        """
+        Send a command to the node and return its parsed reply like
+        :meth:`redis.StrictRedis.execute_command`, waiting at most `timeout` seconds
+        for the reply to start, if less than the timeout of the client
+
+        :raises redis.exceptions.TimeoutError: If the reply did not arrive in time
+        """
+        pool = self.connection_pool
+        command_name = args[0]
+        connection = pool.get_connection(command_name, **options)
+        try:
+            connection.send_command(*args)
+            # waits like a pub/sub connection polling for messages, the rest of the
+            # reply is read with the socket timeout of the connection
+            if timeout < self.timeout and not connection.can_read(timeout=timeout):
+                raise redis.exceptions.TimeoutError("Timeout reading from socket")
+            return self.parse_response(connection, command_name, **options)
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            # a late reply must not be read as the reply to the next command
+            connection.disconnect()
+            raise
+        finally:
+            pool.release(connection)
+
+
+class _BoundedClients:
+    """
+    The :class:`_BoundedClient` instances of a node, one per timeout, created on first
+    use. Every node initialised by :func:`init_redis_nodes` has one as its
+    ``redlock_bounded_clients`` attribute.
+
+    :param node: An initialised redis client instance
+    :param client_class: The class of the created clients, called with the node and
+        the timeout
+    """
+
+    def __init__(
+        self,
+        node: redis.StrictRedis,
+        client_class: Type[_BoundedClient] = _BoundedClient,
+    ) -> None:
+        self.node = node
+        self.client_class = client_class
+        self._clients: Dict[float, _BoundedClient] = {}
+        self._lock = threading.Lock()
+        _FORK_SAFE.add(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        _reset_connection_pools(list(self._clients.values()))
+
+    def get(self, timeout: float) -> _BoundedClient:
+        """
+        :param timeout: Time in seconds each read may take
+        :returns: The client for `timeout`
+        """
+        client = self._clients.get(timeout)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(timeout)
+                if client is None:
+                    client = self._clients[timeout] = self.client_class(
+                        self.node, timeout
+                    )
+        return client
+
+    def close(self) -> None:
+        """
+        Disconnect the connection pools of all clients
+        """
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.connection_pool.disconnect()
+
+
+def _bounded_pipeline(node: redis.StrictRedis, timeout: float) -> redis.client.Pipeline:
+    """
+    :param node: An initialised redis client instance
+    :param timeout: Time in seconds each read may take
+    :returns: A pipeline without a transaction sending its commands to `node` over a
+        connection whose reads time out after `timeout` seconds, see
+        :class:`_BoundedClient`
+    """
+    client = node.redlock_bounded_clients.get(timeout)  # type: ignore
+    return client.pipeline(transaction=False)
+
+
+class _TimeoutClient:
+    """
+    Stand-in for a redis client to pass as the ``client`` of a script or
+    :class:`_FunctionCaller`, which gives up on a call to a node after `timeout`
+    seconds. Each read from the node is bounded by `timeout`, and the reply has to
+    start arriving by `deadline` as well. Connecting to the node is bounded by its own
+    ``socket_connect_timeout`` only, see :class:`_BoundedClient`. Unlike the socket
+    timeout of the connection pool of the node, this only applies to the calls made
+    through it: they are sent over the pool of the :class:`_BoundedClient` of the node
+    for `timeout`.
+
+    :param node: An initialised redis client instance
+    :param timeout: Time in seconds a call may take
+    :param deadline: Point in time of :func:`time.monotonic` in seconds after which
+        no call may take any longer, e.g. the end of an acquire round
+    """
+
+    __slots__ = ("node", "timeout", "deadline")
+
+    def __init__(
+        self, node: redis.StrictRedis, timeout: float, deadline: Optional[float] = None
+    ):
+        self.node = node
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def execute_command(self, *args: Any, **options: Any) -> Any:
+        """
+        Send a command to the node and return its parsed reply like
+        :meth:`redis.StrictRedis.execute_command`
+
+        :raises redis.exceptions.TimeoutError: If the reply did not arrive in time
+        """
+        timeout = self.timeout
+        if self.deadline is not None:
+            timeout = min(timeout, self.deadline - time.monotonic())
+        if timeout <= 0:
+            raise redis.exceptions.TimeoutError("Timeout before sending the command")
+        client = self.node.redlock_bounded_clients.get(self.timeout)  # type: ignore
+        return client.execute_within(timeout, *args, **options)
+
+    def evalsha(self, sha: str, numkeys: int, *keys_and_args: Any) -> Any:
+        """
+        Call a script by its SHA1 digest, see :meth:`redis.StrictRedis.evalsha`
+        """
+        return self.execute_command("EVALSHA", sha, numkeys, *keys_and_args)
+
+    def script_load(self, script: str) -> str:
+        """
+        Load a script, see :meth:`redis.StrictRedis.script_load`
+        """
+        return self.execute_command("SCRIPT LOAD", script)
+
+
+def _uses_functions(nodes: List[redis.StrictRedis]) -> bool:
+    """
+    :returns: `True` if the nodes were initialised with `functions=True`
+    """
+    return any(
+        isinstance(getattr(node, "redlock_acquire_script", None), _FunctionCaller)
+        for node in nodes
+    )
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Convert dicts, lists and sets nested in `value` into hashable equivalents
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+
+class NodeRegistry:
+    """
+    Process wide cache of redis nodes created with :func:`init_redis_nodes`, so that
+    locks and factories created from equal connection details share their clients
+    and connection pools instead of each creating their own.
+
+    Nodes are reference counted: each call to :meth:`NodeRegistry.acquire` must be
+    matched by a call to :meth:`NodeRegistry.release`, and the connection pools of
+    the nodes are disconnected once the last reference was released. :class:`Lock`
+    and :class:`LockFactory` do this automatically via :data:`NODE_REGISTRY` when
+    created from connection details.
+    """
+
+    def __init__(self) -> None:
+        self._nodes: Dict[Any, List[redis.StrictRedis]] = {}
+        self._refcounts: Dict[Any, int] = {}
+        # connection details the nodes were created from, by registry key
+        self._details: Dict[Any, List[Dict[str, Any]]] = {}
+        # registry keys by the id of the node lists handed out
+        self._keys: Dict[int, Any] = {}
+        self._pending: Deque[List[redis.StrictRedis]] = collections.deque()
+        self._lock = threading.Lock()
+        _FORK_SAFE.add(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        for nodes in self._nodes.values():
+            _reset_connection_pools(nodes)
+
+    @staticmethod
+    def _key(
+        connection_details: Sequence[Union[Dict[str, Any], redis.StrictRedis]],
+        functions: bool = False,
+    ) -> Optional[Tuple[Any, ...]]:
+        """
+        :returns: A hashable key normalising the order of parameters, or `None` if the
+            connection details cannot be cached because they contain client instances
+            or unhashable values
+        """
+        if any(isinstance(conn, redis.StrictRedis) for conn in connection_details):
+            return None
+        key = (functions, *(_freeze(conn) for conn in connection_details))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def acquire(
+        self,
+        connection_details: Sequence[Union[Dict[str, Any], redis.StrictRedis]],
+        functions: bool = False,
+    ) -> List[redis.StrictRedis]:
+        """
+        Get the shared nodes for `connection_details`, creating them if necessary,
+        and increment their reference count. Client instances contained in
+        `connection_details` are already shared by the caller, in which case new,
+        untracked nodes are returned.
+
+        :param connection_details: See :func:`init_redis_nodes`
+        :param functions: See :func:`init_redis_nodes`. Nodes initialised with and
+            without functions are not shared
+        :returns: The initialised redis nodes
+        """
+        key = self._key(connection_details, functions)
+        if key is None:
+            return init_redis_nodes(connection_details, functions)
+        with self._lock:
+            unused = self._release_pending()
+            nodes = self._nodes.get(key)
+            if nodes is None:
+                nodes = self._nodes[key] = init_redis_nodes(
+                    connection_details, functions
+                )
+                self._keys[id(nodes)] = key
+                self._details[key] = [dict(conn) for conn in connection_details]
+            self._refcounts[key] = self._refcounts.get(key, 0) + 1
+        self._disconnect(unused)
+        return nodes
+
+    def release(self, nodes: List[redis.StrictRedis]) -> None:
+        """
+        Decrement the reference count of nodes returned by
+        :meth:`NodeRegistry.acquire` and disconnect their connection pools once it
+        reaches zero. Nodes not tracked by the registry are ignored.
+
+        :param nodes: The list of nodes as returned by :meth:`NodeRegistry.acquire`
+        """
+        with self._lock:
+            unused = self._release_pending()
+            if self._decrement(nodes):
+                unused.append(nodes)
+        self._disconnect(unused)
+
+    def release_later(self, nodes: List[redis.StrictRedis]) -> None:
+        """
+        Like :meth:`NodeRegistry.release`, but deferred to the next call to any
+        method of the registry. This is safe to call from finalizers, which may run
+        during garbage collection while the registry is in use.
+        """
+        self._pending.append(nodes)
+
+    def connection_details(
+        self, nodes: List[redis.StrictRedis]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        :param nodes: The list of nodes as returned by :meth:`NodeRegistry.acquire`
+        :returns: The connection details `nodes` were created from, or `None` if they
+            are not tracked
+        """
+        with self._lock:
+            unused = self._release_pending()
+            key = self._keys.get(id(nodes))
+            details = None if key is None else [dict(d) for d in self._details[key]]
+        self._disconnect(unused)
+        return details
+
+    def refcount(self, nodes: List[redis.StrictRedis]) -> int:
+        """
+        :returns: The number of references held to `nodes`, `0` if they are not
+            tracked
+        """
+        with self._lock:
+            unused = self._release_pending()
+            key = self._keys.get(id(nodes))
+            count = 0 if key is None else self._refcounts[key]
+        self._disconnect(unused)
+        return count
+
+    def _decrement(self, nodes: List[redis.StrictRedis]) -> bool:
+        """
+        Decrement the reference count of `nodes`, the caller must hold the lock.
+
+        :returns: Whether the nodes are not used anymore and should be disconnected
+        """
+        key = self._keys.get(id(nodes))
+        if key is None or self._nodes[key] is not nodes:
+            return False
+        self._refcounts[key] -= 1
+        if self._refcounts[key] > 0:
+            return False
+        del self._nodes[key], self._refcounts[key], self._keys[id(nodes)]
+        del self._details[key]
+        return True
+
+    def _release_pending(self) -> List[List[redis.StrictRedis]]:
+        """
+        Process releases deferred by :meth:`NodeRegistry.release_later`, the caller
+        must hold the lock.
+
+        :returns: Nodes that are not used anymore and should be disconnected
+        """
+        unused = []
+        while self._pending:
+            nodes = self._pending.popleft()
+            if self._decrement(nodes):
+                unused.append(nodes)
+        return unused
+
+    @staticmethod
+    def _disconnect(unused: List[List[redis.StrictRedis]]) -> None:
+        nodes = [node for node_list in unused for node in node_list]
+        if nodes:
+            list(_map_concurrently(_disconnect_node, nodes))
+
+
+def _disconnect_node(node: redis.StrictRedis) -> None:
+    """
+    Close the pub/sub connection and disconnect the connection pools of a node
+    """
+    node.redlock_subscriber.close()  # type: ignore
+    node.redlock_bounded_clients.close()  # type: ignore
+    node.connection_pool.disconnect()
+
+
+#: The :class:`NodeRegistry` used by all locks and factories of the process
+NODE_REGISTRY = NodeRegistry()
+
+
+def _shared_nodes(
+    owner: Any,
+    connection_details: Optional[List[Dict[str, Any]]],
+    nodes: Optional[List[redis.StrictRedis]],
+    **kwargs: Any,
+) -> Tuple[List[redis.StrictRedis], Optional[weakref.finalize]]:
+    """
+    Return `nodes` if given, else acquire the nodes for `connection_details` from
+    :data:`NODE_REGISTRY` and release them once `owner` is garbage collected
+
+    :param owner: The object using the nodes
+    :param connection_details: Connection details of the nodes
+    :param nodes: Already initialised redis nodes. Takes precedence over
+        `connection_details`
+    :param kwargs: Passed on to :meth:`NodeRegistry.acquire`
+    :returns: The nodes and the finalizer releasing them, `None` if `nodes` was given
+    :raises ValueError: If neither `connection_details` nor `nodes` is given
+    """
+    if nodes is not None:
+        return nodes, None
+    if connection_details is None:
+        raise ValueError("Either 'connection_details' or 'nodes' must be specified")
+    nodes = NODE_REGISTRY.acquire(connection_details, **kwargs)
+    return nodes, weakref.finalize(owner, NODE_REGISTRY.release_later, nodes)
+
+
+# Interval in seconds in which threads listening for wakeup messages check if they
+# should terminate. Messages themselves are handled as soon as they arrive
+_PUBSUB_POLL_INTERVAL: float = 0.05
+
+
+class _NodeSubscriber:
+    """
+    Share a single pub/sub connection to a redis node, and the thread listening on
+    it, between all subscriptions to channels of the node. Every node initialised by
+    :func:`init_redis_nodes` has one as its ``redlock_subscriber`` attribute.
+
+    The connection is opened by the first subscription and closed once the last one
+    ended, or when :class:`NodeRegistry` disconnects the node. If the connection was
+    lost, the next subscription opens a new one and subscribes to all channels again.
+
+    :param node: An initialised redis client instance
+    """
+
+    def __init__(self, node: redis.StrictRedis) -> None:
+        self.node = node
+        # events to set whenever a message arrives, by channel
+        self._events: Dict[str, Set[threading.Event]] = {}
+        self._pubsub: Any = None
+        self._thread: Any = None
+        self._lock = threading.Lock()
+        _FORK_SAFE.add(self)
+
+    def _after_fork(self) -> None:
+        # the listening thread does not exist in the child
+        self._lock = threading.Lock()
+        self._events = {}
+        self._pubsub = None
+        self._thread = None
+
+    def _handle_message(self, channel: str, _message: Dict[str, Any]) -> None:
+        with self._lock:
+            events = list(self._events.get(channel, ()))
+        for event in events:
+            event.set()
+
+    def subscribe(self, channel: str, event: threading.Event) -> None:
+        """
+        Set `event` whenever a message is published to `channel` on the node
+
+        :param channel: Name of the channel
+        :param event: The event to set
+        :raises redis.exceptions.ConnectionError: If the node could not be reached
+        :raises redis.exceptions.TimeoutError: If the node did not respond in time
+        """
+        with self._lock:
+            if self._thread is not None and not self._thread.is_alive():
+                self._close()  # the thread terminated after losing the connection
+            if self._pubsub is None:
+                pubsub = self.node.pubsub(ignore_subscribe_messages=True)
+                channels = {channel, *self._events}
+            else:
+                pubsub = self._pubsub
+                channels = set() if channel in self._events else {channel}
+            if channels:
+                pubsub.subscribe(
+                    **{
+                        name: functools.partial(self._handle_message, name)
+                        for name in channels
+                    }
+                )
+            if self._thread is None:
+                self._thread = pubsub.run_in_thread(  # type: ignore
+                    sleep_time=_PUBSUB_POLL_INTERVAL, daemon=True
+                )
+            self._pubsub = pubsub
+            self._events.setdefault(channel, set()).add(event)
+
+    def unsubscribe(self, channel: str, event: threading.Event) -> None:
+        """
+        Stop setting `event` for messages published to `channel`. The channel is
+        unsubscribed from once no events are left for it, and the connection is closed
+        once no channels are left.
+
+        :param channel: Name of the channel
+        :param event: The event passed to :meth:`_NodeSubscriber.subscribe`
+        """
+        with self._lock:
+            events = self._events.get(channel)
+            if events is None:
+                return
+            events.discard(event)
+            if events:
+                return
+            del self._events[channel]
+            if not self._events:
+                self._close()
+            elif self._pubsub is not None:
+                try:
+                    self._pubsub.unsubscribe(channel)
+                except (
+                    redis.exceptions.ConnectionError,
+                    redis.exceptions.TimeoutError,
+                ):
+                    pass
+
+    def close(self) -> None:
+        """
+        Stop the listening thread, which closes the pub/sub connection
+        """
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()  # closes the connection once the thread terminates
+            if not self._thread.is_alive():
+                self._pubsub.close()
+        self._pubsub = None
+        self._thread = None
@@ -0,0 +1,268 @@
+"""
+Rate limiters sharing their limits across processes through the redis nodes.
+"""
+
+import abc
+import math
+import functools
+from typing import Union, Optional, Tuple, List, Any, Dict, NamedTuple
+
+import redis
+
+from redlock_plus._util import (
+    _DEFAULT_TTL,
+    _map_concurrently,
+    _monotonic_ms,
+    _node_timeout,
+    sleep_ms,
+)
+from redlock_plus.exceptions import InsufficientNodesError
+from redlock_plus.nodes import NODE_REGISTRY, _TimeoutClient, _shared_nodes
+
+
+class RateLimitResult(NamedTuple):
+    """
+    Returned by :meth:`RateLimiter.acquire`. It evaluates to `allowed`, so it can be
+    used in place of a boolean result.
+
+    :param allowed: `True` if the tokens were taken
+    :param remaining: Number of tokens that can still be taken right away
+    :param retry_after: Estimated time in milliseconds after which the requested tokens
+        will be available, `0` if they were taken. `None` if too few nodes could be
+        reached
+    """
+
+    allowed: bool
+    remaining: int
+    retry_after: Optional[float]
+
+    def __bool__(self) -> bool:
+        return self.allowed
+
+
+class RateLimiter(abc.ABC):
+    # pylint: disable=too-few-public-methods
+    """
+    Base class of rate limiters, which hand out tokens through a Lua script evaluated
+    on the redis nodes. A request costs a single round trip, and a node that denies it
+    does not write anything.
+
+    In quorum mode the script runs on all nodes concurrently and tokens are granted if
+    the majority of nodes granted them. Nodes that granted a request denied by the
+    majority still write, since tokens taken on a minority of nodes are not given
+    back, so on a split decision the limiter errs on the side of denying. With
+    `quorum=False`, only the first node that can be reached is used. This is faster and
+    cheaper, but the limit is not kept if clients fail over to different nodes.
+
+    :param name: Global identifier to be used for the limiter. This will be shared
+        across all redis nodes
+    :param connection_details: A list containing either redis client instances or dicts
+        that can be used to create a redis client. If `None`, `nodes` must not be `None`
+    :param nodes: A list containing already initialised redis nodes. Takes precedence
+        over `connection_details`. If `None`, `connection_details` must not be `None`
+    :param quorum: If `True`, require a majority of nodes to grant tokens, else use a
+        single node
+    :param request_timeout: Time in seconds after which a request to a single node
+        times out. Defaults to the timeout of the requests of a
+        :class:`~redlock_plus.Lock` with the default ttl
+    """
+
+    #: Name of the node attribute holding the registered script
+    script_name: str = ""
+
+    def __init__(
+        self,
+        name: str,
+        connection_details: Union[List[Dict[str, Any]], None] = None,
+        nodes: Optional[List[redis.StrictRedis]] = None,
+        quorum: bool = True,
+        request_timeout: Optional[float] = None,
+    ):
+        # pylint: disable=too-many-arguments
+        self.name = name
+        self.request_timeout = (
+            _node_timeout(_DEFAULT_TTL) if request_timeout is None else request_timeout
+        )
+
+        nodes, self._finalizer = _shared_nodes(self, connection_details, nodes)
+
+        if quorum and len(nodes) < 3:
+            raise InsufficientNodesError(len(nodes))
+        if not nodes:
+            raise ValueError("At least one redis node is required")
+
+        self.redis_nodes: List[redis.StrictRedis] = nodes
+        self.quorum: int = max(3, len(self.redis_nodes) // 2 + 1) if quorum else 1
+
+    def close(self) -> None:
+        """
+        Give up the reference to the redis nodes shared through
+        :data:`NODE_REGISTRY`, if the limiter was created from connection details.
+        This happens automatically once the limiter is garbage collected.
+        """
+        if self._finalizer is not None and self._finalizer.detach():
+            NODE_REGISTRY.release(self.redis_nodes)
+
+    @abc.abstractmethod
+    def _script_args(self, tokens: int) -> List[Any]:
+        """
+        :param tokens: Number of requested tokens
+        :returns: The arguments to call the script with
+        """
+
+    @abc.abstractmethod
+    def _max_tokens(self) -> int:
+        """
+        :returns: The maximum number of tokens the limiter allows at once
+        """
+
+    def _acquire_node(
+        self, node: redis.StrictRedis, tokens: int
+    ) -> Optional[Tuple[int, int, int]]:
+        """
+        Take tokens on a single redis node
+
+        :param node: An initialised redis client instance
+        :param tokens: Number of requested tokens
+        :returns: The reply of the script, or `None` if the node could not be reached
+        """
+        try:
+            allowed, remaining, retry_after = getattr(node, self.script_name)(
+                keys=[self.name],
+                args=self._script_args(tokens),
+                client=_TimeoutClient(node, self.request_timeout),
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return None
+        return int(allowed), int(remaining), int(retry_after)
+
+    def _acquire(self, tokens: int) -> RateLimitResult:
+        """
+        Take tokens once, on a single node or a quorum of nodes
+
+        :param tokens: Number of requested tokens
+        """
+        if self.quorum == 1:
+            for node in self.redis_nodes:
+                reply = self._acquire_node(node, tokens)
+                if reply is not None:
+                    allowed, remaining, retry_after = reply
+                    return RateLimitResult(
+                        bool(allowed),
+                        remaining,
+                        None if retry_after < 0 else float(retry_after),
+                    )
+            return RateLimitResult(False, 0, None)
+
+        replies = [
+            reply
+            for reply in _map_concurrently(
+                functools.partial(self._acquire_node, tokens=tokens), self.redis_nodes
+            )
+            if reply is not None
+        ]
+        if len(replies) < self.quorum:
+            return RateLimitResult(False, 0, None)
+        # what the node at the quorum-th position allows is what the majority allows
+        remaining = sorted((reply[1] for reply in replies), reverse=True)[
+            self.quorum - 1
+        ]
+        allowed_count = sum(reply[0] for reply in replies)
+        if allowed_count >= self.quorum:
+            return RateLimitResult(True, remaining, 0.0)
+        missing = self.quorum - allowed_count
+        wait = sorted(
+            math.inf if reply[2] < 0 else reply[2] for reply in replies if not reply[0]
+        )[missing - 1]
+        return RateLimitResult(
+            False, remaining, None if wait == math.inf else float(wait)
+        )
+
+    def acquire(
+        self, tokens: int = 1, blocking: bool = True, timeout: float = -1
+    ) -> RateLimitResult:
+        """
+        Take tokens from the limiter, blocking or non-blocking.
+
+        :param tokens: Number of tokens to take at once, at least 1 and at most what
+            the limiter allows at once
+        :param blocking: If `True`, sleep until the tokens are available
+        :param timeout: If `blocking` is `True` and `timeout` is a positive value, block
+            at most `timeout` seconds
+        :returns: The result of the last attempt
+        :raises ValueError: If `blocking` is `False` and `timeout` is a positive value,
+            or `tokens` is out of range
+        """
+        if not blocking and timeout != -1:
+            raise ValueError("Timeout must be -1 when requiring non-blocking")
+        if not 1 <= tokens <= self._max_tokens():
+            raise ValueError(
+                f"Tokens must be between 1 and {self._max_tokens()}, got {tokens}"
+            )
+        deadline = _monotonic_ms() + timeout * 1000 if timeout > 0 else None
+        while True:
+            result = self._acquire(tokens)
+            if result or not blocking or result.retry_after is None:
+                return result
+            delay = result.retry_after
+            if deadline is not None:
+                remaining = deadline - _monotonic_ms()
+                if delay > remaining:
+                    return result
+            sleep_ms(delay)
+
+
+class TokenBucket(RateLimiter):
+    # pylint: disable=too-few-public-methods
+    """
+    A rate limiter allowing bursts of up to `capacity` tokens, refilled continuously
+    at `rate` tokens per second as measured by the clock of each redis node.
+    See :class:`RateLimiter` for the remaining parameters.
+
+    :param capacity: Maximum number of tokens in the bucket, which starts out full
+    :param rate: Number of tokens added per second
+    """
+
+    script_name = "redlock_token_bucket_script"
+
+    def __init__(self, name: str, capacity: int, rate: float, **kwargs: Any):
+        if capacity <= 0 or rate <= 0:
+            raise ValueError("Capacity and rate must be positive")
+        super().__init__(name, **kwargs)
+        self.capacity = capacity
+        self.rate = rate
+
+    def _script_args(self, tokens: int) -> List[Any]:
+        return [self.capacity, self.rate / 1000, tokens]
+
+    def _max_tokens(self) -> int:
+        return self.capacity
+
+
+class SlidingWindow(RateLimiter):
+    # pylint: disable=too-few-public-methods
+    """
+    A rate limiter allowing up to `limit` tokens in any window of `window`
+    milliseconds, as measured by the clock of each redis node. The window is
+    approximated from the counts of the current and the previous fixed window, which
+    takes constant memory regardless of the limit. See :class:`RateLimiter` for the
+    remaining parameters.
+
+    :param limit: Maximum number of tokens per window
+    :param window: Length of the window in milliseconds
+    """
+
+    script_name = "redlock_sliding_window_script"
+
+    def __init__(self, name: str, limit: int, window: int, **kwargs: Any):
+        if limit <= 0 or window <= 0:
+            raise ValueError("Limit and window must be positive")
+        super().__init__(name, **kwargs)
+        self.limit = limit
+        self.window = int(window)
+
+    def _script_args(self, tokens: int) -> List[Any]:
+        return [self.limit, self.window, tokens]
+
+    def _max_tokens(self) -> int:
+        return self.limit
@@ -0,0 +1,134 @@
+"""
+Results describing held and contended locks.
+"""
+
+import math
+from typing import Union, Optional, Tuple, List, NamedTuple
+
+
+class Lease(NamedTuple):
+    """
+    A serialisable description of a held lock, created by :meth:`Lock.handoff` and
+    consumed by :meth:`Lock.adopt`. Being a plain tuple of builtins, it can be pickled
+    or dumped to JSON to pass it between processes.
+
+    :param resource_name: The name of the locked resource
+    :param lock_key: The token the lock is currently held with
+    :param expires_at: Wall clock time (as returned by :func:`time.time`) in seconds
+        until which the lock can be considered held
+    """
+
+    resource_name: str
+    lock_key: str
+    expires_at: float
+
+
+class HolderInfo(NamedTuple):
+    """
+    Metadata about the holder of a lock, stored alongside its token if the lock was
+    created with `holder_info=True`.
+
+    :param hostname: Hostname of the machine that acquired the lock
+    :param pid: Id of the process that acquired the lock
+    :param acquired_at: Wall clock time (as returned by :func:`time.time`) in seconds
+        when the lock was acquired
+    """
+
+    hostname: str
+    pid: int
+    acquired_at: float
+
+    @classmethod
+    def from_lock_key(cls, lock_key: Union[str, bytes]) -> Optional["HolderInfo"]:
+        """
+        Unpack holder metadata from a lock key
+
+        :param lock_key: A lock key as stored in redis
+        :returns: The unpacked :class:`HolderInfo` or `None` if the key does not
+            contain holder metadata
+        """
+        if isinstance(lock_key, bytes):
+            lock_key = lock_key.decode(errors="replace")
+        parts = lock_key.split(":", 3)
+        if len(parts) != 4:
+            return None
+        try:
+            return cls(
+                hostname=parts[3], pid=int(parts[1]), acquired_at=int(parts[2]) / 1000
+            )
+        except ValueError:
+            return None
+
+
+class LockInfo(NamedTuple):
+    """
+    State of a lock on a single redis node, as returned by :meth:`LockFactory.inspect`
+
+    :param lock_key: The token the lock is held with
+    :param ttl: The remaining time to live in milliseconds as returned by `PTTL`
+    :param holder: Holder metadata if the lock was created with `holder_info=True`,
+        else `None`
+    """
+
+    lock_key: str
+    ttl: int
+    holder: Optional[HolderInfo]
+
+
+class LockContention(NamedTuple):
+    """
+    Returned instead of `False` by :meth:`Lock.acquire` if the lock could not be
+    acquired because it is held by someone else. It always evaluates to `False`, so it
+    can be used in place of a boolean result.
+
+    :param ttls: The remaining time to live in milliseconds of the lock on each node
+        that reported it as held by someone else, as returned by `PTTL`. A value of
+        `-1` indicates the key has no expiry
+    :param node_count: Total number of nodes the lock was attempted on
+    :param quorum: Number of nodes required to acquire the lock
+    :param holders: The metadata of the current holder for each node in `ttls`, if the
+        holder was created with `holder_info=True`
+    """
+
+    ttls: List[int]
+    node_count: int
+    quorum: int
+    holders: List[Optional[HolderInfo]]
+
+    def __bool__(self) -> bool:
+        return False
+
+    @property
+    def retry_after(self) -> Optional[float]:
+        """
+        Estimated time in milliseconds after which enough nodes will be free again to
+        acquire the lock, assuming the current holder does not extend it. Nodes that
+        did not report a holder count as free. `None` if the lock is held without
+        expiry on too many nodes.
+        """
+        missing = self.quorum - (self.node_count - len(self.ttls))
+        if missing <= 0:
+            return 0.0
+        wait = sorted(math.inf if ttl < 0 else ttl for ttl in self.ttls)[missing - 1]
+        return None if wait == math.inf else float(wait)
+
+
+AcquireResult = Union[float, LockContention]
+
+
+def _contention(
+    contended: List[Tuple[int, Union[str, bytes]]], node_count: int, quorum: int
+) -> AcquireResult:
+    """
+    Return the result of a failed attempt to acquire a lock: a :class:`LockContention`
+    built from the ttls and tokens reported by the nodes held by someone else, or
+    `False` if no node reported a holder
+    """
+    if not contended:
+        return False
+    return LockContention(
+        ttls=[ttl for ttl, _ in contended],
+        node_count=node_count,
+        quorum=quorum,
+        holders=[HolderInfo.from_lock_key(key) for _, key in contended],
+    )
@@ -0,0 +1,147 @@
+"""
+The reentrant distributed lock.
+"""
+
+from typing import Union, Optional, Any
+
+from redlock_plus.exceptions import InvalidOperationError, RedlockError
+from redlock_plus.lock import Lock
+from redlock_plus.results import AcquireResult, Lease
+
+
+class RLock(Lock):
+    """
+    A reentrant version of :class:`Lock`, the only difference being that calls to
+    `acquire` / `release` may be nested. Only the final call to `acquire` actually
+    releases the lock.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._acquired = 0
+
+    def _disown(self) -> None:
+        super()._disown()
+        self._acquired = 0
+
+    def _own(self, lock_key: str, deadline: float) -> None:
+        super()._own(lock_key, deadline)
+        self._acquired = 1
+
+    def acquire(
+        self,
+        blocking: bool = True,
+        timeout: float = -1,
+        autoextend: bool = False,
+        autoextend_timeout: Optional[float] = None,
+    ) -> AcquireResult:
+        """
+        Attempt to acquire a new lock and / or increment the recursion level. If the
+        recursion level was `0`, acquire a lock, otherwise just increase the recursion
+        level.
+
+        :param blocking: If `True`, block until the lock can be acquired
+        :param timeout: If `blocking` is `True` and `timeout` is a positive value,
+            in the case a request would block, block at most `timeout` seconds
+        :param autoextend: If `True` start a thread once the lock is acquired that
+            extends the lock as scheduled by its :class:`RenewalPolicy`
+        :param autoextend_timeout: Timeout in seconds after which the autoextend thread
+            will terminate regardless of the lock status
+        :returns: A float indicating the minimal time the lock can be considered held in
+            milliseconds in case the lock could be acquired. If it could not be acquired
+            because it is held by someone else, a falsy :class:`LockContention`
+            describing the current holder, else `False`
+        :raises ValueError: If `blocking` is `False` and `timeout` is a positive value
+        :raises RedlockError: The recursion level should be increased but the lock was
+            lost in the meantime
+        """
+        if self._acquired > 0:
+            locked, validity_times = self.check_times()
+            if not locked:
+                raise RedlockError("Lost rlock while re-acquiring")
+            self._acquired += 1
+            return min(validity_times)
+
+        acquired = super().acquire(
+            blocking=blocking,
+            timeout=timeout,
+            autoextend=autoextend,
+            autoextend_timeout=autoextend_timeout,
+        )
+        if acquired:
+            self._acquired += 1
+        return acquired
+
+    def acquire_or_extend(
+        self,
+        blocking: bool = True,
+        timeout: float = -1,
+        autoextend: bool = True,
+        autoextend_timeout: Optional[float] = None,
+    ) -> AcquireResult:
+        """
+        If the lock is currently not held, try to acquire it. If it is held, extend it.
+        `blocking`, `timeout`, `autoextend` and `autoextend_timeout` will be passed to
+        :meth:`Lock.acquire`. If a lock was acquired or extended, increase the recursion
+        level.
+
+        :returns: A float indicating the minimal time the lock can be considered held in
+            milliseconds in case the lock could be acquired, else `False`
+        """
+        if self.locked():
+            extended = self.extend()
+            if extended:
+                self._acquired += 1
+                return extended
+        return self.acquire(blocking=blocking, timeout=timeout)
+
+    def handoff(self) -> Lease:
+        """
+        Give up ownership of the lock without releasing it, regardless of the
+        recursion level. See :meth:`Lock.handoff` for details.
+        """
+        lease = super().handoff()
+        self._acquired = 0
+        return lease
+
+    def adopt(
+        self,
+        lease: Lease,
+        transfer: bool = False,
+        autoextend: bool = False,
+        autoextend_timeout: Optional[float] = None,
+    ) -> Union[bool, float]:
+        """
+        Take over ownership of a lock handed off with :meth:`Lock.handoff`. If it
+        could be adopted, set the recursion level to `1`.
+        See :meth:`Lock.adopt` for details.
+        """
+        adopted = super().adopt(
+            lease,
+            transfer=transfer,
+            autoextend=autoextend,
+            autoextend_timeout=autoextend_timeout,
+        )
+        if adopted:
+            self._acquired = 1
+        return adopted
+
+    @Lock._requires_key
+    def release(self) -> bool:
+        """
+        Release the lock and / or decrement the recursion level. If the recursion level
+        reaches `0` release the lock.
+        A lock is considered released if the action to release it could be performed
+        sucessfully on the majority of redis nodes. So unlike Python's
+        :class:`threading.RLock` this can fail for reasons other than the lock not being
+        held in the first place.
+
+        :raises InvalidOperationError: If the lock was not previously acquired
+        :returns: Whether or not the lock was successfully released
+        """
+        if self._acquired > 0:
+            self._acquired -= 1
+            if self._acquired == 0:
+                return super().release()
+            return True
+        raise InvalidOperationError("Cannot release un-acquired lock")
@@ -0,0 +1,274 @@
+"""
+Lua scripts run on the redis nodes, and the function library holding them.
+"""
+
+import re
+import hashlib
+import functools
+from typing import Dict
+
+# Lock a key if it's not already set. If it is, report the remaining time to live and
+# the token of the current holder instead, saving another round trip to find out
+ACQUIRE_LUA_SCRIPT: str = """
+    if redis.call("set",KEYS[1],ARGV[1],"nx","px",ARGV[2]) then
+        return 1
+    else
+        return {redis.call("pttl",KEYS[1]),redis.call("get",KEYS[1])}
+    end
+"""
+
+# Reference:  http://redis.io/topics/distlock
+# Section Correct implementation with a single instance
+RELEASE_LUA_SCRIPT: str = """
+    if redis.call("get",KEYS[1]) == ARGV[1] then
+        return redis.call("del",KEYS[1])
+    else
+        return 0
+    end
+"""
+
+GET_TTL_LUA_SCRIPT: str = """
+    if redis.call("get",KEYS[1]) == ARGV[1] then
+        return redis.call("pttl",KEYS[1])
+    else
+        return 0
+    end
+"""
+
+# Reference:  http://redis.io/topics/distlock
+# Section Making the algorithm more reliable: Extending the lock
+BUMP_LUA_SCRIPT: str = """
+    if redis.call("get",KEYS[1]) == ARGV[1] then
+        return redis.call("pexpire",KEYS[1],ARGV[2])
+    else
+        return 0
+    end
+"""
+
+# Variants of BUMP_LUA_SCRIPT and GET_TTL_LUA_SCRIPT that additionally return the
+# server time, used to calibrate the clock drift. TIME is called after any write, so
+# these work without effects replication on older versions of Redis as well
+BUMP_TIMED_LUA_SCRIPT: str = """
+    local bumped = 0
+    if redis.call("get",KEYS[1]) == ARGV[1] then
+        bumped = redis.call("pexpire",KEYS[1],ARGV[2])
+    end
+    local now = redis.call("time")
+    return {bumped,now[1],now[2]}
+"""
+
+GET_TTL_TIMED_LUA_SCRIPT: str = """
+    local ttl = 0
+    if redis.call("get",KEYS[1]) == ARGV[1] then
+        ttl = redis.call("pttl",KEYS[1])
+    end
+    local now = redis.call("time")
+    return {ttl,now[1],now[2]}
+"""
+
+# Hand the lock over to a new owner by replacing its token, resetting the ttl
+TRANSFER_LUA_SCRIPT: str = """
+    if redis.call("get",KEYS[1]) == ARGV[1] then
+        redis.call("set",KEYS[1],ARGV[2],"px",ARGV[3])
+        return 1
+    else
+        return 0
+    end
+"""
+
+# Lock a batch of keys, each with its own token. ARGV[1] is the ttl, followed by the
+# tokens in the order of KEYS. Returns a table with 1 for each acquired key, else 0
+ACQUIRE_MANY_LUA_SCRIPT: str = """
+    local acquired = {}
+    for i, key in ipairs(KEYS) do
+        if redis.call("set",key,ARGV[i + 1],"nx","px",ARGV[1]) then
+            acquired[i] = 1
+        else
+            acquired[i] = 0
+        end
+    end
+    return acquired
+"""
+
+# Release a batch of keys, each with its own token in the order of KEYS. Returns a
+# table with 1 for each released key, else 0
+RELEASE_MANY_LUA_SCRIPT: str = """
+    local released = {}
+    for i, key in ipairs(KEYS) do
+        if redis.call("get",key) == ARGV[i] then
+            released[i] = redis.call("del",key)
+        else
+            released[i] = 0
+        end
+    end
+    return released
+"""
+
+# Set the flag of an event and wake up everyone waiting for it
+EVENT_SET_LUA_SCRIPT: str = """
+    redis.call("set",KEYS[1],1)
+    redis.call("publish",KEYS[1],1)
+    return 1
+"""
+
+# Wake up to ARGV[1] waiters of a condition in the order they started waiting, or all
+# of them if ARGV[1] is negative. Each waiter keeps a key named after the condition and
+# its id alive while waiting, waiters whose key expired are dropped without counting.
+# Returns the number of notified waiters
+NOTIFY_LUA_SCRIPT: str = """
+    local count = tonumber(ARGV[1])
+    local notified = 0
+    while count < 0 or notified < count do
+        local waiter = redis.call("lpop",KEYS[1])
+        if not waiter then
+            break
+        end
+        local name = KEYS[1] .. ":" .. waiter
+        if redis.call("del",name) == 1 then
+            redis.call("publish",name,1)
+            notified = notified + 1
+        end
+    end
+    return notified
+"""
+
+# Raise the term counter in KEYS[2] to ARGV[2] unless it is higher already, if the lock
+# in KEYS[1] is held with the token in ARGV[1]. Returns the counter, else 0
+TERM_LUA_SCRIPT: str = """
+    if redis.call("get",KEYS[1]) == ARGV[1] then
+        local term = tonumber(redis.call("get",KEYS[2])) or 0
+        term = math.max(term,tonumber(ARGV[2]))
+        redis.call("set",KEYS[2],term)
+        return term
+    else
+        return 0
+    end
+"""
+
+# Take ARGV[3] tokens from a bucket holding up to ARGV[1] tokens, refilled by ARGV[2]
+# tokens per millisecond, as measured by the server clock. Returns a table of 1 if the
+# tokens were taken, else 0, the number of tokens left and the milliseconds until
+# enough tokens are available again, or -1 if more tokens were requested than fit into
+# the bucket. Effects replication lets the script write after calling TIME on Redis
+# versions before 5, later versions do it by default
+TOKEN_BUCKET_LUA_SCRIPT: str = """
+    pcall(redis.replicate_commands)
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local requested = tonumber(ARGV[3])
+    local time = redis.call("time")
+    local now = time[1] * 1000 + time[2] / 1000
+    local state = redis.call("hmget",KEYS[1],"tokens","updated")
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    if tokens < requested then
+        local retry_after = -1
+        if requested <= capacity then
+            retry_after = math.ceil((requested - tokens) / rate)
+        end
+        return {0,math.floor(tokens),retry_after}
+    end
+    tokens = tokens - requested
+    redis.call("hmset",KEYS[1],"tokens",tostring(tokens),"updated",tostring(now))
+    redis.call("pexpire",KEYS[1],math.max(1,math.ceil((capacity - tokens) / rate)))
+    return {1,math.floor(tokens),0}
+"""
+
+# Count ARGV[3] requests against a limit of ARGV[1] per sliding window of ARGV[2]
+# milliseconds. The window is approximated by weighting the count of the previous fixed
+# window by how much of it still overlaps the sliding window. Returns the same table as
+# TOKEN_BUCKET_LUA_SCRIPT
+SLIDING_WINDOW_LUA_SCRIPT: str = """
+    pcall(redis.replicate_commands)
+    local limit = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    local requested = tonumber(ARGV[3])
+    local time = redis.call("time")
+    local now = time[1] * 1000 + math.floor(time[2] / 1000)
+    local start = now - now % window
+    local elapsed = now - start
+    local state = redis.call("hmget",KEYS[1],"start","current","previous")
+    local current = tonumber(state[2]) or 0
+    local previous = tonumber(state[3]) or 0
+    local last = tonumber(state[1]) or start
+    if last ~= start then
+        if start - last == window then
+            previous = current
+        else
+            previous = 0
+        end
+        current = 0
+    end
+    local used = previous * (window - elapsed) / window + current
+    if used + requested > limit then
+        local retry_after = -1
+        if requested <= limit then
+            if current + requested <= limit then
+                local free = (limit - current - requested) * window / previous
+                retry_after = math.ceil(window - elapsed - free)
+            else
+                local free = (limit - requested) * window / current
+                retry_after = math.ceil(2 * window - elapsed - free)
+            end
+            retry_after = math.max(1, retry_after)
+        end
+        return {0,math.max(0,math.floor(limit - used)),retry_after}
+    end
+    current = current + requested
+    redis.call("hmset",KEYS[1],"start",start,"current",current,"previous",previous)
+    redis.call("pexpire",KEYS[1],2 * window - elapsed)
+    return {1,math.floor(limit - used - requested),0}
+"""
+
+# Scripts available on each node initialised by init_redis_nodes, by the name of the
+# attribute they are stored in
+_NODE_SCRIPTS: Dict[str, str] = {
+    "redlock_acquire_script": ACQUIRE_LUA_SCRIPT,
+    "redlock_release_script": RELEASE_LUA_SCRIPT,
+    "redlock_bump_script": BUMP_LUA_SCRIPT,
+    "redlock_get_ttl_script": GET_TTL_LUA_SCRIPT,
+    "redlock_bump_timed_script": BUMP_TIMED_LUA_SCRIPT,
+    "redlock_get_ttl_timed_script": GET_TTL_TIMED_LUA_SCRIPT,
+    "redlock_transfer_script": TRANSFER_LUA_SCRIPT,
+    "redlock_acquire_many_script": ACQUIRE_MANY_LUA_SCRIPT,
+    "redlock_release_many_script": RELEASE_MANY_LUA_SCRIPT,
+    "redlock_event_set_script": EVENT_SET_LUA_SCRIPT,
+    "redlock_notify_script": NOTIFY_LUA_SCRIPT,
+    "redlock_term_script": TERM_LUA_SCRIPT,
+    "redlock_token_bucket_script": TOKEN_BUCKET_LUA_SCRIPT,
+    "redlock_sliding_window_script": SLIDING_WINDOW_LUA_SCRIPT,
+}
+
+#: Name of the redis function library holding all scripts, see
+#: :func:`init_redis_nodes`. It contains a hash of the script sources, so a library of
+#: a different version of the scripts is installed alongside instead of replacing it,
+#: and clients of both versions can run at the same time during an upgrade. Libraries
+#: of other versions are deleted when a new version is installed, clients still
+#: running them install theirs again on their next call
+FUNCTION_LIBRARY_NAME: str = "redlock_plus_" + (
+    hashlib.sha1("".join(_NODE_SCRIPTS.values()).encode()).hexdigest()[:12]
+)
+
+# names of the function libraries of all versions
+_FUNCTION_LIBRARY_PATTERN = re.compile(r"redlock_plus_[0-9a-f]{12}")
+
+
+def _function_name(attribute: str) -> str:
+    """
+    :param attribute: Key of the script in _NODE_SCRIPTS
+    :returns: The name of the function running the script in the function library
+    """
+    return f"{FUNCTION_LIBRARY_NAME}_{attribute[len('redlock_'):-len('_script')]}"
+
+
+FUNCTION_LIBRARY_CODE: str = f"#!lua name={FUNCTION_LIBRARY_NAME}\n" + "".join(
+    f"redis.register_function('{_function_name(attribute)}', function(KEYS, ARGV)"
+    f"{source}end)\n"
+    for attribute, source in _NODE_SCRIPTS.items()
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _script_sha(source: str) -> str:
+    return hashlib.sha1(source.encode()).hexdigest()
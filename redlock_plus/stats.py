@@ -0,0 +1,420 @@
+"""
+Usage statistics of locks and factories.
+"""
+
+import math
+import time
+import json
+import random
+import bisect
+import heapq
+import threading
+from typing import Optional, Tuple, List, Any, Dict, Callable, NamedTuple, cast
+
+import redis
+
+from redlock_plus._util import _FORK_SAFE
+from redlock_plus.results import AcquireResult
+
+
+class ResourceStats(NamedTuple):
+    """
+    Usage statistics of a single resource recorded by a :class:`LockProfiler`
+
+    :param resource_name: Name of the resource
+    :param attempts: Number of sampled calls to acquire the lock
+    :param failures: Number of sampled calls that did not acquire the lock
+    :param wait_time: Total time in milliseconds spent in sampled calls to acquire
+    :param hold_time: Total time in milliseconds the lock was held after sampled
+        successful calls to acquire, until it was released
+    :param extends: Number of sampled calls to extend the lock
+    :param error: Upper bound of the number of attempts that were attributed to
+        this resource, but belonged to resources evicted from the profiler
+    """
+
+    resource_name: str
+    attempts: int
+    failures: int
+    wait_time: float
+    hold_time: float
+    extends: int
+    error: int
+
+
+class LockProfiler:
+    """
+    Sample the usage of locks to find hot and contended resources with low overhead.
+
+    The profiler keeps statistics for at most `capacity` resources, chosen with the
+    space saving algorithm: once it is full, a resource not tracked yet replaces the
+    one with the fewest attempts, taking over its attempt count as the error bound.
+    Resources acquired often are therefore tracked reliably, regardless of the total
+    number of resources.
+
+    A profiler is meant to be shared between locks, by passing it to a
+    :class:`LockFactory`::
+
+        profiler = LockProfiler(interval=60, callback=lambda stats: log(stats))
+        factory = LockFactory(nodes, profiler=profiler)
+
+    :param capacity: Maximum number of resources to track
+    :param sample_rate: Fraction of calls to acquire or extend to record
+    :param interval: If set, call `callback` with the result of
+        :meth:`LockProfiler.top` at most every `interval` seconds. No additional
+        thread is started: the callback runs inline in the thread recording a call to
+        acquire, after the lock was acquired or not, so it delays the return of that
+        call and must not block, e.g. by hand the stats to a queue instead of sending
+        them over the network
+    :param callback: Callable accepting a list of :class:`ResourceStats`
+    """
+
+    def __init__(
+        self,
+        capacity: int = 100,
+        sample_rate: float = 1.0,
+        interval: Optional[float] = None,
+        callback: Optional[Callable[[List[ResourceStats]], Any]] = None,
+    ):
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.callback = callback
+        # attempts, failures, wait time, hold time, extends and error by resource
+        self._counters: Dict[str, List[Any]] = {}
+        # one (attempts, resource) entry per tracked resource to find the one to evict,
+        # the attempts are only updated once the entry reaches the top of the heap
+        self._heap: List[Tuple[int, str]] = []
+        self._last_dump = time.monotonic()
+        self._lock = threading.Lock()
+        _FORK_SAFE.add(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        _FORK_SAFE.add(self)
+
+    def sample(self) -> bool:
+        """
+        :returns: Whether the next call should be recorded, according to
+            :attr:`LockProfiler.sample_rate`
+        """
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record_acquire(
+        self, resource_name: str, acquired: bool, wait_time: float
+    ) -> None:
+        """
+        Record a call to acquire a lock. If due, this calls the callback as well,
+        see :class:`LockProfiler`.
+
+        :param resource_name: Name of the resource
+        :param acquired: Whether the lock was acquired
+        :param wait_time: Duration of the call in milliseconds
+        """
+        # evictions take O(log capacity) amortised, as every stale heap entry popped
+        # stands for at least one attempt recorded since it was pushed
+        with self._lock:
+            counters = self._counters.get(resource_name)
+            if counters is None:
+                counters = [0, 0, 0.0, 0.0, 0, 0]
+                if len(self._counters) >= self.capacity:
+                    counters[0] = counters[5] = self._evict()
+                self._counters[resource_name] = counters
+                heapq.heappush(self._heap, (counters[0], resource_name))
+            counters[0] += 1
+            counters[1] += not acquired
+            counters[2] += wait_time
+        self._maybe_dump()
+
+    def _evict(self) -> int:
+        """
+        Stop tracking the resource with the fewest attempts, must hold the lock
+
+        :returns: Its number of attempts
+        """
+        while True:
+            attempts, resource_name = heapq.heappop(self._heap)
+            current = self._counters[resource_name][0]
+            if current == attempts:
+                del self._counters[resource_name]
+                return attempts
+            heapq.heappush(self._heap, (current, resource_name))
+
+    def record_release(self, resource_name: str, hold_time: float) -> None:
+        """
+        Record the release of a lock. Ignored if the resource is not tracked.
+
+        :param resource_name: Name of the resource
+        :param hold_time: Time in milliseconds the lock was held
+        """
+        with self._lock:
+            counters = self._counters.get(resource_name)
+            if counters is not None:
+                counters[3] += hold_time
+
+    def record_extend(self, resource_name: str) -> None:
+        """
+        Record a call to extend a lock. Ignored if the resource is not tracked.
+
+        :param resource_name: Name of the resource
+        """
+        with self._lock:
+            counters = self._counters.get(resource_name)
+            if counters is not None:
+                counters[4] += 1
+
+    def top(self, n: Optional[int] = None) -> List[ResourceStats]:
+        """
+        :param n: Maximum number of resources to return, all if `None`
+        :returns: Statistics of the tracked resources with the most attempts first
+        """
+        with self._lock:
+            stats = [
+                ResourceStats(resource_name, *counters)
+                for resource_name, counters in self._counters.items()
+            ]
+        stats.sort(key=lambda stat: stat.attempts, reverse=True)
+        return stats[:n]
+
+    def to_json(self, n: Optional[int] = None) -> str:
+        """
+        :param n: Maximum number of resources to include, all if `None`
+        :returns: The result of :meth:`LockProfiler.top` as JSON array of objects
+        """
+        return json.dumps([stats._asdict() for stats in self.top(n)])
+
+    def reset(self) -> None:
+        """
+        Discard all recorded statistics
+        """
+        with self._lock:
+            self._counters = {}
+            self._heap = []
+
+    def _maybe_dump(self) -> None:
+        if self.interval is None or self.callback is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_dump < self.interval:
+                return
+            self._last_dump = now
+        self.callback(self.top())
+
+
+# upper bounds in milliseconds of the buckets of the histograms in LockStats
+_HISTOGRAM_BUCKETS: Tuple[float, ...] = (
+    *(1, 2, 5, 10, 25, 50, 100, 250, 500),
+    *(1000, 2500, 5000, 10_000, 30_000, 60_000, 120_000, math.inf),
+)
+
+
+class LockStats(NamedTuple):
+    """
+    Statistics of the locks created by a :class:`LockFactory`, as returned by
+    :meth:`LockFactory.stats`. Histograms map the upper bound of each bucket in
+    milliseconds to the number of values that fell into it.
+
+    :param active_locks: Number of locks currently held, according to their
+        :attr:`Lock.deadline`
+    :param acquires: Number of calls to acquire
+    :param acquire_failures: Number of calls to acquire that did not acquire the lock
+    :param acquire_latency: Histogram of the duration of calls to acquire
+    :param retries: Number of calls to acquire by the number of rounds they retried
+    :param validity: Histogram of the validity of the locks when acquired
+    :param extends: Number of calls to extend, including those of autoextend threads
+    :param extend_failures: Number of calls to extend that failed
+    :param node_requests: Number of requests to each node, in the order of
+        :attr:`LockFactory.redis_nodes`. Acquire rounds cut short by their deadline
+        count as a request to every node
+    :param node_errors: Number of requests to each node that failed because of a
+        connection error or timeout
+    """
+
+    active_locks: int
+    acquires: int
+    acquire_failures: int
+    acquire_latency: Dict[float, int]
+    retries: Dict[int, int]
+    validity: Dict[float, int]
+    extends: int
+    extend_failures: int
+    node_requests: List[int]
+    node_errors: List[int]
+
+    @property
+    def extend_success_rate(self) -> float:
+        """
+        Fraction of calls to extend that succeeded, `1.0` if there were none
+        """
+        if not self.extends:
+            return 1.0
+        return 1 - self.extend_failures / self.extends
+
+    @property
+    def node_error_rates(self) -> List[float]:
+        """
+        Fraction of failed requests to each node
+        """
+        return [
+            errors / requests if requests else 0.0
+            for requests, errors in zip(self.node_requests, self.node_errors)
+        ]
+
+
+class _StatsShard:
+    """
+    Counters of a :class:`_StatsRecorder` written by a single thread
+    """
+
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    __slots__ = (
+        "acquires",
+        "acquire_failures",
+        "acquire_latency",
+        "retries",
+        "validity",
+        "extends",
+        "extend_failures",
+        "nodes",
+    )
+
+    def __init__(self) -> None:
+        self.acquires = 0
+        self.acquire_failures = 0
+        self.acquire_latency = [0] * len(_HISTOGRAM_BUCKETS)
+        self.retries: Dict[int, int] = {}
+        self.validity = [0] * len(_HISTOGRAM_BUCKETS)
+        self.extends = 0
+        self.extend_failures = 0
+        # requests and errors by the id of the node
+        self.nodes: Dict[int, List[int]] = {}
+
+    def merge(self, other: "_StatsShard") -> None:
+        """
+        Add the counters of another shard, which may be written to concurrently
+        """
+        self.acquires += other.acquires
+        self.acquire_failures += other.acquire_failures
+        self.extends += other.extends
+        self.extend_failures += other.extend_failures
+        for i, count in enumerate(other.acquire_latency):
+            self.acquire_latency[i] += count
+        for i, count in enumerate(other.validity):
+            self.validity[i] += count
+        # copying a dict happens atomically, iterating it while it grows does not
+        for retries, count in other.retries.copy().items():
+            self.retries[retries] = self.retries.get(retries, 0) + count
+        for node_id, (requests, errors) in other.nodes.copy().items():
+            counters = self.nodes.setdefault(node_id, [0, 0])
+            counters[0] += requests
+            counters[1] += errors
+
+
+class _StatsRecorder:
+    """
+    Record the statistics reported by :meth:`LockFactory.stats`. Every thread writes
+    to a shard of its own, so recording takes no lock and does not contend with
+    other threads. The shards are merged when read, and those of terminated threads
+    are folded into a single one.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, _StatsShard]] = []
+        # merged shards of terminated threads
+        self._retired = _StatsShard()
+        self._lock = threading.Lock()
+        _FORK_SAFE.add(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _StatsShard:
+        try:
+            return cast(_StatsShard, self._local.shard)
+        except AttributeError:
+            pass
+        shard = self._local.shard = _StatsShard()
+        with self._lock:
+            self._retire()
+            self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire(self) -> None:
+        """
+        Merge the shards of terminated threads into :attr:`_StatsRecorder._retired`.
+        Must be called with the lock held
+        """
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._retired.merge(shard)
+        self._shards = alive
+
+    def record_acquire(
+        self, latency: float, rounds: int, validity: AcquireResult
+    ) -> None:
+        """
+        :param latency: Duration of the call to acquire in milliseconds
+        :param rounds: Number of rounds the call took, `0` if the timeout of the call
+            ran out before the first round
+        :param validity: The result of the call
+        """
+        shard = self._shard()
+        shard.acquires += 1
+        shard.acquire_latency[bisect.bisect_left(_HISTOGRAM_BUCKETS, latency)] += 1
+        # a call without any round did not retry either
+        retries = max(rounds, 1) - 1
+        shard.retries[retries] = shard.retries.get(retries, 0) + 1
+        if validity:
+            shard.validity[bisect.bisect_left(_HISTOGRAM_BUCKETS, validity)] += 1
+        else:
+            shard.acquire_failures += 1
+
+    def record_extend(self, extended: bool) -> None:
+        """
+        :param extended: Whether the lock was extended
+        """
+        shard = self._shard()
+        shard.extends += 1
+        shard.extend_failures += not extended
+
+    def record_requests(self, nodes: List[redis.StrictRedis]) -> None:
+        """
+        :param nodes: Nodes a request is sent to
+        """
+        counters = self._shard().nodes
+        for node in nodes:
+            try:
+                counters[id(node)][0] += 1
+            except KeyError:
+                counters[id(node)] = [1, 0]
+
+    def record_error(self, node: redis.StrictRedis) -> None:
+        """
+        :param node: Node a request to failed
+        """
+        self._shard().nodes.setdefault(id(node), [0, 0])[1] += 1
+
+    def merged(self) -> _StatsShard:
+        """
+        :returns: A new shard holding the sum of all shards
+        """
+        merged = _StatsShard()
+        with self._lock:
+            self._retire()
+            merged.merge(self._retired)
+            for _, shard in self._shards:
+                merged.merge(shard)
+        return merged
@@ -0,0 +1,359 @@
+"""
+Tools for load and chaos testing of locks: redis nodes injecting faults into their
+requests and a stress runner checking mutual exclusion.
+"""
+
+import time
+import random
+import threading
+import functools
+from typing import Optional, Tuple, List, Any, Dict, Callable, NamedTuple, cast
+
+import redis
+
+from redlock_plus._util import _monotonic_ms
+from redlock_plus.factory import LockFactory
+from redlock_plus.nodes import _BoundedClient, _BoundedClients
+from redlock_plus.scripts import (
+    BUMP_TIMED_LUA_SCRIPT,
+    GET_TTL_TIMED_LUA_SCRIPT,
+    _function_name,
+    _script_sha,
+)
+
+# scripts whose replies end with the server time as returned by TIME, by their
+# source, hash and function name
+_TIMED_SCRIPTS = frozenset(
+    [
+        *(
+            name
+            for source in (BUMP_TIMED_LUA_SCRIPT, GET_TTL_TIMED_LUA_SCRIPT)
+            for name in (source, _script_sha(source))
+        ),
+        _function_name("redlock_bump_timed_script"),
+        _function_name("redlock_get_ttl_timed_script"),
+    ]
+)
+
+
+class SimulatedNode(redis.StrictRedis):
+    """
+    A redis client for load and chaos testing, which injects faults into the requests
+    it makes. It shares the connection pool of an existing client, so it can be put in
+    front of a real redis server as well as a stand-in like `fakeredis`. Being a
+    regular client, it can be passed anywhere redis nodes are accepted, e.g. as
+    connection details to :class:`~redlock_plus.LockFactory`.
+
+    Latency and random failures are drawn from a random generator seeded with `seed`,
+    so runs are reproducible given the same sequence of requests. Pub/sub connections
+    are not affected by injected faults. Requests of locks and the other primitives
+    time out like they would on a real node: if the latency exceeds the timeout of
+    a request, it fails with a :class:`redis.exceptions.TimeoutError` once the
+    timeout elapsed.
+
+    :param client: The client whose connection pool to use
+    :param latency: Callable returning the latency in seconds to add to a request,
+        given the random generator of the node, e.g.
+        ``lambda rng: rng.expovariate(1000)``. If `None`, add no latency
+    :param failure_rate: Probability of a request to fail with a
+        :class:`redis.exceptions.ConnectionError`
+    :param seed: Seed of the random generator
+    """
+
+    def __init__(
+        self,
+        client: redis.StrictRedis,
+        latency: Optional[Callable[[random.Random], float]] = None,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(connection_pool=client.connection_pool)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.partitioned = False
+        #: Time in milliseconds the clock of the server was moved forward by
+        #: :meth:`SimulatedNode.jump_clock`
+        self.clock_offset = 0
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.redlock_bounded_clients = _BoundedClients(self, _SimulatedBoundedClient)
+
+    def inject_faults(self, timeout: Optional[float] = None) -> None:
+        """
+        Sleep for the simulated latency of a request and raise a
+        :class:`redis.exceptions.ConnectionError` if the node is partitioned or the
+        request was chosen to fail
+
+        :param timeout: Time in seconds the request may take. If the latency exceeds
+            it, sleep for `timeout` seconds and raise a
+            :class:`redis.exceptions.TimeoutError` instead
+        """
+        with self._random_lock:
+            latency = self.latency(self._random) if self.latency else 0
+            failed = (
+                bool(self.failure_rate) and self._random.random() < self.failure_rate
+            )
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise redis.exceptions.TimeoutError("Simulated timeout")
+        if latency > 0:
+            time.sleep(latency)
+        if self.partitioned or failed:
+            raise redis.exceptions.ConnectionError("Simulated failure")
+
+    def execute_command(self, *args: Any, **options: Any) -> Any:
+        return self._simulate(self._execute_command, args, options)
+
+    def _simulate(
+        self,
+        execute: Callable[..., Any],
+        args: Tuple[Any, ...],
+        options: Dict[str, Any],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Execute a command with `execute`, injecting faults and shifting the server
+        time in its reply by :attr:`SimulatedNode.clock_offset`
+
+        :param timeout: Time in seconds the request may take, see
+            :meth:`SimulatedNode.inject_faults`
+        """
+        self.inject_faults(timeout)
+        reply = execute(*args, **options)
+        if not self.clock_offset:
+            return reply
+        command = str(args[0]).upper()
+        if command == "TIME":
+            return self._shift_time(*reply)
+        if command in ("EVAL", "EVALSHA", "FCALL") and args[1] in _TIMED_SCRIPTS:
+            return [*reply[:-2], *self._shift_time(*reply[-2:])]
+        return reply
+
+    def _execute_command(self, *args: Any, **options: Any) -> Any:
+        """
+        Execute a command without injecting faults
+        """
+        return super().execute_command(*args, **options)  # type: ignore
+
+    def _shift_time(self, seconds: Any, microseconds: Any) -> Tuple[int, int]:
+        """
+        :returns: The server time given in seconds and microseconds, moved forward by
+            :attr:`SimulatedNode.clock_offset`
+        """
+        total = int(seconds) * 1_000_000 + int(microseconds) + self.clock_offset * 1000
+        return divmod(total, 1_000_000)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Optional[Any] = None
+    ) -> "_SimulatedPipeline":
+        return _SimulatedPipeline(
+            self, self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+    def partition(self) -> None:
+        """
+        Make all subsequent requests fail until :meth:`SimulatedNode.heal` is called
+        """
+        self.partitioned = True
+
+    def heal(self) -> None:
+        """
+        Stop failing requests after :meth:`SimulatedNode.partition`
+        """
+        self.partitioned = False
+
+    def flush_scripts(self) -> None:
+        """
+        Flush the script cache of the server, as it happens on a failover
+        """
+        self._execute_command("SCRIPT FLUSH")
+
+    def restart(self) -> None:
+        """
+        Simulate a restart of a server without persistence, losing all keys and the
+        script cache
+        """
+        self._execute_command("FLUSHDB")
+        self.flush_scripts()
+
+    def jump_clock(self, milliseconds: int) -> None:
+        """
+        Simulate the clock of the server jumping forward. The time to live of all keys
+        is shortened by `milliseconds`, expiring keys where it runs out, and the server
+        time returned by ``TIME`` and by the scripts sampling it for
+        :class:`~redlock_plus.ClockDriftMonitor` is moved forward. Lua scripts calling
+        ``TIME`` themselves, like those of the rate limiters, still see the real clock
+
+        :param milliseconds: Time in milliseconds the clock should jump forward
+        """
+        self.clock_offset += milliseconds
+        cursor = 0
+        while True:
+            cursor, keys = self._execute_command("SCAN", cursor)
+            for key in keys:
+                ttl = self._execute_command("PTTL", key)
+                if ttl < 0:
+                    continue
+                if ttl <= milliseconds:
+                    self._execute_command("DEL", key)
+                else:
+                    self._execute_command("PEXPIRE", key, ttl - milliseconds)
+            if not int(cursor):
+                break
+
+
+class _SimulatedBoundedClient(_BoundedClient):
+    """
+    Client of a :class:`SimulatedNode` whose requests time out, injecting the faults
+    of the node into them
+    """
+
+    def __init__(self, node: SimulatedNode, timeout: float):
+        super().__init__(node, timeout)
+        self.node = node
+
+    def execute_within(self, timeout: float, *args: Any, **options: Any) -> Any:
+        # pylint: disable=protected-access
+        execute = functools.partial(super().execute_within, timeout)
+        return self.node._simulate(execute, args, options, timeout)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Optional[Any] = None
+    ) -> "_SimulatedPipeline":
+        return _SimulatedPipeline(
+            self.node,
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+            timeout=self.timeout,
+        )
+
+
+class _SimulatedPipeline(redis.client.Pipeline):
+    """
+    Pipeline of a :class:`SimulatedNode`, injecting faults once per execution
+
+    :param timeout: Time in seconds an execution may take, see
+        :meth:`SimulatedNode.inject_faults`
+    """
+
+    def __init__(
+        self, node: SimulatedNode, *args: Any, timeout: Optional[float] = None
+    ) -> None:
+        super().__init__(*args)
+        self.node = node
+        self.timeout = timeout
+
+    def execute(self, raise_on_error: bool = True) -> List[Any]:
+        self.node.inject_faults(self.timeout)
+        return super().execute(raise_on_error=raise_on_error)
+
+
+def simulated_nodes(
+    clients: List[redis.StrictRedis], seed: Optional[int] = None, **kwargs: Any
+) -> List[SimulatedNode]:
+    """
+    Create a :class:`SimulatedNode` for each client.
+
+    :param clients: The clients whose connection pools to use
+    :param seed: Seed of the random generators. Each node is seeded with `seed` plus
+        its position in `clients`
+    :param kwargs: Passed on to :class:`SimulatedNode`
+    """
+    return [
+        SimulatedNode(client, seed=seed + i if seed is not None else None, **kwargs)
+        for i, client in enumerate(clients)
+    ]
+
+
+class StressReport(NamedTuple):
+    """
+    Result of :func:`run_stress_test`
+
+    :param acquired: Number of successful acquisitions
+    :param failed: Number of failed acquisitions
+    :param violations: Number of times a lock was acquired while another worker still
+        considered it held. Any value other than `0` means mutual exclusion was broken
+    :param duration: Duration of the test in seconds
+    """
+
+    acquired: int
+    failed: int
+    violations: int
+    duration: float
+
+    @property
+    def throughput(self) -> float:
+        """
+        Number of acquisition attempts per second
+        """
+        return (self.acquired + self.failed) / self.duration
+
+
+def run_stress_test(
+    factory: LockFactory,
+    resource_names: List[str],
+    workers: int = 8,
+    duration: float = 5.0,
+    hold_time: float = 0.0,
+    seed: Optional[int] = None,
+) -> StressReport:
+    """
+    Run workers in threads that repeatedly acquire random locks from `factory` without
+    blocking, hold them for `hold_time` seconds and release them again. Each lock
+    is recorded as held for the validity returned by
+    :meth:`~redlock_plus.Lock.acquire`, until :meth:`~redlock_plus.Lock.release`
+    returned, to detect violations of mutual exclusion. Locks acquired while the
+    previous holder is releasing the lock are not counted as violations.
+
+    Combined with :class:`SimulatedNode`, this can be used to verify the behaviour of
+    locks under latency, failures and clock jumps.
+
+    :param factory: The factory to create locks from
+    :param resource_names: Names of the resources to pick from
+    :param workers: Number of worker threads
+    :param duration: Duration of the test in seconds
+    :param hold_time: Time in seconds to hold each acquired lock
+    :param seed: Seed of the random generator picking resources
+    """
+    # pylint: disable=too-many-arguments
+    rng = random.Random(seed)
+    # resource name -> held until in monotonic ms and whether it is being released
+    holders: Dict[str, List[Any]] = {}
+    state_lock = threading.Lock()
+    counts = {"acquired": 0, "failed": 0, "violations": 0}
+    time_end = _monotonic_ms() + duration * 1000
+
+    def work() -> None:
+        while _monotonic_ms() < time_end:
+            with state_lock:
+                resource_name = rng.choice(resource_names)
+            lock = factory(resource_name)
+            validity = lock.acquire(blocking=False, autoextend=False)
+            now = _monotonic_ms()
+            with state_lock:
+                if not validity:
+                    counts["failed"] += 1
+                    continue
+                counts["acquired"] += 1
+                held_until, releasing = holders.get(resource_name, (0, False))
+                if held_until > now and not releasing:
+                    counts["violations"] += 1
+                holder = holders[resource_name] = [now + cast(float, validity), False]
+            if hold_time:
+                time.sleep(hold_time)
+            holder[1] = True
+            lock.release()
+            with state_lock:
+                # the next holder may have recorded itself already
+                if holders.get(resource_name) is holder:
+                    del holders[resource_name]
+
+    time_start = _monotonic_ms()
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return StressReport(duration=(_monotonic_ms() - time_start) / 1000, **counts)
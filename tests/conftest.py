@@ -5,11 +5,14 @@ import pytest
 import fakeredis
 
 import redlock_plus
+import redlock_plus.nodes
 
 
 @pytest.fixture(autouse=True)
 def fake_redis(monkeypatch):
-    monkeypatch.setattr("redlock_plus.redis.StrictRedis", fakeredis.FakeStrictRedis)
+    monkeypatch.setattr(
+        "redlock_plus.nodes.redis.StrictRedis", fakeredis.FakeStrictRedis
+    )
 
 
 @pytest.fixture()
@@ -42,6 +45,34 @@ def create_lock_factory(request, redis_nodes, lock_class):
     return _lock_factory
 
 
+class NodeRoutedClient(redlock_plus.nodes._BoundedClient):
+    """
+    Client sending the requests that time out through the node itself instead, so
+    tests can fake errors by patching ``execute_command`` and ``pipeline`` of the node
+    """
+
+    def __init__(self, node, timeout):
+        super().__init__(node, timeout)
+        self.node = node
+
+    def execute_within(self, timeout, *args, **options):
+        return self.node.execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return self.node.pipeline(transaction=transaction, shard_hint=shard_hint)
+
+
+@pytest.fixture
+def route_through_node():
+    def inner(node):
+        node.redlock_bounded_clients = redlock_plus.nodes._BoundedClients(
+            node, NodeRoutedClient
+        )
+        return node
+
+    return inner
+
+
 @pytest.fixture
 def create_lock(fake_redis_client, request):
     redis_clients = [fake_redis_client(), fake_redis_client(), fake_redis_client()]
@@ -0,0 +1,392 @@
+import contextlib
+from time import monotonic
+
+import anyio
+import fakeredis
+import redis
+from anyio.streams.buffered import BufferedByteReceiveStream
+from pytest import fixture, mark, raises
+
+import redlock_plus.asyncio
+from redlock_plus import (
+    InsufficientNodesError,
+    InvalidOperationError,
+    LockContention,
+    LockExpiredError,
+)
+from redlock_plus.asyncio import AsyncLock, AsyncLockFactory, AsyncRedisNode
+from redlock_plus.scripts import ACQUIRE_LUA_SCRIPT
+
+
+@fixture(params=["asyncio", "trio"])
+def anyio_backend(request):
+    return request.param
+
+
+class FakeAsyncNode:
+    """
+    Asynchronous node running commands on a fakeredis server
+    """
+
+    def __init__(self):
+        self.client = fakeredis.FakeStrictRedis(
+            server=fakeredis.FakeServer(), decode_responses=True
+        )
+        self.delay = 0
+        self.down = False
+
+    async def execute_command(self, *args):
+        await anyio.sleep(self.delay)
+        if self.down:
+            raise redis.exceptions.ConnectionError
+        return self.client.execute_command(*args)
+
+
+def encode_reply(reply):
+    if isinstance(reply, redis.exceptions.NoScriptError):
+        return b"-NOSCRIPT %s\r\n" % str(reply).encode()
+    if isinstance(reply, Exception):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, bool):
+        return b"+OK\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, str):
+        reply = reply.encode()
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(encode_reply(r) for r in reply)
+
+
+class Server:
+    """
+    A redis server speaking RESP on a local port, backed by fakeredis
+    """
+
+    def __init__(self, port, reply=True):
+        self.port = port
+        self.reply = reply
+        self.client = fakeredis.FakeStrictRedis(server=fakeredis.FakeServer())
+        self.commands = []
+        self.connections = 0
+
+    async def handle(self, stream):
+        self.connections += 1
+        buffered = BufferedByteReceiveStream(stream)
+        async with stream:
+            while True:
+                try:
+                    line = await buffered.receive_until(b"\r\n", 65536)
+                except (anyio.EndOfStream, anyio.IncompleteRead):
+                    return
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int((await buffered.receive_until(b"\r\n", 65536))[1:])
+                    args.append((await buffered.receive_exactly(length + 2))[:-2])
+                self.commands.append([arg.decode() for arg in args])
+                if not self.reply:
+                    continue
+                if args[0] in (b"AUTH", b"SELECT"):
+                    reply = True
+                else:
+                    try:
+                        reply = self.client.execute_command(*args)
+                    except redis.exceptions.ResponseError as error:
+                        reply = error
+                await stream.send(encode_reply(reply))
+
+
+@contextlib.asynccontextmanager
+async def serve(reply=True):
+    listener = await anyio.create_tcp_listener(local_host="127.0.0.1")
+    server = Server(listener.extra(anyio.abc.SocketAttribute.local_port), reply)
+    async with listener, anyio.create_task_group() as task_group:
+        task_group.start_soon(listener.serve, server.handle)
+        yield server
+        task_group.cancel_scope.cancel()
+
+
+@fixture
+def nodes():
+    return [FakeAsyncNode() for _ in range(3)]
+
+
+@fixture
+def create_lock(nodes, request):
+    def inner(**kwargs):
+        kwargs.setdefault("nodes", nodes)
+        return AsyncLock(request.node.name, **kwargs)
+
+    return inner
+
+
+@fixture
+def lock(create_lock):
+    return create_lock(ttl=10_000, retry_delay=10)
+
+
+def test_pack_command():
+    assert redlock_plus.asyncio._pack_command(["GET", b"\xff", 12], "utf-8") == (
+        b"*3\r\n$3\r\nGET\r\n$1\r\n\xff\r\n$2\r\n12\r\n"
+    )
+
+
+@mark.anyio
+class TestAsyncRedisNode:
+    async def test_execute_command(self):
+        async with serve() as server:
+            node = AsyncRedisNode("127.0.0.1", server.port)
+            assert await node.execute_command("SET", "foo", "bar") == b"OK"
+            assert await node.execute_command("GET", "foo") == b"bar"
+            assert await node.execute_command("GET", "missing") is None
+            assert await node.execute_command("RPUSH", "list", 1, 2) == 2
+            assert await node.execute_command("LRANGE", "list", 0, -1) == [b"1", b"2"]
+            assert server.connections == 1
+            await node.aclose()
+
+    async def test_decode_responses(self):
+        async with serve() as server:
+            node = AsyncRedisNode("127.0.0.1", server.port, decode_responses=True)
+            assert await node.execute_command("SET", "foo", "bar") == "OK"
+            assert await node.execute_command("GET", "foo") == "bar"
+            assert await node.execute_command("LRANGE", "foo:list", 0, -1) == []
+            await node.aclose()
+
+    async def test_auth_and_select(self):
+        async with serve() as server:
+            node = AsyncRedisNode(
+                "127.0.0.1", server.port, db=2, username="user", password="pw"
+            )
+            await node.execute_command("PING")
+            assert server.commands[:2] == [["AUTH", "user", "pw"], ["SELECT", "2"]]
+            await node.aclose()
+
+    async def test_response_error(self):
+        async with serve() as server:
+            node = AsyncRedisNode("127.0.0.1", server.port)
+            await node.execute_command("SET", "foo", "bar")
+            with raises(redis.exceptions.ResponseError):
+                await node.execute_command("INCR", "foo")
+            assert await node.execute_command("GET", "foo") == b"bar"
+            assert server.connections == 1
+            await node.aclose()
+
+    async def test_connection_error(self):
+        async with serve() as server:
+            port = server.port
+        with raises(redis.exceptions.ConnectionError):
+            await AsyncRedisNode("127.0.0.1", port).execute_command("PING")
+
+    async def test_timeout(self):
+        async with serve(reply=False) as server:
+            node = AsyncRedisNode("127.0.0.1", server.port, socket_timeout=0.05)
+            with raises(redis.exceptions.TimeoutError):
+                await node.execute_command("PING")
+            assert node._idle == []
+
+    async def test_from_url(self):
+        node = AsyncRedisNode.from_url("redis://user:pw@host:1234/2", socket_timeout=1)
+        assert (node.host, node.port, node.db) == ("host", 1234, 2)
+        assert (node.username, node.password) == ("user", "pw")
+        assert node.socket_timeout == 1
+        assert not node.decode_responses
+
+    async def test_from_url_options(self):
+        node = AsyncRedisNode.from_url(
+            "redis://host?decode_responses=True&health_check_interval=1", password="pw",
+        )
+        assert node.decode_responses is True
+        assert node.password == "pw"
+
+    @mark.parametrize("url", ["rediss://host", "unix:///tmp/redis.sock"])
+    async def test_from_url_unsupported_scheme(self, url):
+        with raises(ValueError, match="only supports redis://"):
+            AsyncRedisNode.from_url(url)
+
+    async def test_loads_script(self):
+        async with serve() as server:
+            node = AsyncRedisNode("127.0.0.1", server.port)
+            for _ in range(2):
+                assert await redlock_plus.asyncio._call_script(
+                    node, ACQUIRE_LUA_SCRIPT, ["foo"], ["token", 1000]
+                )
+                await node.execute_command("DEL", "foo")
+            assert [command[0] for command in server.commands] == [
+                "EVALSHA",
+                "EVAL",
+                "DEL",
+                "EVALSHA",
+                "DEL",
+            ]
+            await node.aclose()
+
+
+class TestInitialisation:
+    def test_insufficient_nodes(self, nodes):
+        with raises(InsufficientNodesError):
+            AsyncLock("foo", nodes=nodes[:2])
+
+    def test_nodes_and_connection_details_none(self):
+        with raises(ValueError):
+            AsyncLock("foo")
+
+    def test_from_connection_details(self):
+        lock = AsyncLock(
+            "foo",
+            connection_details=[{"host": "a"}, {"url": "redis://b"}, {"host": "c"}],
+            ttl=10_000,
+        )
+        assert [node.host for node in lock.redis_nodes] == ["a", "b", "c"]
+        assert lock.redis_nodes[0].socket_timeout == 0.05
+        assert lock.quorum == 3
+
+    def test_ttl_updates_drift(self, nodes):
+        lock = AsyncLock("foo", nodes=nodes, ttl=1000)
+        assert lock._drift == 1000 * redlock_plus.CLOCK_DRIFT_FACTOR + 2
+        lock.ttl = 50_000
+        assert lock._drift == 50_000 * redlock_plus.CLOCK_DRIFT_FACTOR + 2
+        assert lock._request_timeout == 0.25
+
+
+@mark.anyio
+class TestAsyncLock:
+    async def test_acquire_release(self, lock, create_lock):
+        assert await lock.acquire()
+        assert lock.deadline is not None
+        assert await lock.locked()
+        assert not await create_lock().acquire(blocking=False)
+        assert await lock.release()
+        assert lock.deadline is None
+        assert not await lock.locked()
+        assert await create_lock().acquire(blocking=False)
+
+    async def test_contention(self, lock, create_lock):
+        assert await lock.acquire()
+        result = await create_lock(retry_times=0).acquire(blocking=False)
+        assert isinstance(result, LockContention)
+        assert not result
+        assert len(result.ttls) == 3
+
+    async def test_minority_down(self, create_lock):
+        nodes = [FakeAsyncNode() for _ in range(5)]
+        nodes[0].down = nodes[1].down = True
+        lock = create_lock(nodes=nodes)
+        assert await lock.acquire(blocking=False)
+
+    async def test_majority_down_releases(self, create_lock, nodes):
+        nodes[0].down = True
+        lock = create_lock(retry_times=0)
+        assert not await lock.acquire(blocking=False)
+        assert not any(node.client.keys() for node in nodes[1:])
+
+    async def test_cancels_slow_nodes(self, create_lock):
+        nodes = [FakeAsyncNode() for _ in range(5)]
+        nodes[0].delay = nodes[1].delay = 10
+        lock = create_lock(nodes=nodes, ttl=200, retry_times=0)
+        start = monotonic()
+        # the slow nodes time out long before the ttl runs out
+        assert await lock.acquire(blocking=False)
+        assert monotonic() - start < 0.1
+
+    async def test_request_timeout(self, create_lock, nodes):
+        # requests time out after a fraction of the ttl of the lock
+        for node in nodes:
+            node.delay = 0.03
+        assert not await create_lock(ttl=1000, retry_times=0).acquire(blocking=False)
+        assert await create_lock(ttl=20_000).acquire(blocking=False)
+
+    async def test_timeout(self, lock, create_lock):
+        assert await lock.acquire()
+        start = monotonic()
+        assert not await create_lock(retry_delay=10).acquire(timeout=0.1)
+        assert monotonic() - start < 0.2
+
+    async def test_timeout_includes_retries(self, lock, create_lock):
+        assert await lock.acquire()
+        other = create_lock(retry_times=3, retry_delay=100)
+        start = monotonic()
+        assert not await other.acquire(timeout=0.3)
+        assert monotonic() - start <= 0.3 + other.retry_delay / 1000
+
+    async def test_no_retries(self, lock, create_lock, nodes, mocker):
+        assert await lock.acquire()
+        other = create_lock(retry_times=3)
+        spy = mocker.spy(other, "_acquire_node")
+        assert not await other._acquire(retry_times=0)
+        assert spy.call_count == len(nodes)
+
+    async def test_non_blocking_timeout(self, lock):
+        with raises(ValueError):
+            await lock.acquire(blocking=False, timeout=1)
+
+    async def test_extend(self, lock):
+        with raises(InvalidOperationError):
+            await lock.extend()
+        assert await lock.acquire()
+        deadline = lock.deadline
+        assert await lock.extend()
+        assert lock.deadline > deadline
+
+    async def test_extend_lost(self, lock, nodes):
+        assert await lock.acquire()
+        for node in nodes:
+            node.client.delete(lock.resource_name)
+        assert not await lock.extend(retry_times=0)
+
+    async def test_release_not_acquired(self, lock):
+        with raises(InvalidOperationError):
+            await lock.release()
+
+
+@mark.anyio
+class TestContextManager:
+    async def test_autoextends(self, create_lock):
+        lock = create_lock(ttl=200)
+        async with lock as validity:
+            assert validity
+            await anyio.sleep(0.5)
+            assert await lock.locked()
+        assert not await lock.locked()
+
+    async def test_lost(self, create_lock, nodes):
+        lock = create_lock(ttl=200)
+        reached = False
+        with raises(LockExpiredError):
+            async with lock:
+                for node in nodes:
+                    node.client.set(lock.resource_name, "someone else")
+                await anyio.sleep(1)
+                reached = True
+        assert not reached
+
+    async def test_exception(self, create_lock):
+        lock = create_lock()
+        with raises(KeyError):
+            async with lock:
+                raise KeyError
+        assert not await lock.locked()
+
+
+@mark.anyio
+class TestAsyncLockFactory:
+    async def test_create(self, nodes):
+        factory = AsyncLockFactory(nodes=nodes, ttl=500)
+        lock = factory("foo", retry_times=1)
+        assert (lock.ttl, lock.retry_times) == (500, 1)
+        assert lock.redis_nodes is factory.redis_nodes
+
+    async def test_insufficient_nodes(self, nodes):
+        with raises(InsufficientNodesError):
+            AsyncLockFactory(nodes=nodes[:2])
+
+    async def test_end_to_end(self):
+        async with serve() as a, serve() as b, serve() as c:
+            details = [{"host": "127.0.0.1", "port": s.port} for s in (a, b, c)]
+            async with AsyncLockFactory(details, ttl=10_000) as factory:
+                assert factory.redis_nodes[0].socket_timeout == 0.05
+                async with factory("foo"):
+                    assert not await factory("foo").acquire(blocking=False)
+                assert await factory("foo").acquire(blocking=False)
+            assert all(node._idle == [] for node in factory.redis_nodes)
@@ -0,0 +1,217 @@
+from threading import Thread
+from time import monotonic, sleep
+
+from pytest import fixture, raises
+
+from redlock_plus import Condition, InvalidOperationError
+
+
+@fixture
+def condition(lock):
+    return Condition(lock)
+
+
+class TestInitialisation:
+    def test_default_name(self, condition, lock):
+        assert condition.lock is lock
+        assert condition.name == f"{lock.resource_name}:condition"
+
+    def test_name(self, lock):
+        assert Condition(lock, name="foo").name == "foo"
+
+    def test_waiter_ttl(self, lock):
+        assert Condition(lock).waiter_ttl == 10_000
+        assert Condition(lock, waiter_ttl=100).waiter_ttl == 100
+
+
+class TestContextManager:
+    def test_acquires_lock(self, condition, lock):
+        with condition as validity:
+            assert validity
+            assert lock.locked()
+        assert not lock.locked()
+
+
+class TestWait:
+    def test_not_acquired(self, condition):
+        with raises(InvalidOperationError):
+            condition.wait(timeout=0.1)
+
+    def test_timeout(self, condition, lock):
+        with condition:
+            start = monotonic()
+            assert not condition.wait(timeout=0.1)
+            assert monotonic() - start >= 0.1
+            assert lock.locked()
+            # waiter removed itself
+            assert lock.redis_nodes[0].llen(condition.name) == 0
+            assert not lock.redis_nodes[0].keys(f"{condition.name}:*")
+
+    def test_refreshes_registration(self, lock, create_lock):
+        condition = Condition(lock, waiter_ttl=150)
+        other = Condition(create_lock(), waiter_ttl=150)
+        results = []
+
+        def wait():
+            with other:
+                results.append(other.wait(timeout=2))
+
+        thread = Thread(target=wait, daemon=True)
+        thread.start()
+        sleep(0.5)
+        with condition:
+            assert condition.notify() == 1
+        thread.join()
+        assert results == [True]
+
+    def test_keeps_autoextend(self, create_lock):
+        lock = create_lock(ttl=10_000)
+        condition = Condition(lock)
+        lock.acquire(autoextend=False)
+        condition.wait(timeout=0.05)
+        assert lock.locked()
+        assert lock._autoextend_thread is None
+        lock.release()
+
+        lock.acquire(autoextend_timeout=60)
+        condition.wait(timeout=0.05)
+        assert lock._autoextend_thread.is_alive()
+        assert lock._autoextend_thread.timeout_ms == 60_000
+        lock.release()
+
+    def test_releases_lock_while_waiting(self, condition, create_lock):
+        other = create_lock()
+
+        def acquire_other():
+            sleep(0.05)
+            assert other.acquire(timeout=1, autoextend=False)
+            other.release()
+
+        thread = Thread(target=acquire_other, daemon=True)
+        with condition:
+            thread.start()
+            condition.wait(timeout=0.3)
+        thread.join()
+
+    def test_notify(self, condition, create_lock):
+        other = Condition(create_lock())
+        results = []
+
+        def wait():
+            with other:
+                results.append(other.wait(timeout=2))
+
+        thread = Thread(target=wait, daemon=True)
+        thread.start()
+        sleep(0.2)
+        start = monotonic()
+        with condition:
+            assert condition.notify() == 1
+        thread.join()
+        assert results == [True]
+        assert monotonic() - start < 1
+
+    def test_notify_all(self, condition, create_lock):
+        results = []
+        conditions = [Condition(create_lock()) for _ in range(3)]
+
+        def wait(other):
+            with other:
+                results.append(other.wait(timeout=2))
+
+        threads = [Thread(target=wait, args=(c,), daemon=True) for c in conditions]
+        for thread in threads:
+            thread.start()
+        # the waiters take turns holding the lock to register themselves
+        node = condition.lock.redis_nodes[0]
+        deadline = monotonic() + 1.5
+        while node.llen(condition.name) < 3 and monotonic() < deadline:
+            sleep(0.01)
+        with condition:
+            assert condition.notify_all() == 3
+        for thread in threads:
+            thread.join()
+        assert results == [True, True, True]
+
+    def test_notify_skips_expired_waiters(self, condition, create_lock):
+        for node in condition.lock.redis_nodes:
+            node.rpush(condition.name, "crashed")
+        other = Condition(create_lock())
+        results = []
+
+        def wait():
+            with other:
+                results.append(other.wait(timeout=2))
+
+        thread = Thread(target=wait, daemon=True)
+        thread.start()
+        sleep(0.2)
+        with condition:
+            assert condition.notify() == 1
+        thread.join()
+        assert results == [True]
+
+    def test_notify_quorum_count(self, condition, mocker):
+        mocker.patch.object(condition, "_notify_node", side_effect=[2, 1, 0])
+        with condition:
+            assert condition.notify(2) == 1
+
+    def test_nodes_disagree_on_order(self, condition, create_lock):
+        results = []
+        nodes = condition.lock.redis_nodes
+
+        def wait():
+            other = Condition(create_lock())
+            with other:
+                results.append(other.wait(timeout=3))
+
+        threads = [Thread(target=wait, daemon=True) for _ in range(2)]
+        for count, thread in enumerate(threads, 1):
+            thread.start()
+            deadline = monotonic() + 1.5
+            while nodes[0].llen(condition.name) < count and monotonic() < deadline:
+                sleep(0.01)
+        # the last node registered the waiters the other way round
+        waiters = nodes[2].lrange(condition.name, 0, -1)
+        nodes[2].delete(condition.name)
+        nodes[2].rpush(condition.name, *reversed(waiters))
+
+        with condition:
+            assert condition.notify(1) == 1
+        sleep(0.3)
+        assert results == [True]
+        with condition:
+            assert condition.notify(1) == 1
+        for thread in threads:
+            thread.join()
+        assert results == [True, True]
+        for node in nodes:
+            assert node.llen(condition.name) == 0
+            assert not node.keys(f"{condition.name}:*")
+
+    def test_notify_no_waiters(self, condition):
+        with condition:
+            assert condition.notify() == 0
+
+    def test_notify_not_acquired(self, condition):
+        with raises(InvalidOperationError):
+            condition.notify()
+
+
+class TestWaitFor:
+    def test_predicate_true(self, condition, mocker):
+        mocker.patch.object(condition, "wait")
+        with condition:
+            assert condition.wait_for(lambda: "foo") == "foo"
+        condition.wait.assert_not_called()
+
+    def test_waits_until_true(self, condition, mocker):
+        mocker.patch.object(condition, "wait")
+        predicate = mocker.Mock(side_effect=[False, False, True])
+        with condition:
+            assert condition.wait_for(predicate) is True
+        assert condition.wait.call_count == 2
+
+    def test_timeout(self, condition):
+        with condition:
+            assert condition.wait_for(lambda: False, timeout=0.1) is False
@@ -0,0 +1,250 @@
+import contextlib
+from time import monotonic, sleep
+
+import redis
+from pytest import fixture, raises
+
+import redlock_plus
+from redlock_plus import InvalidOperationError, LeaderElection, Lock
+
+
+def wait_for(predicate, timeout=2):
+    deadline = monotonic() + timeout
+    while not predicate():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
+@fixture
+def factory(fake_redis_client):
+    return redlock_plus.LockFactory(
+        [fake_redis_client(), fake_redis_client(), fake_redis_client()],
+        ttl=500,
+        retry_delay=20,
+    )
+
+
+@fixture
+def create_election(factory, request):
+    def inner(**kwargs):
+        election = factory.leader_election(request.node.name, **kwargs)
+        request.addfinalizer(election.stop)
+        return election
+
+    return inner
+
+
+@fixture
+def election(create_election):
+    return create_election()
+
+
+class TestInitialisation:
+    def test_from_factory(self, factory, mock):
+        election = factory.leader_election("foo", on_elected=mock, ttl=1000)
+        assert election.lock.resource_name == "foo"
+        assert election.lock.ttl == 1000
+        assert election.lock.redis_nodes == factory.redis_nodes
+        assert election.on_elected is mock
+        assert election.name == "foo:term"
+
+    def test_name(self, factory):
+        assert LeaderElection(factory("foo"), name="bar").name == "bar"
+
+    def test_not_leader(self, election):
+        assert not election.is_leader
+        assert election.term is None
+
+
+class TestElection:
+    def test_elected(self, create_election, mock):
+        election = create_election(on_elected=mock)
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        assert election.term == 1
+        mock.assert_called_once_with(election)
+
+    def test_single_leader(self, create_election):
+        first, second = create_election(), create_election()
+        first.start()
+        assert wait_for(lambda: first.is_leader)
+        second.start()
+        sleep(0.1)
+        assert not second.is_leader
+
+    def test_renews(self, election):
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        sleep(1)
+        assert election.is_leader
+        assert election.term == 1
+
+    def test_resign(self, create_election, mock):
+        first, second = create_election(on_demoted=mock), create_election()
+        first.start()
+        assert wait_for(lambda: first.is_leader)
+        second.start()
+        first.stop()
+        assert not first.is_leader
+        mock.assert_called_once_with(first)
+        assert wait_for(lambda: second.is_leader, timeout=0.2)
+        assert second.term == 2
+
+    def test_failover(self, factory, election, request):
+        # a leader that crashed, leaving its lease to expire
+        crashed = factory(request.node.name)
+        assert crashed.acquire(autoextend=False)
+        start = monotonic()
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        assert 0.4 < monotonic() - start < 1
+
+    def test_lost(self, create_election, mock, factory):
+        election = create_election(on_demoted=mock)
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        for node in factory.redis_nodes:
+            node.set(election.lock.resource_name, "someone else", px=500)
+        assert wait_for(lambda: mock.called)
+        mock.assert_called_once_with(election)
+        assert election.term is None
+        assert wait_for(lambda: election.is_leader)
+        assert election.term == 2
+
+    def test_term_not_started(self, election, mocker):
+        mocker.patch.object(election, "_new_term_node", return_value=0)
+        election.start()
+        sleep(0.1)
+        assert not election.is_leader
+        election.stop()
+        assert not election.lock.locked()
+
+    def test_term_majority(self, election, mocker):
+        election.lock.acquire(autoextend=False)
+        mocker.patch.object(election, "_read_term_node", side_effect=[3, None, 4])
+        assert election._new_term() is None
+        mocker.patch.object(election, "_read_term_node", side_effect=[3, 2, 4])
+        mocker.patch.object(election, "_new_term_node", side_effect=[5, 0, 5])
+        assert election._new_term() is None
+        mocker.patch.object(election, "_read_term_node", side_effect=[3, 2, 4])
+        mocker.patch.object(election, "_new_term_node", side_effect=[5, 5, 5])
+        assert election._new_term() == 5
+        election._new_term_node.assert_called_with(
+            election.lock.redis_nodes[2], lock_key=election.lock.lock_key, term=5
+        )
+
+    def test_term_above_highest_counter(self, election, factory):
+        election.lock.acquire(autoextend=False)
+        factory.redis_nodes[0].set(election.name, 7)
+        assert election._new_term() == 8
+        assert [election._read_term_node(n) for n in factory.redis_nodes] == [8] * 3
+
+    def test_term_not_accepted(self, election, factory):
+        election.lock.acquire(autoextend=False)
+        node = factory.redis_nodes[0]
+        # another term was started since the counters were read
+        assert election._new_term_node(node, election.lock.lock_key, 3) == 3
+        assert election._new_term_node(node, election.lock.lock_key, 2) == 3
+
+    def test_term_requires_lock(self, election):
+        assert election._new_term() is None
+        assert election._new_term_node(election.lock.redis_nodes[0], "foo", 1) == 0
+
+    def test_term_unreachable(self, election, mocker, route_through_node):
+        node = route_through_node(election.lock.redis_nodes[0])
+        mocker.patch.object(
+            node, "execute_command", side_effect=redis.exceptions.ConnectionError
+        )
+        assert election._read_term_node(node) is None
+        assert election._new_term_node(node, "foo", 1) == 0
+
+    def test_terms_increase_on_overlapping_majorities(
+        self, fake_redis_client, mocker, request, route_through_node
+    ):
+        nodes = [route_through_node(fake_redis_client()) for _ in range(5)]
+        nodes = redlock_plus.init_redis_nodes(nodes)
+        election = LeaderElection(Lock(request.node.name, nodes=nodes))
+
+        @contextlib.contextmanager
+        def reachable(*indices):
+            for i, node in enumerate(nodes):
+                if i not in indices:
+                    mocker.patch.object(
+                        node,
+                        "execute_command",
+                        side_effect=redis.exceptions.ConnectionError,
+                    )
+            yield
+            mocker.stopall()
+
+        terms = []
+        for indices in [(0, 1, 2), (2, 3, 4), (0, 1, 3)]:
+            with reachable(*indices):
+                assert election.lock.acquire(blocking=False, autoextend=False)
+                terms.append(election._new_term())
+                election.lock.release()
+        assert terms == [1, 2, 3]
+
+
+class TestStartStop:
+    def test_start_twice(self, election):
+        election.start()
+        with raises(InvalidOperationError):
+            election.start()
+
+    def test_stop_not_started(self, election):
+        election.stop()
+
+    def test_restart(self, election):
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        election.stop()
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        assert election.term == 2
+
+    def test_stop_from_callback(self, create_election, mock):
+        election = create_election(on_elected=lambda e: e.stop(), on_demoted=mock)
+        election.start()
+        assert wait_for(lambda: mock.called)
+        assert election.term is None
+        assert not election.lock.locked()
+
+    def test_context_manager(self, election):
+        with election as entered:
+            assert entered is election
+            assert wait_for(lambda: election.is_leader)
+        assert not election.is_leader
+        assert not election.lock.locked()
+
+    def test_lock_disowned(self, create_election, mock):
+        election = create_election(on_demoted=mock)
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        election.lock._disown()
+        assert wait_for(lambda: mock.called)
+        assert election._thread.is_alive()
+        assert wait_for(lambda: election.is_leader)
+        assert election.term == 2
+
+    def test_factory_close(self, factory, mock):
+        election = factory.leader_election("foo", on_demoted=mock)
+        election.start()
+        assert wait_for(lambda: election.is_leader)
+        thread = election._thread
+        factory.close()
+        assert not thread.is_alive()
+        mock.assert_called_once_with(election)
+        assert election.term is None
+        assert not election.lock.locked()
+
+    def test_stop_while_campaigning(self, factory, election, request):
+        other = Lock(request.node.name, nodes=factory.redis_nodes, ttl=10_000)
+        assert other.acquire(autoextend=False)
+        election.start()
+        sleep(0.05)
+        start = monotonic()
+        election.stop()
+        assert monotonic() - start < 0.1
@@ -0,0 +1,140 @@
+from threading import Thread
+from time import monotonic, sleep
+
+import redis
+from pytest import fixture, raises
+
+import redlock_plus
+from redlock_plus import Event, InsufficientNodesError
+
+
+@fixture
+def redis_nodes(fake_redis_client):
+    return redlock_plus.init_redis_nodes(
+        [fake_redis_client(), fake_redis_client(), fake_redis_client()]
+    )
+
+
+@fixture
+def event(redis_nodes, request):
+    return Event(request.node.name, nodes=redis_nodes)
+
+
+class TestInitialisation:
+    def test_insufficient_nodes(self, redis_nodes):
+        with raises(InsufficientNodesError):
+            Event("foo", nodes=redis_nodes[:2])
+
+    def test_nodes_and_connection_details_none(self):
+        with raises(ValueError):
+            Event("foo")
+
+    def test_connection_details(self, fake_redis_client):
+        event = Event(
+            "foo",
+            connection_details=[
+                fake_redis_client(),
+                fake_redis_client(),
+                fake_redis_client(),
+            ],
+        )
+        assert len(event.redis_nodes) == 3
+        assert event.quorum == 3
+
+    def test_shares_nodes_from_connection_details(self):
+        details = [{"host": "a"}, {"host": "b"}, {"host": "c"}]
+        event = Event("foo", connection_details=details)
+        lock = redlock_plus.Lock("foo", connection_details=details)
+        assert event.redis_nodes is lock.redis_nodes
+        assert redlock_plus.NODE_REGISTRY.refcount(event.redis_nodes) == 2
+        event.close()
+        event.close()
+        assert redlock_plus.NODE_REGISTRY.refcount(event.redis_nodes) == 1
+
+    def test_from_factory(self, fake_redis_client):
+        factory = redlock_plus.LockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()]
+        )
+        event = factory.event("foo")
+        assert event.name == "foo"
+        assert event.redis_nodes == factory.redis_nodes
+
+
+class TestSetClear:
+    def test_not_set(self, event):
+        assert not event.is_set()
+
+    def test_set(self, event):
+        assert event.set()
+        assert event.is_set()
+
+    def test_clear(self, event):
+        assert event.set()
+        assert event.clear()
+        assert not event.is_set()
+
+    def test_set_majority(self, event, mocker, route_through_node):
+        assert event.set()
+        node = route_through_node(event.redis_nodes[0])
+        mocker.patch.object(
+            node, "execute_command", side_effect=redis.exceptions.ConnectionError
+        )
+        assert not event.is_set()
+
+    def test_set_node_unreachable(self, event, mocker):
+        mocker.patch.object(
+            event, "_set_node", side_effect=[True, False, True],
+        )
+        assert not event.set()
+
+
+class TestWait:
+    def test_already_set(self, event):
+        assert event.set()
+        assert event.wait(timeout=0.1)
+
+    def test_timeout(self, event):
+        start = monotonic()
+        assert not event.wait(timeout=0.1)
+        assert 0.1 <= monotonic() - start < 0.5
+
+    def test_woken_up(self, event):
+        def set_later():
+            sleep(0.1)
+            event.set()
+
+        Thread(target=set_later, daemon=True).start()
+        start = monotonic()
+        assert event.wait(timeout=2)
+        assert monotonic() - start < 1
+
+    def test_woken_up_multiple(self, event, redis_nodes):
+        results = []
+        waiters = [
+            Thread(
+                target=lambda: results.append(
+                    Event(event.name, nodes=redis_nodes).wait(timeout=2)
+                ),
+                daemon=True,
+            )
+            for _ in range(3)
+        ]
+        for waiter in waiters:
+            waiter.start()
+        sleep(0.1)
+        assert event.set()
+        for waiter in waiters:
+            waiter.join()
+        assert results == [True, True, True]
+
+    def test_waiters_share_connection(self, event, redis_nodes, mocker):
+        spies = [mocker.spy(node, "pubsub") for node in redis_nodes]
+        threads = [
+            Thread(target=event.wait, kwargs={"timeout": 0.2}, daemon=True)
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [spy.call_count for spy in spies] == [1, 1, 1]
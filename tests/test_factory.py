@@ -1,7 +1,13 @@
+import threading
+from time import monotonic
+
 import pytest
+import redis
 
 from redlock_plus import LockFactory, InsufficientNodesError
 import redlock_plus
+import redlock_plus._util
+import redlock_plus.factory
 
 
 def test_create(fake_redis_client):
@@ -18,6 +24,26 @@ def test_create(fake_redis_client):
     assert lock.retry_delay == 100
 
 
+def test_shares_nodes():
+    details = [{"host": "a"}, {"host": "b"}, {"host": "c"}]
+    factory = LockFactory(details)
+    assert LockFactory(details).redis_nodes is factory.redis_nodes
+    assert redlock_plus.Lock("foo", connection_details=details).redis_nodes is (
+        factory.redis_nodes
+    )
+
+
+def test_ttls_share_pools():
+    details = [{"host": "a"}, {"host": "b"}, {"host": "c"}]
+    factory = LockFactory(details, ttl=30_000)
+    lock = factory("foo", ttl=1000)
+    assert lock.redis_nodes is factory.redis_nodes
+    assert lock._request_timeout == redlock_plus._util._node_timeout(1000)
+    # the timeout of a lock applies to its own requests, not to the shared pools
+    for node in factory.redis_nodes:
+        assert node.connection_pool.connection_kwargs.get("socket_timeout") is None
+
+
 def test_create_rlock_factory(fake_redis_client):
     factory = redlock_plus.RLockFactory(
         [fake_redis_client(), fake_redis_client(), fake_redis_client()],
@@ -42,6 +68,23 @@ def test_insufficient_redis_nodes(fake_redis_client):
         LockFactory([fake_redis_client(), fake_redis_client()])
 
 
+def test_single_node(fake_redis_client):
+    factory = redlock_plus.SingleNodeLockFactory([fake_redis_client()])
+    lock = factory("test_single_node")
+    assert isinstance(lock, redlock_plus.SingleNodeLock)
+    assert lock.quorum == 1
+
+
+def test_single_node_lock_class(fake_redis_client):
+    factory = LockFactory([fake_redis_client()], lock_class=redlock_plus.SingleNodeLock)
+    assert isinstance(factory("foo"), redlock_plus.SingleNodeLock)
+
+
+def test_single_node_insufficient_nodes():
+    with pytest.raises(InsufficientNodesError):
+        redlock_plus.SingleNodeLockFactory([])
+
+
 def test_create_from_url(fake_redis_client):
     factory = LockFactory(
         [{"url": "redis://localhost/0"}, fake_redis_client(), fake_redis_client()]
@@ -55,3 +98,359 @@ def test_create_from_url(fake_redis_client):
     assert lock.ttl == 500
     assert lock.retry_times == 5
     assert lock.retry_delay == 100
+
+
+class TestTryAcquireAny:
+    @pytest.fixture
+    def factory(self, fake_redis_client):
+        return LockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()], ttl=1000
+        )
+
+    def test_acquire_free(self, factory):
+        taken = factory("b")
+        assert taken.acquire(autoextend=False)
+
+        locks = factory.try_acquire_any(["a", "b", "c"], autoextend=False)
+        assert [lock.resource_name for lock in locks] == ["a", "c"]
+        assert all(lock.locked() for lock in locks)
+        assert taken.locked()
+
+    def test_limit_releases_surplus(self, factory):
+        locks = factory.try_acquire_any(["a", "b", "c"], limit=1, autoextend=False)
+        assert [lock.resource_name for lock in locks] == ["a"]
+        assert factory("b").acquire(blocking=False, autoextend=False)
+        assert factory("c").acquire(blocking=False, autoextend=False)
+
+    def test_empty(self, factory):
+        assert factory.try_acquire_any([]) == []
+
+    def test_duplicate_names(self, factory):
+        locks = factory.try_acquire_any(["a", "a"], autoextend=False)
+        assert [lock.resource_name for lock in locks] == ["a"]
+
+    def test_kwargs(self, factory):
+        (lock,) = factory.try_acquire_any(["a"], ttl=5000, autoextend=False)
+        assert lock.ttl == 5000
+        assert lock.check_times()[1][0] > 1000
+
+    def test_autoextend(self, factory, mocker):
+        start_autoextend = mocker.patch("redlock_plus.Lock._start_autoextend_thread")
+        assert factory.try_acquire_any(["a", "b"], autoextend_timeout=2)
+        start_autoextend.assert_has_calls([mocker.call(2)] * 2)
+
+    def test_no_round_trips_after_acquiring(self, factory, mocker):
+        locked = mocker.spy(redlock_plus.Lock, "locked")
+        locks = factory.try_acquire_any(["a", "b", "c"])
+        try:
+            locked.assert_not_called()
+            for lock in locks:
+                assert 0 < lock.deadline - monotonic() <= 1
+                assert lock._autoextend_thread.is_alive()
+        finally:
+            for lock in locks:
+                lock.stop_autoextend()
+
+    def test_validity_exceeded(self, factory, mocker):
+        mocker.patch("redlock_plus.factory.monotonic", side_effect=[0, 1000])
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
+        assert factory.try_acquire_any(["a", "b"]) == []
+        mocker.stopall()
+        assert factory("a").acquire(blocking=False, autoextend=False)
+
+    def test_stats(self, factory):
+        assert factory("b").acquire(autoextend=False)
+        assert factory.try_acquire_any(["a", "b"], autoextend=False)
+        stats = factory.stats()
+        assert (stats.acquires, stats.acquire_failures) == (3, 1)
+        assert stats.retries == {0: 3}
+        assert stats.node_requests == [2, 2, 2]
+
+    def test_profiler(self, factory):
+        profiler = redlock_plus.LockProfiler()
+        assert factory("b").acquire(autoextend=False)
+        (lock,) = factory.try_acquire_any(
+            ["a", "b"], autoextend=False, profiler=profiler
+        )
+        top = {stats.resource_name: stats for stats in profiler.top()}
+        assert (top["a"].attempts, top["a"].failures) == (1, 0)
+        assert (top["b"].attempts, top["b"].failures) == (1, 1)
+        assert lock.release()
+        hold_times = {stats.resource_name: stats.hold_time for stats in profiler.top()}
+        assert hold_times["a"] > 0
+
+    def test_rlock(self, fake_redis_client):
+        factory = redlock_plus.RLockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()]
+        )
+        (lock,) = factory.try_acquire_any(["a"])
+        assert lock._acquired == 1
+        assert lock.release()
+        assert not lock.locked()
+
+
+class TestInspect:
+    @pytest.fixture
+    def factory(self, fake_redis_client):
+        return LockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()], ttl=1000
+        )
+
+    def test_inspect(self, factory):
+        lock = factory("a", holder_info=True)
+        assert lock.acquire(autoextend=False)
+        plain_lock = factory("b")
+        assert plain_lock.acquire(autoextend=False)
+
+        info = factory.inspect(["a", "b", "c"])
+        assert list(info) == ["a", "b", "c"]
+        assert info["c"] == [None, None, None]
+        for node_info in info["a"]:
+            assert node_info.lock_key == lock.lock_key
+            assert 0 < node_info.ttl <= 1000
+            assert node_info.holder == redlock_plus.HolderInfo.from_lock_key(
+                lock.lock_key
+            )
+        for node_info in info["b"]:
+            assert node_info.lock_key == plain_lock.lock_key
+            assert node_info.holder is None
+
+    def test_node_unreachable(self, factory, mocker):
+        assert factory("a").acquire(autoextend=False)
+        node = factory.redis_nodes[0]
+        mocker.patch.object(
+            node.redlock_bounded_clients.get(factory.request_timeout),
+            "pipeline",
+            side_effect=lambda **kw: mocker.Mock(
+                execute=mocker.Mock(side_effect=redis.exceptions.ConnectionError)
+            ),
+        )
+        info = factory.inspect(["a"])
+        assert info["a"][0] is None
+        assert all(info["a"][1:])
+
+
+class TestCheckAll:
+    @pytest.fixture
+    def factory(self, fake_redis_client):
+        return LockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()], ttl=10_000,
+        )
+
+    def test_check_all(self, factory):
+        held = [factory("a"), factory("b")]
+        for lock in held:
+            assert lock.acquire(autoextend=False)
+        not_acquired = factory("c")
+        result = factory.check_all([*held, not_acquired])
+        assert list(result) == [*held, not_acquired]
+        for lock in held:
+            assert 9_000 < result[lock] <= 10_000
+            assert result[lock] == pytest.approx(min(lock.check_times()[1]), abs=50)
+        assert result[not_acquired] == 0.0
+
+    def test_not_held(self, factory):
+        lock = factory("a")
+        assert lock.acquire(autoextend=False)
+        factory.redis_nodes[0].set("a", "someone else")
+        assert factory.check_all([lock]) == {lock: 0.0}
+
+    def test_single_round_trip(self, factory, mocker):
+        locks = [factory(name) for name in "abcd"]
+        for lock in locks:
+            assert lock.acquire(autoextend=False)
+        spy = mocker.spy(redlock_plus.factory, "_bounded_pipeline")
+        assert all(factory.check_all(locks).values())
+        assert spy.call_count == len(factory.redis_nodes)
+        for node in factory.redis_nodes:
+            spy.assert_any_call(node, factory.request_timeout)
+
+    def test_node_unreachable(self, factory, mocker):
+        lock = factory("a")
+        assert lock.acquire(autoextend=False)
+        node = factory.redis_nodes[0]
+        mocker.patch.object(
+            node.redlock_bounded_clients.get(factory.request_timeout),
+            "pipeline",
+            side_effect=lambda **kw: mocker.Mock(
+                execute=mocker.Mock(side_effect=redis.exceptions.ConnectionError)
+            ),
+        )
+        assert factory.check_all([lock]) == {lock: 0.0}
+
+    def test_nothing_held(self, factory, mocker):
+        spy = mocker.spy(redlock_plus.factory, "_bounded_pipeline")
+        lock = factory("a")
+        assert factory.check_all([lock]) == {lock: 0.0}
+        spy.assert_not_called()
+
+    def test_other_factory(self, factory, fake_redis_client):
+        other = LockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()]
+        )
+        with pytest.raises(ValueError):
+            factory.check_all([other("a")])
+
+
+class TestStats:
+    @pytest.fixture
+    def factory(self, fake_redis_client):
+        return LockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()],
+            ttl=10_000,
+            retry_delay=10,
+        )
+
+    def test_empty(self, factory):
+        stats = factory.stats()
+        assert stats.active_locks == stats.acquires == stats.extends == 0
+        assert sum(stats.acquire_latency.values()) == 0
+        assert stats.retries == {}
+        assert stats.node_requests == stats.node_errors == [0, 0, 0]
+        assert stats.extend_success_rate == 1.0
+        assert stats.node_error_rates == [0.0, 0.0, 0.0]
+
+    def test_acquire(self, factory):
+        held = factory("a")
+        assert held.acquire(autoextend=False)
+        assert not factory("a").acquire(blocking=False)
+        other = factory("b")
+        assert other.acquire(autoextend=False)
+        stats = factory.stats()
+        assert stats.active_locks == 2
+        assert (stats.acquires, stats.acquire_failures) == (3, 1)
+        assert sum(stats.acquire_latency.values()) == 3
+        assert stats.validity[10_000] == 2
+        assert stats.retries == {0: 2, 3: 1}
+        held.release()
+        assert factory.stats().active_locks == 1
+
+    def test_acquire_without_rounds(self, factory):
+        assert not factory("a").acquire(timeout=1e-9)
+        stats = factory.stats()
+        assert (stats.acquires, stats.acquire_failures) == (1, 1)
+        assert stats.retries == {0: 1}
+
+    def test_extend(self, factory):
+        lock = factory("a")
+        assert lock.acquire(autoextend=False)
+        assert lock.extend()
+        lock.redis_nodes[0].delete("a")
+        lock.redis_nodes[1].delete("a")
+        assert not lock.extend(retry_times=0)
+        stats = factory.stats()
+        assert (stats.extends, stats.extend_failures) == (2, 1)
+        assert stats.extend_success_rate == 0.5
+
+    def test_node_errors(self, factory, mocker):
+        mocker.patch.object(
+            factory.redis_nodes[0],
+            "redlock_acquire_script",
+            side_effect=redis.exceptions.ConnectionError,
+        )
+        lock = factory("a")
+        assert not lock.acquire(blocking=False)
+        stats = factory.stats()
+        # every round requests all nodes, and releases them after failing
+        assert stats.node_requests == [8, 8, 8]
+        assert stats.node_errors == [4, 0, 0]
+        assert stats.node_error_rates == [0.5, 0.0, 0.0]
+
+    def test_merges_threads(self, factory):
+        def work():
+            lock = factory(threading.current_thread().name)
+            assert lock.acquire(autoextend=False)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        assert factory("main").acquire(autoextend=False)
+        for thread in threads:
+            thread.join()
+        assert factory.stats().acquires == 5
+        # shards of terminated threads are folded into one
+        assert len(factory._stats._shards) == 1
+        assert factory.stats().acquires == 5
+
+    def test_other_locks_not_recorded(self, factory):
+        lock = redlock_plus.Lock("a", nodes=factory.redis_nodes)
+        assert lock.acquire(autoextend=False)
+        assert factory.stats().acquires == 0
+
+
+class TestClose:
+    @pytest.fixture
+    def clients(self, fake_redis_client):
+        return [fake_redis_client(), fake_redis_client(), fake_redis_client()]
+
+    @pytest.fixture
+    def factory(self, clients):
+        return LockFactory(clients, ttl=10_000)
+
+    def test_releases_held_locks(self, factory, clients):
+        held = [factory("a"), factory("b")]
+        for lock in held:
+            assert lock.acquire(blocking=False)
+        not_held = factory("c")
+        factory.close()
+        for lock in [*held, not_held]:
+            assert lock.lock_key is None
+            assert lock._autoextend_thread is None
+        for client in clients:
+            assert client.keys() == []
+
+    def test_single_request_per_node(self, factory, mocker):
+        locks = [factory(name) for name in "abc"]
+        for lock in locks:
+            assert lock.acquire(blocking=False, autoextend=False)
+        release_node = mocker.patch("redlock_plus.Lock._release_node")
+        release_many = [
+            mocker.patch.object(node, "redlock_release_many_script")
+            for node in factory.redis_nodes
+        ]
+        factory.close()
+        release_node.assert_not_called()
+        for script in release_many:
+            script.assert_called_once()
+            assert sorted(script.call_args[1]["keys"]) == ["a", "b", "c"]
+
+    def test_keeps_locks_of_others(self, factory, clients):
+        other = LockFactory(clients)("a")
+        assert other.acquire(blocking=False, autoextend=False)
+        factory.close()
+        assert other.locked()
+
+    def test_rlock(self, clients):
+        factory = redlock_plus.RLockFactory(clients)
+        lock = factory("a")
+        assert lock.acquire() and lock.acquire()
+        factory.close()
+        assert lock._acquired == 0
+
+    def test_closed(self, factory):
+        factory.close()
+        factory.close()
+        with pytest.raises(redlock_plus.InvalidOperationError):
+            factory("a")
+
+    def test_disconnects_shared_nodes(self, mocker):
+        details = [{"host": "a"}, {"host": "b"}, {"host": "c"}]
+        factory = LockFactory(details)
+        other = LockFactory(details)
+        disconnect = [
+            mocker.patch.object(node.connection_pool, "disconnect")
+            for node in factory.redis_nodes
+        ]
+        factory.close()
+        for mock in disconnect:
+            mock.assert_not_called()
+        other.close()
+        for mock in disconnect:
+            mock.assert_called_once_with()
+
+    def test_context_manager(self, clients, mocker):
+        close = mocker.patch.object(LockFactory, "close")
+        with LockFactory(clients) as factory:
+            assert isinstance(factory, LockFactory)
+            close.assert_not_called()
+        close.assert_called_once_with()
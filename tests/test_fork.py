@@ -0,0 +1,167 @@
+import os
+import pickle
+from time import monotonic
+
+import redis
+from pytest import approx, fixture, mark
+
+import redlock_plus
+import redlock_plus._util
+import redlock_plus.lock
+from redlock_plus import (
+    NODE_REGISTRY,
+    ClockDriftMonitor,
+    Lock,
+    LockFactory,
+    NodeRegistry,
+    RenewalPolicy,
+    RLock,
+)
+
+
+@fixture
+def real_redis(monkeypatch):
+    # pickled nodes are restored as real clients, undo the global patch of the conftest
+    monkeypatch.setattr(
+        "redlock_plus.nodes.redis.StrictRedis", redis.client.StrictRedis
+    )
+
+
+@fixture
+def real_nodes(real_redis):
+    # clients only connect once a command is sent
+    return [
+        redis.client.StrictRedis(host="redis-a", port=6380, db=1),
+        redis.client.StrictRedis(host="redis-b", port=6381, db=2),
+        redis.client.StrictRedis(host="redis-c", port=6382, db=3),
+    ]
+
+
+class TestAfterFork:
+    def test_lock_not_owned(self, lock):
+        assert lock.acquire()
+        redlock_plus._util._after_fork_in_child()
+        assert lock.lock_key is None
+        assert lock.deadline is None
+        assert lock._autoextend_thread is None
+
+    def test_rlock_not_owned(self, rlock):
+        assert rlock.acquire()
+        assert rlock.acquire()
+        redlock_plus._util._after_fork_in_child()
+        assert rlock._acquired == 0
+        assert rlock.lock_key is None
+
+    def test_resets_connection_pools(self, lock, mocker):
+        pools = [node.connection_pool for node in lock.redis_nodes]
+        for pool in pools:
+            mocker.patch.object(pool, "reset")
+        redlock_plus._util._after_fork_in_child()
+        for pool in pools:
+            pool.reset.assert_called_with()
+
+    def test_factory_resets_connection_pools(self, fake_redis_client, mocker):
+        factory = LockFactory([fake_redis_client() for _ in range(3)])
+        pools = [node.connection_pool for node in factory.redis_nodes]
+        for pool in pools:
+            mocker.patch.object(pool, "reset")
+        redlock_plus._util._after_fork_in_child()
+        for pool in pools:
+            pool.reset.assert_called_once_with()
+
+    def test_clock_monitor(self):
+        monitor = ClockDriftMonitor()
+        monitor._lock.acquire()
+        redlock_plus._util._after_fork_in_child()
+        assert monitor._lock.acquire(blocking=False)
+
+    @mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+    def test_fork(self, lock):
+        assert lock.acquire()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            owned = lock.lock_key is not None or lock._autoextend_thread is not None
+            os.write(write_fd, b"1" if owned else b"0")
+            os._exit(0)
+        os.waitpid(pid, 0)
+        assert os.read(read_fd, 1) == b"0"
+        assert lock.lock_key is not None
+        assert lock.locked()
+
+
+class TestPickle:
+    def test_nodes(self, real_nodes):
+        lock = pickle.loads(pickle.dumps(Lock("foo", nodes=real_nodes)))
+        assert [
+            node.connection_pool.connection_kwargs for node in lock.redis_nodes
+        ] == [node.connection_pool.connection_kwargs for node in real_nodes]
+        assert all(hasattr(node, "redlock_release_script") for node in lock.redis_nodes)
+
+    def test_state(self, real_nodes):
+        lock = Lock("foo", nodes=real_nodes, ttl=5000, retry_times=1)
+        lock.lock_key = "key"
+        lock.deadline = monotonic() + 10
+        restored = pickle.loads(pickle.dumps(lock))
+        assert restored.resource_name == "foo"
+        assert restored.ttl == 5000
+        assert restored.retry_times == 1
+        assert restored.lock_key == "key"
+        assert restored.deadline == approx(lock.deadline, abs=0.05)
+        assert restored._autoextend_thread is None
+
+    def test_not_acquired(self, real_nodes):
+        lock = pickle.loads(pickle.dumps(Lock("foo", nodes=real_nodes)))
+        assert lock.lock_key is None
+        assert lock.deadline is None
+
+    def test_rlock(self, real_nodes):
+        lock = RLock("foo", nodes=real_nodes)
+        lock._acquired = 2
+        assert pickle.loads(pickle.dumps(lock))._acquired == 2
+
+    def test_clock_monitor(self, real_nodes):
+        monitor = ClockDriftMonitor()
+        monitor._drift_factors[real_nodes[0]] = 0.1
+        lock = Lock("foo", nodes=real_nodes, clock_monitor=monitor)
+        restored = pickle.loads(pickle.dumps(lock))
+        assert restored.clock_monitor.min_window == monitor.min_window
+        assert restored.clock_monitor._drift_factors == {}
+        assert restored.clock_monitor._lock.acquire(blocking=False)
+
+    def test_callbacks_not_pickled(self, real_nodes):
+        lock = Lock(
+            "foo",
+            nodes=real_nodes,
+            on_lost=lambda lock: None,
+            profiler=redlock_plus.LockProfiler(),
+            renewal_policy=RenewalPolicy(renew_at=0.5),
+        )
+        restored = pickle.loads(pickle.dumps(lock))
+        assert restored.on_lost is None
+        assert restored.profiler is None
+        assert restored.renewal_policy is not lock.renewal_policy
+        assert restored.renewal_policy.renew_at == RenewalPolicy().renew_at
+
+    def test_shares_registry_nodes(self, real_redis):
+        lock = Lock("foo", connection_details=[{"host": "a"}] * 3)
+        restored = pickle.loads(pickle.dumps(lock))
+        assert restored.redis_nodes is lock.redis_nodes
+        assert NODE_REGISTRY.refcount(lock.redis_nodes) == 2
+        restored.close()
+        assert NODE_REGISTRY.refcount(lock.redis_nodes) == 1
+
+    def test_factory_lock_shares_registry_nodes(self, real_redis):
+        factory = LockFactory([{"host": "a"}] * 3)
+        restored = pickle.loads(pickle.dumps(factory("foo")))
+        assert restored.redis_nodes is factory.redis_nodes
+
+    def test_new_registry(self, real_redis, monkeypatch):
+        lock = Lock("foo", connection_details=[{"host": "a"}] * 3, ttl=10_000)
+        data = pickle.dumps(lock)
+        # unpickle as a new process would
+        monkeypatch.setattr("redlock_plus.lock.NODE_REGISTRY", NodeRegistry())
+        restored = pickle.loads(data)
+        assert restored.redis_nodes is not lock.redis_nodes
+        assert redlock_plus.lock.NODE_REGISTRY.refcount(restored.redis_nodes) == 1
+        assert restored._request_timeout == redlock_plus._util._node_timeout(10_000)
@@ -0,0 +1,302 @@
+import fnmatch
+from unittest.mock import patch
+
+import lupa
+import redis
+from pytest import fixture, raises
+
+import redlock_plus
+from redlock_plus.nodes import _FunctionCaller
+from redlock_plus.scripts import FUNCTION_LIBRARY_CODE, FUNCTION_LIBRARY_NAME
+from redlock_plus.scripts import _NODE_SCRIPTS, _function_name
+
+# name of the library of another version of the scripts
+OTHER_VERSION = "redlock_plus_0123456789ab"
+
+
+@fixture
+def emulate_functions(mocker, route_through_node):
+    """
+    Emulate FUNCTION LOAD, LIST, DELETE and FCALL on a fakeredis client, which does
+    not support them, by evaluating the source of the called function as a script
+    """
+
+    def inner(node):
+        route_through_node(node)
+        libraries = []
+        execute_command = node.execute_command
+
+        def emulate(*args, **options):
+            if args[:2] == ("FUNCTION", "LOAD"):
+                name = args[2].split("\n", 1)[0].split("name=")[1]
+                if name in libraries:
+                    raise redis.exceptions.ResponseError(
+                        f"Library '{name}' already exists"
+                    )
+                libraries.append(name)
+                return name
+            if args[:2] == ("FUNCTION", "LIST"):
+                return [
+                    ["library_name", name, "engine", "LUA", "functions", []]
+                    for name in libraries
+                    if fnmatch.fnmatchcase(name, args[3])
+                ]
+            if args[:2] == ("FUNCTION", "DELETE"):
+                if args[2] not in libraries:
+                    raise redis.exceptions.ResponseError("Library not found")
+                libraries.remove(args[2])
+                return "OK"
+            if args[0] == "FCALL":
+                if FUNCTION_LIBRARY_NAME not in libraries:
+                    raise redis.exceptions.ResponseError("Function not found")
+                prefix = len(FUNCTION_LIBRARY_NAME) + 1
+                suffix = args[1][prefix:]
+                source = _NODE_SCRIPTS[f"redlock_{suffix}_script"]
+                return execute_command("EVAL", source, *args[2:], **options)
+            return execute_command(*args, **options)
+
+        def pipeline(transaction=True, shard_hint=None):
+            # pipelined commands are sent over a connection, emulate them one by one
+            pipe = create_pipeline(transaction=transaction, shard_hint=shard_hint)
+
+            def execute(raise_on_error=True):
+                try:
+                    return [
+                        emulate(*args, **options)
+                        for args, options in pipe.command_stack
+                    ]
+                finally:
+                    pipe.reset()
+
+            pipe.execute = execute
+            return pipe
+
+        create_pipeline = node.pipeline
+        mocker.patch.object(node, "execute_command", side_effect=emulate)
+        mocker.patch.object(node, "pipeline", side_effect=pipeline)
+        node.libraries = libraries
+        return node
+
+    return inner
+
+
+@fixture
+def nodes(fake_redis_client, emulate_functions):
+    return [emulate_functions(fake_redis_client()) for _ in range(3)]
+
+
+class TestLibrary:
+    def test_registers_all_scripts(self):
+        registered = {}
+        runtime = lupa.LuaRuntime()
+        runtime.execute("redis = {}")
+        runtime.globals().redis.register_function = registered.__setitem__
+        # the shebang is not part of the lua code
+        runtime.execute(FUNCTION_LIBRARY_CODE.split("\n", 1)[1])
+        assert set(registered) == {
+            _function_name(attribute) for attribute in _NODE_SCRIPTS
+        }
+        assert all(name.startswith(FUNCTION_LIBRARY_NAME) for name in registered)
+
+    def test_function_name(self):
+        assert (
+            _function_name("redlock_get_ttl_script")
+            == f"{FUNCTION_LIBRARY_NAME}_get_ttl"
+        )
+
+    def test_versioned(self):
+        assert FUNCTION_LIBRARY_CODE.startswith(f"#!lua name={FUNCTION_LIBRARY_NAME}\n")
+        assert len(FUNCTION_LIBRARY_NAME) == len("redlock_plus_") + 12
+
+
+class TestInitRedisNodes:
+    def test_installs_library(self, nodes):
+        redlock_plus.init_redis_nodes(nodes, functions=True)
+        for node in nodes:
+            assert node.libraries == [FUNCTION_LIBRARY_NAME]
+            for attribute in _NODE_SCRIPTS:
+                assert isinstance(getattr(node, attribute), _FunctionCaller)
+
+    def test_already_installed(self, nodes):
+        redlock_plus.init_redis_nodes(nodes, functions=True)
+        redlock_plus.init_redis_nodes(nodes, functions=True)
+        assert nodes[0].libraries == [FUNCTION_LIBRARY_NAME]
+
+    def test_deletes_other_versions(self, nodes):
+        custom = ["redlock_plus_custom", "other"]
+        nodes[0].libraries.extend([OTHER_VERSION, *custom])
+        redlock_plus.init_redis_nodes(nodes, functions=True)
+        assert nodes[0].libraries == [*custom, FUNCTION_LIBRARY_NAME]
+
+    def test_keeps_other_versions_if_installed(self, nodes):
+        nodes[0].libraries.extend([FUNCTION_LIBRARY_NAME, OTHER_VERSION])
+        redlock_plus.init_redis_nodes(nodes, functions=True)
+        assert nodes[0].libraries == [FUNCTION_LIBRARY_NAME, OTHER_VERSION]
+
+    def test_deletes_other_versions_bytes(self, fake_redis_client, mocker):
+        node = fake_redis_client()
+        old = OTHER_VERSION.encode()
+        execute_command = mocker.patch.object(
+            node,
+            "execute_command",
+            side_effect=[b"OK", [[b"library_name", old, b"engine", b"LUA"]], b"OK"],
+        )
+        redlock_plus.init_redis_nodes([node], functions=True)
+        execute_command.assert_called_with("FUNCTION", "DELETE", OTHER_VERSION)
+
+    def test_other_version_deleted_concurrently(self, nodes, mocker):
+        nodes[0].libraries.append(OTHER_VERSION)
+        emulate = nodes[0].execute_command.side_effect
+
+        def delete_first(*args, **options):
+            if args[:2] == ("FUNCTION", "DELETE"):
+                nodes[0].libraries.remove(args[2])
+            return emulate(*args, **options)
+
+        nodes[0].execute_command.side_effect = delete_first
+        redlock_plus.init_redis_nodes(nodes, functions=True)
+        assert nodes[0].libraries == [FUNCTION_LIBRARY_NAME]
+
+    def test_not_supported(self, fake_redis_client):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()], functions=True)[0]
+        assert isinstance(node.redlock_acquire_script, redis.client.Script)
+
+    def test_unreachable(self, fake_redis_client):
+        node = fake_redis_client()
+        with patch.object(
+            node, "execute_command", side_effect=redis.exceptions.ConnectionError
+        ):
+            redlock_plus.init_redis_nodes([node], functions=True)
+        assert isinstance(node.redlock_acquire_script, _FunctionCaller)
+        # the node turns out not to support functions on the first call
+        assert node.redlock_acquire_script(keys=["foo"], args=["token", 1000]) == 1
+        assert node.get("foo") == "token"
+        assert isinstance(node.redlock_acquire_script, redis.client.Script)
+        assert isinstance(node.redlock_release_script, redis.client.Script)
+
+    def test_error(self, fake_redis_client, mocker):
+        node = fake_redis_client()
+        mocker.patch.object(
+            node,
+            "execute_command",
+            side_effect=redis.exceptions.ResponseError("Error compiling function"),
+        )
+        with raises(redis.exceptions.ResponseError):
+            redlock_plus.init_redis_nodes([node], functions=True)
+
+    def test_default_scripts(self, nodes):
+        redlock_plus.init_redis_nodes(nodes)
+        assert nodes[0].libraries == []
+        assert isinstance(nodes[0].redlock_acquire_script, redis.client.Script)
+
+
+class TestFunctionCaller:
+    @fixture
+    def node(self, nodes):
+        return redlock_plus.init_redis_nodes(nodes[:1], functions=True)[0]
+
+    def test_call(self, node):
+        assert node.redlock_acquire_script(keys=["foo"], args=["token", 1000]) == 1
+        assert node.get("foo") == "token"
+        node.execute_command.assert_any_call(
+            "FCALL", f"{FUNCTION_LIBRARY_NAME}_acquire", 1, "foo", "token", 1000
+        )
+
+    def test_reinstalls_library(self, node):
+        node.libraries.clear()
+        assert node.redlock_release_script(keys=["foo"], args=["token"]) == 0
+        assert node.libraries == [FUNCTION_LIBRARY_NAME]
+
+    def test_reinstall_keeps_other_versions(self, node):
+        # a newer version replaced the library, it must not be deleted in turn
+        node.libraries[:] = [OTHER_VERSION]
+        assert node.redlock_release_script(keys=["foo"], args=["token"]) == 0
+        assert node.libraries == [OTHER_VERSION, FUNCTION_LIBRARY_NAME]
+
+    def test_other_error(self, node, mocker):
+        node.execute_command.side_effect = redis.exceptions.ResponseError("WRONGTYPE")
+        with raises(redis.exceptions.ResponseError):
+            node.redlock_release_script(keys=["foo"], args=["token"])
+
+    def test_pipeline(self, node, mocker):
+        pipeline = node.pipeline(transaction=False)
+        mocker.patch.object(pipeline, "execute_command")
+        node.redlock_get_ttl_script(keys=["foo"], args=["token"], client=pipeline)
+        pipeline.execute_command.assert_called_once_with(
+            "FCALL", f"{FUNCTION_LIBRARY_NAME}_get_ttl", 1, "foo", "token"
+        )
+
+
+class TestLockFactory:
+    def test_functions(self, nodes):
+        factory = redlock_plus.LockFactory(nodes, functions=True)
+        lock = factory("foo", ttl=10_000)
+        assert lock.acquire(autoextend=False)
+        assert lock.extend()
+        assert lock.locked()
+        assert lock.release()
+        assert not lock.locked()
+        assert nodes[0].libraries == [FUNCTION_LIBRARY_NAME]
+
+    def test_check_all_reinstalls_library(self, nodes):
+        factory = redlock_plus.LockFactory(nodes, functions=True)
+        lock = factory("foo", ttl=10_000)
+        assert lock.acquire(autoextend=False)
+        nodes[0].libraries.clear()
+        assert factory.check_all([lock])[lock] > 9000
+        assert nodes[0].libraries == [FUNCTION_LIBRARY_NAME]
+
+    def test_unreachable_not_supported(self, fake_redis_client):
+        nodes = [fake_redis_client() for _ in range(3)]
+        for node in nodes:
+            with patch.object(
+                node, "execute_command", side_effect=redis.exceptions.ConnectionError
+            ):
+                redlock_plus.init_redis_nodes([node], functions=True)
+        factory = redlock_plus.LockFactory(nodes)
+        lock = factory("foo", ttl=10_000)
+        assert lock.acquire(autoextend=False)
+        assert all(
+            isinstance(node.redlock_acquire_script, redis.client.Script)
+            for node in nodes
+        )
+        assert factory.check_all([lock])[lock] > 9000
+        assert lock.release()
+
+    def test_check_all_not_supported(self, fake_redis_client):
+        nodes = [fake_redis_client() for _ in range(3)]
+        factory = redlock_plus.LockFactory(nodes)
+        lock = factory("foo", ttl=10_000)
+        assert lock.acquire(autoextend=False)
+        for node in nodes:
+            for attribute in _NODE_SCRIPTS:
+                setattr(node, attribute, _FunctionCaller(node, attribute))
+        assert factory.check_all([lock])[lock] > 9000
+        assert isinstance(nodes[0].redlock_get_ttl_script, redis.client.Script)
+
+    def test_try_acquire_any(self, nodes):
+        factory = redlock_plus.LockFactory(nodes, functions=True)
+        locks = factory.try_acquire_any(["foo", "bar"], autoextend=False)
+        assert [lock.resource_name for lock in locks] == ["foo", "bar"]
+
+    def test_registry_key(self):
+        details = [{"host": "a"}]
+        key = redlock_plus.NodeRegistry._key(details)
+        assert redlock_plus.NodeRegistry._key(details, functions=True) != key
+
+    def test_pickle(self, nodes):
+        lock = redlock_plus.Lock("foo", nodes=nodes)
+        assert not lock.__getstate__()["functions"]
+        lock = redlock_plus.Lock(
+            "foo", nodes=redlock_plus.init_redis_nodes(nodes, functions=True)
+        )
+        assert lock.__getstate__()["functions"]
+
+    def test_unpickle_without_functions(self, lock):
+        state = lock.__getstate__()
+        del state["functions"]
+        unpickled = redlock_plus.Lock.__new__(redlock_plus.Lock)
+        unpickled.__setstate__(state)
+        assert isinstance(
+            unpickled.redis_nodes[0].redlock_acquire_script, redis.client.Script
+        )
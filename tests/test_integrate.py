@@ -4,13 +4,16 @@ No patching/mocking of non-external resources
 """
 
 
-from time import monotonic, sleep
+from time import monotonic, sleep, time
 from threading import Thread
 import itertools
+import os
+import socket
 
 from pytest import raises, mark
 
 import redlock_plus
+import redlock_plus._util
 
 
 def acquire_params(
@@ -35,6 +38,27 @@ class TestAcquire:
         assert not lock.acquire(blocking=False)
         assert not create_lock(ttl=1000).acquire(blocking=False)
 
+    def test_contention(self, create_lock):
+        lock = create_lock(ttl=1000)
+        assert lock.acquire(autoextend=False)
+        result = create_lock(ttl=1000).acquire(blocking=False)
+        assert not result
+        assert isinstance(result, redlock_plus.LockContention)
+        assert len(result.ttls) == 3
+        assert all(0 < ttl <= 1000 for ttl in result.ttls)
+        assert 0 < result.retry_after <= 1000
+        assert result.holders == [None, None, None]
+
+    def test_contention_holder_info(self, create_lock):
+        lock = create_lock(ttl=1000, holder_info=True)
+        assert lock.acquire(autoextend=False)
+        result = create_lock().acquire(blocking=False)
+        assert len(result.holders) == 3
+        for holder in result.holders:
+            assert holder.pid == os.getpid()
+            assert holder.hostname == socket.gethostname()
+            assert time() - 10 < holder.acquired_at <= time()
+
     def test_validity(self, create_lock):
         ttl = 1000
         lock = create_lock(ttl=ttl)
@@ -154,13 +178,27 @@ class TestExtend:
     def test(self, create_lock, args_acquire):
         lock = create_lock(ttl=100)
         validity = lock.acquire(*args_acquire)
-        start = redlock_plus._monotonic_ms()
+        start = redlock_plus._util._monotonic_ms()
         assert validity
         sleep(validity * 0.75 / 1000)
-        assert lock.extend() > validity - redlock_plus._monotonic_ms() - start
+        assert lock.extend() > validity - redlock_plus._util._monotonic_ms() - start
         assert lock.locked()
 
 
+class TestClockDriftMonitor:
+    def test_calibrates(self, create_lock):
+        monitor = redlock_plus.ClockDriftMonitor(min_window=50)
+        lock = create_lock(ttl=10_000, clock_monitor=monitor)
+        assert lock.acquire(autoextend=False)
+        assert lock.extend()
+        assert monitor.drift_factor(lock.redis_nodes) is None
+        sleep(0.1)
+        locked, times = lock.check_times()
+        assert locked
+        assert monitor.drift_factor(lock.redis_nodes) is not None
+        assert lock.extend()
+
+
 @mark.slow
 class TestAcquireOrExtend:
     @mark.parametrize("args_acquire_or_extend", acquire_params())
@@ -173,12 +211,12 @@ class TestAcquireOrExtend:
     def test_acquired(self, create_lock, args_acquire, args_acquire_or_extend):
         lock = create_lock(ttl=200)
         validity = lock.acquire(*args_acquire)
-        start = redlock_plus._monotonic_ms()
+        start = redlock_plus._util._monotonic_ms()
         assert validity
         sleep(validity * 0.75 / 1000)
         assert (
             lock.acquire_or_extend(*args_acquire_or_extend)
-            > validity - redlock_plus._monotonic_ms() - start
+            > validity - redlock_plus._util._monotonic_ms() - start
         )
         assert lock.locked()
 
@@ -205,3 +243,44 @@ class TestContextManager:
             assert validity
             sleep(0.2)  # should have timed out, autoextend should have renewed
             assert lock.locked()
+
+
+class TestHandoff:
+    def test_adopt(self, create_lock):
+        lock = create_lock(ttl=1000)
+        assert lock.acquire()
+        lease = lock.handoff()
+        assert not lock.locked()
+
+        lock2 = create_lock(ttl=1000)
+        assert lock2.adopt(lease, autoextend=False)
+        assert lock2.locked()
+        assert lock2.lock_key == lease.lock_key
+        assert not create_lock().acquire(blocking=False)
+        assert lock2.release()
+
+    def test_adopt_transfer(self, create_lock):
+        lock = create_lock(ttl=1000)
+        assert lock.acquire(autoextend=False)
+        lease = lock.handoff()
+
+        lock2 = create_lock(ttl=2000)
+        validity = lock2.adopt(lease, transfer=True, autoextend=False)
+        assert validity > 1000
+        assert lock2.lock_key != lease.lock_key
+        assert lock2.locked()
+
+        # the previous token is not valid anymore
+        lock.lock_key = lease.lock_key
+        assert not lock.locked()
+
+    def test_adopt_transfer_released(self, create_lock):
+        lock = create_lock(ttl=1000)
+        assert lock.acquire(autoextend=False)
+        lease = lock.handoff()
+        lock.lock_key = lease.lock_key
+        assert lock.release()
+
+        lock2 = create_lock()
+        assert not lock2.adopt(lease, transfer=True)
+        assert create_lock().acquire(blocking=False)
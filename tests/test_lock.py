@@ -1,16 +1,27 @@
-from unittest.mock import MagicMock, call
-from time import sleep, monotonic
+from unittest.mock import ANY, MagicMock, call
+from time import sleep, monotonic, time
+import threading
 
 import redis
-from pytest import fixture, raises
+from pytest import approx, fixture, raises
 from pytest import mark
 
 from redlock_plus import (
     CLOCK_DRIFT_FACTOR,
+    ClockDriftMonitor,
     InsufficientNodesError,
     Lock,
+    HolderInfo,
     InvalidOperationError,
+    Lease,
+    LockContention,
+    LockExpiredError,
+    NODE_REGISTRY,
+    NODE_TIMEOUT_FACTOR,
+    RenewalPolicy,
+    SingleNodeLock,
 )
+from redlock_plus.autoextend import _AutoextendThread
 
 
 class TestInitialisation:
@@ -40,24 +51,136 @@ class TestInitialisation:
         assert len(lock.redis_nodes) == 3
         assert lock.quorum == 3
 
+    def test_insufficient_nodes_message(self, create_fake_nodes):
+        with raises(InsufficientNodesError, match="At least 3 redis nodes") as exc:
+            Lock("insufficient_nodes", nodes=create_fake_nodes(2))
+        assert (exc.value.node_count, exc.value.min_nodes) == (2, 3)
+
+    def test_request_timeout(self):
+        lock = Lock("foo", connection_details=[{"host": "a"}] * 3, ttl=10_000)
+        client = lock._client(lock.redis_nodes[0], deadline=5)
+        assert client.node is lock.redis_nodes[0]
+        assert client.timeout == 10_000 * NODE_TIMEOUT_FACTOR / 1000
+        assert client.deadline == 5
+        # the nodes are shared with locks of other ttls, so they are left as they are
+        kwargs = lock.redis_nodes[0].connection_pool.connection_kwargs
+        assert kwargs.get("socket_timeout") is None
+
+    def test_shares_nodes_from_connection_details(self):
+        details = [{"host": "a"}, {"host": "b"}, {"host": "c"}]
+        lock = Lock("foo", connection_details=details)
+        other = Lock("bar", connection_details=details)
+        assert lock.redis_nodes is other.redis_nodes
+        assert NODE_REGISTRY.refcount(lock.redis_nodes) == 2
+
+    def test_releases_nodes_on_gc(self):
+        lock = Lock("foo", connection_details=[{"host": "a"}] * 3)
+        nodes = lock.redis_nodes
+        del lock
+        assert NODE_REGISTRY.refcount(nodes) == 0
+
+    def test_releases_nodes_on_error(self):
+        details = [{"host": "a"}, {"host": "b"}]
+        with raises(InsufficientNodesError):
+            Lock("foo", connection_details=details)
+        NODE_REGISTRY.refcount([])  # process deferred releases
+        key = NODE_REGISTRY._key(details)
+        assert key not in NODE_REGISTRY._nodes
+
+    def test_close(self, mocker):
+        lock = Lock("foo", connection_details=[{"host": "a"}] * 3)
+        mocker.patch.object(lock, "stop_autoextend")
+        lock.close()
+        lock.close()
+        assert NODE_REGISTRY.refcount(lock.redis_nodes) == 0
+        lock.stop_autoextend.assert_called_with()
+
+    def test_close_nodes(self, create_fake_nodes):
+        Lock("foo", nodes=create_fake_nodes(3)).close()
+
+    def test_ttl_updates_drift(self, create_fake_nodes):
+        lock = Lock("ttl_drift", nodes=create_fake_nodes(3), ttl=1000)
+        assert lock._drift == 1000 * CLOCK_DRIFT_FACTOR + 2
+        lock.ttl = 50
+        assert lock.ttl == 50
+        assert lock._drift == 50 * CLOCK_DRIFT_FACTOR + 2
+
+        assert lock._token_ttl_args == [None, b"50"]
+
+
+class TestEncodedArgs:
+    def test_encoded(self, lock):
+        lock.lock_key = "foo"
+        assert lock._keys_arg == [b"test_encoded"]
+        assert lock._token_args == [b"foo"]
+        assert lock._token_ttl_args == [b"foo", b"120000"]
+        lock.lock_key = None
+        assert lock._token_args == [None]
+
+    def test_resource_name(self, lock):
+        lock.resource_name = "bar"
+        assert lock.resource_name == "bar"
+        assert lock._keys_arg == [b"bar"]
+
+    def test_node_encoding(self, create_lock):
+        nodes = [redis.StrictRedis(encoding="latin-1") for _ in range(3)]
+        lock = create_lock("ä", nodes=nodes)
+        assert lock._keys_arg == ["ä".encode("latin-1")]
+
+    def test_mixed_encodings(self, create_lock):
+        nodes = [redis.StrictRedis(encoding="latin-1"), redis.StrictRedis()]
+        lock = create_lock("ä", nodes=[*nodes, redis.StrictRedis()])
+        assert lock._keys_arg == ["ä"]
+
+    def test_unknown_encoding(self, create_fake_nodes):
+        lock = Lock("foo", nodes=create_fake_nodes(3))
+        assert lock._keys_arg == ["foo"]
+
+    def test_stored_as_str(self, lock):
+        assert lock.acquire(autoextend=False)
+        for node in lock.redis_nodes:
+            assert node.get(lock.resource_name) == lock.lock_key
+            assert 0 < node.pttl(lock.resource_name) <= lock.ttl
+
 
 class TestAcquireNode:
     def test_acquire_node(self, lock, mock):
         lock.lock_key = "foo"
-        mock.set.return_value = True
+        mock.redlock_acquire_script.return_value = 1
         assert lock._acquire_node(mock) is True
-        mock.set.assert_called_once_with(
-            "test_acquire_node", "foo", nx=True, px=lock.ttl
+        mock.redlock_acquire_script.assert_called_once_with(
+            keys=[b"test_acquire_node"], args=[b"foo", b"120000"], client=ANY
         )
+        assert lock._contended == []
+
+    def test_acquire_node_deadline(self, lock, mock):
+        lock.lock_key = "foo"
+        lock._acquire_node(mock, 5)
+        client = mock.redlock_acquire_script.call_args[1]["client"]
+        assert (client.node, client.deadline) == (mock, 5)
+        # the client is reused in the next round, until the ttl changes
+        lock._acquire_node(mock, 6)
+        assert mock.redlock_acquire_script.call_args[1]["client"] is client
+        assert client.deadline == 6
+        lock.ttl = 1000
+        lock._acquire_node(mock, 7)
+        assert mock.redlock_acquire_script.call_args[1]["client"] is not client
+
+    def test_acquire_node_held(self, lock, mock):
+        lock.lock_key = "foo"
+        mock.redlock_acquire_script.return_value = [100, "bar"]
+        assert lock._acquire_node(mock) is False
+        assert lock._contended == [(100, "bar")]
 
     def test_acquire_node_redis_raises_connection_error(self, lock, mock):
         lock.lock_key = "foo"
-        mock.set.side_effect = redis.exceptions.ConnectionError
+        mock.redlock_acquire_script.side_effect = redis.exceptions.ConnectionError
         assert lock._acquire_node(mock) is False
+        assert lock._contended == []
 
     def test_acquire_node_redis_raises_timout_error(self, lock, mock):
         lock.lock_key = "foo"
-        mock.set.side_effect = redis.exceptions.TimeoutError
+        mock.redlock_acquire_script.side_effect = redis.exceptions.TimeoutError
         assert lock._acquire_node(mock) is False
 
 
@@ -67,7 +190,7 @@ class TestReleaseNode:
         mock.redlock_release_script.return_value = True
         assert lock._release_node(mock) is True
         mock.redlock_release_script.assert_called_once_with(
-            keys=["test_release_node"], args=["foo"]
+            keys=[b"test_release_node"], args=[b"foo"], client=ANY
         )
 
     def test_release_node_redis_raises_connection_error(self, lock, mock):
@@ -87,7 +210,7 @@ class TestBumpNode:
         mock.redlock_bump_script.return_value = True
         assert lock._bump_node(mock) is True
         mock.redlock_bump_script.assert_called_once_with(
-            keys=["test_bump_node"], args=["foo", lock.ttl]
+            keys=[b"test_bump_node"], args=[b"foo", b"120000"], client=ANY
         )
 
     def test_bump_node_redis_raises_connection_error(self, lock, mock):
@@ -107,7 +230,7 @@ class TestGetTtlFromNode:
         mock.redlock_get_ttl_script.return_value = 1.0
         assert lock._get_ttl_from_node(mock) == 1.0
         mock.redlock_get_ttl_script.assert_called_once_with(
-            keys=["test_get_ttl_from_node"], args=["foo"]
+            keys=[b"test_get_ttl_from_node"], args=[b"foo"], client=ANY
         )
 
     def test_get_ttl_from_node_redis_raises_connection_error(self, lock, mock):
@@ -121,6 +244,111 @@ class TestGetTtlFromNode:
         assert lock._get_ttl_from_node(mock) is None
 
 
+class TestTimedNodeCalls:
+    @fixture
+    def monitor_lock(self, create_lock, mocker):
+        lock = create_lock(clock_monitor=ClockDriftMonitor())
+        lock.lock_key = "foo"
+        mocker.patch("redlock_plus._base._monotonic_ms", side_effect=[10, 14])
+        mocker.patch.object(lock.clock_monitor, "record")
+        return lock
+
+    def test_bump_node(self, monitor_lock, mock):
+        mock.redlock_bump_timed_script.return_value = [1, b"2", b"500"]
+        assert monitor_lock._bump_node(mock) is True
+        mock.redlock_bump_timed_script.assert_called_once_with(
+            keys=[b"test_bump_node"], args=[b"foo", b"120000"], client=ANY
+        )
+        mock.redlock_bump_script.assert_not_called()
+        monitor_lock.clock_monitor.record.assert_called_once_with(
+            mock, local_time=12, server_time=2000.5, round_trip_time=4
+        )
+
+    def test_get_ttl_from_node(self, monitor_lock, mock):
+        mock.redlock_get_ttl_timed_script.return_value = [100, b"2", b"500"]
+        assert monitor_lock._get_ttl_from_node(mock) == 100
+        mock.redlock_get_ttl_timed_script.assert_called_once_with(
+            keys=[b"test_get_ttl_from_node"], args=[b"foo"], client=ANY
+        )
+        mock.redlock_get_ttl_script.assert_not_called()
+        monitor_lock.clock_monitor.record.assert_called_once_with(
+            mock, local_time=12, server_time=2000.5, round_trip_time=4
+        )
+
+    def test_bump_node_redis_raises_connection_error(self, monitor_lock, mock):
+        mock.redlock_bump_timed_script.side_effect = redis.exceptions.ConnectionError
+        assert monitor_lock._bump_node(mock) is False
+        monitor_lock.clock_monitor.record.assert_not_called()
+
+    def test_get_drift(self, create_lock, mocker):
+        lock = create_lock(ttl=1000)
+        assert lock._get_drift() == lock._drift
+
+        lock.clock_monitor = ClockDriftMonitor()
+        mocker.patch.object(lock.clock_monitor, "drift", return_value=3)
+        assert lock._get_drift() == 3
+        lock.clock_monitor.drift.assert_called_once_with(1000, lock.redis_nodes)
+
+
+class TestClockDriftMonitor:
+    def test_uncalibrated(self):
+        monitor = ClockDriftMonitor(min_window=1000)
+        monitor.record("a", local_time=0, server_time=5000, round_trip_time=1)
+        monitor.record("a", local_time=999, server_time=5999, round_trip_time=1)
+        assert monitor.drift_factor(["a"]) is None
+        assert monitor.drift(1000, ["a"]) == 1000 * CLOCK_DRIFT_FACTOR + 2
+
+    def test_calibrated(self):
+        monitor = ClockDriftMonitor(min_window=1000, safety_factor=2)
+        monitor.record("a", local_time=0, server_time=5000, round_trip_time=10)
+        monitor.record("a", local_time=10_000, server_time=15_020, round_trip_time=10)
+        # rate deviation of 0.002 plus 0.001 uncertainty from the round trip times
+        assert monitor.drift_factor(["a"]) == approx(0.006)
+        assert monitor.drift(1000, ["a"]) == approx(8)
+
+    def test_all_nodes_required(self):
+        monitor = ClockDriftMonitor(min_window=0)
+        monitor.record("a", local_time=0, server_time=0, round_trip_time=0)
+        monitor.record("a", local_time=10, server_time=10, round_trip_time=0)
+        assert monitor.drift_factor(["a"]) is not None
+        assert monitor.drift_factor(["a", "b"]) is None
+
+    def test_worst_node(self):
+        monitor = ClockDriftMonitor(min_window=0, safety_factor=1)
+        for node, server_time in [("a", 10_010), ("b", 9_950)]:
+            monitor.record(node, local_time=0, server_time=0, round_trip_time=0)
+            monitor.record(
+                node, local_time=10_000, server_time=server_time, round_trip_time=0
+            )
+        assert monitor.drift_factor(["a", "b"]) == approx(0.005)
+
+    def test_min_drift_factor(self):
+        monitor = ClockDriftMonitor(min_window=0, min_drift_factor=0.001)
+        monitor.record("a", local_time=0, server_time=0, round_trip_time=0)
+        monitor.record("a", local_time=10_000, server_time=10_000, round_trip_time=0)
+        assert monitor.drift_factor(["a"]) == 0.001
+
+
+class TestTransferNode:
+    def test_transfer_node(self, lock, mock):
+        lock.lock_key = "bar"
+        mock.redlock_transfer_script.return_value = True
+        assert lock._transfer_node(mock, "foo") is True
+        mock.redlock_transfer_script.assert_called_once_with(
+            keys=[b"test_transfer_node"], args=["foo", b"bar", b"120000"], client=ANY,
+        )
+
+    def test_transfer_node_redis_raises_connection_error(self, lock, mock):
+        lock.lock_key = "bar"
+        mock.redlock_transfer_script.side_effect = redis.exceptions.ConnectionError
+        assert lock._transfer_node(mock, "foo") is False
+
+    def test_transfer_node_redis_raises_timout_error(self, lock, mock):
+        lock.lock_key = "bar"
+        mock.redlock_transfer_script.side_effect = redis.exceptions.TimeoutError
+        assert lock._transfer_node(mock, "foo") is False
+
+
 class TestMapNodes:
     def test_default_nodes(self, create_lock, mock, create_fake_nodes):
         nodes = create_fake_nodes(3)
@@ -136,6 +364,61 @@ class TestMapNodes:
         mock.assert_called_once_with(node)
 
 
+class TestHedge:
+    @fixture
+    def hedged_lock(self, create_lock, fake_redis_client):
+        nodes = [fake_redis_client() for _ in range(5)]
+        lock = create_lock(connection_details=nodes, hedge=True, ttl=10_000)
+        for node in lock.redis_nodes:
+            node.redlock_latency.record(5)
+        return lock
+
+    def slow_node(self, lock, mocker, method):
+        node = lock.redis_nodes[0]
+        original = getattr(lock, method)
+
+        def slow(n):
+            if n is node:
+                sleep(0.5)
+            return original(n)
+
+        mocker.patch.object(lock, method, side_effect=slow)
+
+    def test_default(self, lock):
+        assert not lock.hedge
+
+    def test_extend(self, hedged_lock, mocker):
+        assert hedged_lock.acquire(autoextend=False)
+        self.slow_node(hedged_lock, mocker, "_bump_node")
+        start = monotonic()
+        assert hedged_lock.extend()
+        assert monotonic() - start < 0.4
+
+    def test_release(self, hedged_lock, mocker):
+        assert hedged_lock.acquire(autoextend=False)
+        self.slow_node(hedged_lock, mocker, "_release_node")
+        start = monotonic()
+        assert hedged_lock.release()
+        assert monotonic() - start < 0.4
+        assert not hedged_lock.redis_nodes[1].exists(hedged_lock.resource_name)
+
+    def test_locked(self, hedged_lock, mocker):
+        assert hedged_lock.acquire(autoextend=False)
+        self.slow_node(hedged_lock, mocker, "_get_ttl_from_node")
+        start = monotonic()
+        assert hedged_lock.locked()
+        assert monotonic() - start < 0.4
+
+    def test_waits_without_quorum(self, hedged_lock, mocker):
+        assert hedged_lock.acquire(autoextend=False)
+        for node in hedged_lock.redis_nodes[:3]:
+            node.delete(hedged_lock.resource_name)
+        self.slow_node(hedged_lock, mocker, "_bump_node")
+        start = monotonic()
+        assert not hedged_lock.extend(retry_times=0)
+        assert monotonic() - start >= 0.5
+
+
 class TestAcquire:
     def test_blocking(self, lock, mocker):
         mocker.patch.object(lock, "_acquire_blocking", return_value=2)
@@ -207,9 +490,19 @@ class TestAutoextend:
     def test_autoextend_timeout(self, create_lock):
         lock = create_lock("test_acquire_autoextend", ttl=200)
         assert lock.acquire(autoextend_timeout=0.5)
-        sleep(0.5)
+        sleep(0.3)
+        assert lock.locked()
+        sleep(0.6)
         assert not lock.locked()
 
+    def test_expired(self, lock, mocker):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic() - 1
+        mocker.patch.object(lock, "_map_nodes")
+        with raises(InvalidOperationError):
+            lock.start_autoextend()
+        lock._map_nodes.assert_not_called()
+
     def test_fail_to_extend(self, create_lock, mocker):
         lock = create_lock("test_acquire_autoextend", ttl=100)
         mocker.patch.object(lock, "extend", return_value=0)
@@ -218,6 +511,134 @@ class TestAutoextend:
         assert not lock.locked()
 
 
+class TestRenewalPolicy:
+    def test_rtt_p99(self):
+        policy = RenewalPolicy()
+        assert policy.rtt_p99 == 0
+        for rtt in range(1, 201):
+            policy.record(rtt)
+        assert policy.rtt_p99 == 199
+
+    def test_window(self):
+        policy = RenewalPolicy(window=2)
+        for rtt in (100, 1, 2):
+            policy.record(rtt)
+        assert policy.rtt_p99 == 2
+
+    def test_renewal_delay(self, mocker):
+        mocker.patch(
+            "redlock_plus.autoextend.random.uniform", side_effect=lambda a, b: b
+        )
+        assert RenewalPolicy(jitter=0.1).renewal_delay(1000) == 650
+
+    def test_renewal_delay_jitter(self):
+        policy = RenewalPolicy(jitter=0.5)
+        delays = {policy.renewal_delay(1000) for _ in range(10)}
+        assert len(delays) > 1
+        assert all(250 <= delay <= 750 for delay in delays)
+
+    def test_renewal_delay_reserves_rtt(self):
+        policy = RenewalPolicy(jitter=0, rtt_safety=2)
+        policy.record(200)
+        assert policy.renewal_delay(1000) == 600
+        assert policy.renewal_delay(300) == 0
+
+    def test_retry_delay(self, mocker):
+        mocker.patch(
+            "redlock_plus.autoextend.random.uniform", side_effect=lambda a, b: b
+        )
+        policy = RenewalPolicy(rtt_safety=2, max_retry_delay=200)
+        policy.record(10)
+        assert policy.retry_delay(1000) == 200
+        assert policy.retry_delay(220) == 100
+        assert policy.retry_delay(20) == 0
+        assert policy.retry_delay(0) is None
+
+
+class TestAutoextendRenew:
+    def test_uses_policy(self, create_lock, mocker):
+        policy = RenewalPolicy()
+        mocker.patch.object(policy, "renewal_delay", return_value=10)
+        lock = create_lock(ttl=10_000, renewal_policy=policy)
+        mocker.patch.object(lock, "extend", return_value=10_000)
+        assert lock.acquire()
+        sleep(0.05)
+        lock.stop_autoextend()
+        assert lock.extend.call_count > 1
+        lock.extend.assert_called_with(retry_times=0, retry_delay=0)
+        policy.renewal_delay.assert_any_call(10_000)
+
+    def test_records_rtt(self, create_lock, mocker):
+        policy = RenewalPolicy()
+        lock = create_lock(ttl=10_000, renewal_policy=policy)
+        assert lock.acquire(autoextend=False)
+        assert _AutoextendThread(lock).renew()
+        assert policy.rtt_p99 > 0
+
+    def test_retries_until_expired(self, create_lock, mocker):
+        lock = create_lock(ttl=10_000)
+        assert lock.acquire(autoextend=False)
+        thread = _AutoextendThread(lock)
+        mocker.patch.object(lock, "extend", side_effect=[False, False, 5000])
+        mocker.patch.object(lock.renewal_policy, "retry_delay", return_value=0)
+        assert thread.renew() == 5000
+        assert lock.extend.call_count == 3
+
+    def test_gives_up_when_expired(self, create_lock, mocker):
+        lock = create_lock(ttl=10_000)
+        assert lock.acquire(autoextend=False)
+        thread = _AutoextendThread(lock)
+        lock.deadline = monotonic() - 1
+        mocker.patch.object(lock, "extend", return_value=False)
+        assert thread.renew() == 0
+        lock.extend.assert_called_once()
+
+
+class TestOnLost:
+    def test_called_when_renewal_fails(self, create_lock, mocker, mock):
+        lock = create_lock(ttl=100, on_lost=mock)
+        mocker.patch.object(lock, "extend", return_value=False)
+        assert lock.acquire()
+        sleep(0.2)
+        mock.assert_called_once_with(lock)
+        assert not lock.is_valid
+
+    def test_not_called_on_release(self, create_lock, mock):
+        lock = create_lock(ttl=100, on_lost=mock)
+        assert lock.acquire()
+        assert lock.release()
+        sleep(0.1)
+        mock.assert_not_called()
+
+    def test_not_called_while_renewed(self, create_lock, mock):
+        lock = create_lock(ttl=100, on_lost=mock)
+        assert lock.acquire()
+        sleep(0.2)
+        assert lock.is_valid
+        mock.assert_not_called()
+
+
+class TestIsValid:
+    def test_not_acquired(self, lock):
+        assert not lock.is_valid
+
+    def test_acquired(self, lock, mocker):
+        assert lock.acquire(autoextend=False)
+        mocker.patch.object(lock, "_map_nodes")
+        assert lock.is_valid
+        lock._map_nodes.assert_not_called()
+
+    def test_expired(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic()
+        assert not lock.is_valid
+
+    def test_released(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.release()
+        assert not lock.is_valid
+
+
 @fixture
 def create_fake_nodes():
     def inner(valid=0, invalid=0):
@@ -230,9 +651,8 @@ def create_fake_nodes():
 
 
 class TestDunderAcquire:
-    def test_sets_lock_key(self, lock, mocker, mock):
-        mock.hex = "foo"
-        mocker.patch("redlock_plus.uuid.uuid4", return_value=mock)
+    def test_sets_lock_key(self, lock, mocker):
+        mocker.patch("redlock_plus._base._new_lock_key", return_value="foo")
         assert lock.lock_key is None
         lock._acquire()
         assert lock.lock_key == "foo"
@@ -249,7 +669,7 @@ class TestDunderAcquire:
         lock.redis_nodes = fake_nodes
         lock._acquire()
         lock._acquire_node.assert_has_calls(
-            [call(n) for n in fake_nodes], any_order=True
+            [call(n, ANY) for n in fake_nodes], any_order=True
         )
 
     @mark.parametrize("nodes_valid,nodes_invalid,result", [(3, 2, True), (2, 3, False)])
@@ -258,13 +678,13 @@ class TestDunderAcquire:
     ):
         fake_nodes = create_fake_nodes(nodes_valid, nodes_invalid)
         lock = create_lock(nodes=fake_nodes)
-        mocker.patch.object(lock, "_acquire_node", new=lambda n: n())
+        mocker.patch.object(lock, "_acquire_node", new=lambda n, deadline: n())
         assert bool(lock._acquire()) == result
 
     def test_fail_if_validity_smaller_tll(self, lock, mocker):
         lock.ttl = 50
 
-        def mock_acquire_node(node):
+        def mock_acquire_node(node, deadline):
             sleep(0.05)
             return True
 
@@ -289,17 +709,51 @@ class TestDunderAcquire:
     def test_retry_on_fail_sleep_random(self, create_lock, mocker):
         lock = create_lock()
         mocker.patch.object(lock, "_acquire_node", return_value=False)
-        mock_sleep = mocker.patch("redlock_plus.time.sleep")
-        mock_randint = mocker.patch("redlock_plus.random.randint", return_value=2000)
-        lock.retry_times = 0
+        mock_sleep = mocker.patch("redlock_plus._util.time.sleep")
+        mock_randint = mocker.patch(
+            "redlock_plus._util.random.randint", return_value=2000
+        )
+        lock.retry_times = 1
         lock._acquire()
 
+        # only between attempts, not after the last one
         mock_randint.assert_called_once_with(0, lock.retry_delay)
         mock_sleep.assert_called_once_with(2)
 
+    def test_no_retries(self, create_lock, mocker):
+        lock = create_lock(retry_times=3)
+        mocker.patch.object(lock, "_acquire_node", return_value=False)
+        mock_sleep = mocker.patch("redlock_plus._util.time.sleep")
+        lock._acquire(retry_times=0)
+        assert lock._acquire_node.call_count == len(lock.redis_nodes)
+        mock_sleep.assert_not_called()
+
+    def test_contention(self, create_lock, create_fake_nodes, mocker):
+        lock = create_lock(retry_times=1, nodes=create_fake_nodes(0, 5))
+
+        def mock_acquire_node(node, deadline):
+            lock._contended.append((100, "foo:1:2000:host"))
+            return False
+
+        mocker.patch.object(lock, "_acquire_node", new=mock_acquire_node)
+        mocker.patch.object(lock, "_release_node")
+        result = lock._acquire()
+        assert result == LockContention(
+            ttls=[100] * 5,
+            node_count=5,
+            quorum=3,
+            holders=[HolderInfo("host", 1, 2)] * 5,
+        )
+        assert not result
+
+    def test_no_contention(self, lock, mocker):
+        mocker.patch.object(lock, "_acquire_node", return_value=False)
+        assert lock._acquire() is False
+
     def test_calculate_ttl(self, lock, mocker):
-        mocker.patch("redlock_plus.monotonic", side_effect=[2, 4])
-        mocker.patch("redlock_plus._monotonic_to_ms", new=lambda t: t)
+        mocker.patch.object(lock, "_acquire_node", return_value=True)
+        mocker.patch("redlock_plus.lock.monotonic", side_effect=[2, 2, 3, 3, 4])
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
         drift = (lock.ttl * CLOCK_DRIFT_FACTOR) + 2
         assert lock._acquire() == lock.ttl - (2 + drift)
 
@@ -308,15 +762,98 @@ class TestDunderAcquire:
         Acquiring the lock has taken more time than the ttl of the lock
         """
         lock = create_lock(retry_times=0)
-        mocker.patch("redlock_plus.monotonic", side_effect=[2, lock.ttl])
-        mocker.patch("redlock_plus._monotonic_to_ms", new=lambda t: t)
+        mocker.patch("redlock_plus.lock.monotonic", side_effect=[2, 2, lock.ttl])
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
         assert lock._acquire() is False
 
+    def test_skips_nodes_after_deadline(self, create_lock, create_fake_nodes, mocker):
+        lock = create_lock(retry_times=0, nodes=create_fake_nodes(5))
+        mocker.patch.object(lock, "_acquire_node", return_value=True)
+        mocker.patch.object(lock, "_release_node")
+        mocker.patch("redlock_plus.lock.monotonic", side_effect=[0, 0, 1, lock.ttl])
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
+        assert lock._acquire() is False
+        assert lock._acquire_node.call_count == 2
+        assert lock._release_node.call_count == 5
+
+    def test_round_deadline(self, create_lock, create_fake_nodes, mocker):
+        lock = create_lock(retry_times=0, nodes=create_fake_nodes(3))
+        mocker.patch.object(lock, "_acquire_node", return_value=True)
+        mocker.patch("redlock_plus.lock.monotonic", side_effect=[2, 2, 3, 3, 4])
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
+        assert lock._acquire()
+        # one deadline for the whole round, at which the lock would be of no use
+        deadline = (2 + lock.ttl - lock._drift) / 1000
+        lock._acquire_node.assert_has_calls(
+            [call(node, deadline) for node in lock.redis_nodes]
+        )
+
+    def test_timeout(self, create_lock, create_fake_nodes, mocker):
+        lock = create_lock(retry_times=0, nodes=create_fake_nodes(3))
+        mocker.patch.object(lock, "_acquire_node", return_value=True)
+        clock = mocker.patch(
+            "redlock_plus.lock.monotonic", side_effect=[0, 0, 0, 1, 2, 3]
+        )
+        mocker.patch("redlock_plus._util.monotonic", new=clock)
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
+        # the last reply arrives too late
+        assert lock._acquire(timeout=2.5) is False
+        assert lock._acquire_node.call_count == 3
+
+
+class TestLockContention:
+    def test_falsy(self):
+        assert not LockContention(ttls=[1, 2, 3], node_count=3, quorum=3, holders=[])
+
+    @mark.parametrize(
+        "ttls,node_count,quorum,expected",
+        [
+            ([300, 100, 200], 3, 3, 300),
+            ([300, 100, 200], 5, 3, 100),
+            ([300, 100, 200, 400], 5, 3, 200),
+            ([100], 3, 3, 100),
+            ([100], 5, 3, 0),
+            ([-1, 100, 200], 3, 3, None),
+            ([-1, 100, 200], 5, 3, 100),
+        ],
+    )
+    def test_retry_after(self, ttls, node_count, quorum, expected):
+        contention = LockContention(
+            ttls=ttls, node_count=node_count, quorum=quorum, holders=[]
+        )
+        assert contention.retry_after == expected
+
+
+class TestHolderInfo:
+    def test_generate_lock_key(self, create_lock, mocker):
+        mocker.patch("redlock_plus._base._new_lock_key", return_value="foo")
+        mocker.patch("redlock_plus._util.os.getpid", return_value=42)
+        mocker.patch("redlock_plus._util.time.time", return_value=100.5)
+        mocker.patch("redlock_plus._util._HOSTNAME", "host:1")
+        lock = create_lock(holder_info=True)
+        assert lock._generate_lock_key() == "foo:42:100500:host:1"
+
+    def test_generate_lock_key_disabled(self, lock, mocker):
+        mocker.patch("redlock_plus._base._new_lock_key", return_value="foo")
+        assert lock._generate_lock_key() == "foo"
+
+    @mark.parametrize(
+        "lock_key,expected",
+        [
+            ("foo:42:100500:host", HolderInfo("host", 42, 100.5)),
+            (b"foo:42:100500:host:1", HolderInfo("host:1", 42, 100.5)),
+            ("foo", None),
+            ("foo:bar:100500:host", None),
+        ],
+    )
+    def test_from_lock_key(self, lock_key, expected):
+        assert HolderInfo.from_lock_key(lock_key) == expected
+
 
 class TestAcquireBlocking:  # TODO: rewrite
     def test_success(self, lock, mocker):
         mocker.patch.object(lock, "_acquire", return_value=True)
-        mock_sleep = mocker.patch("redlock_plus.time.sleep")
+        mock_sleep = mocker.patch("redlock_plus._util.time.sleep")
         assert lock._acquire_blocking()
         mock_sleep.assert_not_called()
 
@@ -328,15 +865,41 @@ class TestAcquireBlocking:  # TODO: rewrite
     def test_block_timeout(self, lock, mocker):
         lock.retry_delay = 50
 
-        def _mock_acquire(retry_times):
-            sleep(lock.retry_delay / 1000)
+        def _mock_acquire(retry_times, timeout):
+            sleep(min(lock.retry_delay, timeout) / 1000)
             return False
 
         mocker.patch.object(lock, "_acquire", _mock_acquire)
         timeout = 0.06
         time_start = monotonic()
         assert not lock._acquire_blocking(timeout=timeout)
-        assert monotonic() - time_start < timeout
+        assert monotonic() - time_start < timeout + 0.01
+
+    def test_single_round_per_call(self, lock, mocker):
+        mock_acquire_node = mocker.patch.object(
+            lock, "_acquire_node", return_value=False
+        )
+        mocker.patch("redlock_plus._util.random.randint", return_value=40)
+        lock.retry_times = 3
+        assert not lock._acquire_blocking(timeout=0.1)
+        # three rounds fit before the timeout, each with one request per node
+        assert mock_acquire_node.call_count == 3 * len(lock.redis_nodes)
+
+    def test_contended_timeout(self, create_lock):
+        holder = create_lock(ttl=10_000)
+        assert holder.acquire(autoextend=False)
+        lock = create_lock(retry_delay=100)
+        time_start = monotonic()
+        assert not lock.acquire(timeout=0.3, autoextend=False)
+        assert monotonic() - time_start <= 0.3 + lock.retry_delay / 1000
+
+    def test_passes_remaining_timeout(self, lock, mocker):
+        mock_acquire = mocker.patch.object(lock, "_acquire", return_value=True)
+        assert lock._acquire_blocking(timeout=1)
+        remaining = mock_acquire.call_args.kwargs["timeout"]
+        assert 900 < remaining <= 1000
+        assert lock._acquire_blocking()
+        assert mock_acquire.call_args.kwargs["timeout"] is None
 
 
 class TestLocked:
@@ -439,8 +1002,10 @@ class TestExtend:
 
     def test_retry_on_fail_sleep_random(self, lock, mocker):
         mocker.patch.object(lock, "_bump_node", return_value=False)
-        mock_sleep = mocker.patch("redlock_plus.time.sleep")
-        mock_randint = mocker.patch("redlock_plus.random.randint", return_value=2000)
+        mock_sleep = mocker.patch("redlock_plus._util.time.sleep")
+        mock_randint = mocker.patch(
+            "redlock_plus.lock.random.randint", return_value=2000
+        )
         lock.retry_times = 0
         assert lock.acquire(autoextend=False)
         assert not lock.extend()
@@ -450,19 +1015,28 @@ class TestExtend:
 
     def test_calculate_ttl(self, lock, mocker):
         assert lock.acquire(autoextend=False)
-        mocker.patch("redlock_plus.monotonic", side_effect=[2, 4])
-        mocker.patch("redlock_plus._monotonic_to_ms", new=lambda t: t)
+        mocker.patch("redlock_plus.lock.monotonic", side_effect=[2, 4])
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
         drift = (lock.ttl * CLOCK_DRIFT_FACTOR) + 2
         assert lock.extend() == lock.ttl - (2 + drift)
 
+    def test_retry_arguments(self, create_lock, create_fake_nodes, mocker):
+        lock = create_lock(retry_times=3, nodes=create_fake_nodes(3))
+        assert lock.acquire(autoextend=False)
+        mocker.patch.object(lock, "_bump_node", return_value=False)
+        mock_randint = mocker.patch("redlock_plus.lock.random.randint", return_value=0)
+        assert not lock.extend(retry_times=1, retry_delay=10)
+        assert lock._bump_node.call_count == 6
+        mock_randint.assert_called_with(0, 10)
+
     def test_negative_ttl(self, create_lock, mocker):
         """
         Extending the lock has taken more time than the ttl of the lock
         """
         lock = create_lock(retry_times=0)
         assert lock.acquire(autoextend=False)
-        mocker.patch("redlock_plus.monotonic", side_effect=[2, lock.ttl])
-        mocker.patch("redlock_plus._monotonic_to_ms", new=lambda t: t)
+        mocker.patch("redlock_plus.lock.monotonic", side_effect=[2, lock.ttl])
+        mocker.patch("redlock_plus._util._monotonic_to_ms", new=lambda t: t)
         assert lock.extend() is False
 
 
@@ -500,6 +1074,218 @@ class TestAcquireOrExtend:
         lock.acquire.assert_called_once()
 
 
+class TestHandoff:
+    def test_not_acquired(self, lock):
+        with raises(InvalidOperationError):
+            lock.handoff()
+
+    def test_not_held(self, lock, mocker):
+        assert lock.acquire(autoextend=False)
+        mocker.patch.object(lock, "check_times", return_value=(False, []))
+        with raises(InvalidOperationError):
+            lock.handoff()
+
+    def test_handoff(self, lock, mocker):
+        assert lock.acquire(autoextend=False)
+        key = lock.lock_key
+        mocker.patch("redlock_plus.lock.time.time", return_value=100)
+        mocker.patch.object(lock, "check_times", return_value=(True, [2000, 1000]))
+        mocker.patch.object(lock, "stop_autoextend")
+        lease = lock.handoff()
+        assert lease == Lease(lock.resource_name, key, 101)
+        assert lock.lock_key is None
+        lock.stop_autoextend.assert_called_once()
+
+
+class TestAdopt:
+    def test_wrong_resource(self, create_lock):
+        lock = create_lock("foo")
+        with raises(ValueError):
+            lock.adopt(Lease("bar", "key", 0))
+
+    def test_adopt(self, lock, mocker):
+        mocker.patch("redlock_plus.lock.time.time", return_value=100)
+        mocker.patch.object(lock, "_map_nodes")
+        lease = Lease(lock.resource_name, "foo", 101)
+        assert lock.adopt(lease, autoextend=False) == 1000
+        assert lock.lock_key == "foo"
+        lock._map_nodes.assert_not_called()
+
+    def test_adopt_expired(self, lock, mocker):
+        mocker.patch("redlock_plus.lock.time.time", return_value=100)
+        assert lock.adopt(Lease(lock.resource_name, "foo", 99)) is False
+        assert lock.lock_key is None
+
+    def test_autoextend(self, lock, mocker):
+        mocker.patch.object(lock, "start_autoextend")
+        lease = Lease(lock.resource_name, "foo", time() + 10)
+        assert lock.adopt(lease, autoextend_timeout=2)
+        lock.start_autoextend.assert_called_once_with(timeout=2)
+
+    @mark.parametrize("nodes_valid,nodes_invalid,result", [(3, 2, True), (2, 3, False)])
+    def test_transfer_node_majority(
+        self, create_lock, mocker, nodes_valid, nodes_invalid, result, create_fake_nodes
+    ):
+        fake_nodes = create_fake_nodes(nodes_valid, nodes_invalid)
+        lock = create_lock(nodes=fake_nodes)
+        mocker.patch.object(
+            lock, "_transfer_node", new=lambda n, previous_lock_key: n()
+        )
+        mocker.patch.object(lock, "_release_node")
+        lease = Lease(lock.resource_name, "foo", time() + 10)
+        assert bool(lock.adopt(lease, transfer=True, autoextend=False)) == result
+        if result:
+            assert lock.lock_key not in (None, "foo")
+            lock._release_node.assert_not_called()
+        else:
+            assert lock.lock_key is None
+            lock._release_node.assert_has_calls(
+                [call(n) for n in fake_nodes], any_order=True
+            )
+
+
+class TestDeadline:
+    def test_not_acquired(self, lock):
+        assert lock.deadline is None
+
+    def test_acquire(self, lock):
+        validity = lock.acquire(autoextend=False)
+        assert lock.deadline == approx(monotonic() + validity / 1000, abs=0.05)
+
+    def test_acquire_failed(self, lock, mocker):
+        mocker.patch.object(lock, "_acquire_node", return_value=False)
+        assert not lock.acquire(blocking=False, autoextend=False)
+        assert lock.deadline is None
+
+    def test_extend(self, lock, mocker):
+        lock.ttl = 1000
+        assert lock.acquire(autoextend=False)
+        deadline = lock.deadline
+        sleep(0.01)
+        assert lock.extend()
+        assert lock.deadline > deadline
+
+    def test_extend_failed(self, lock, mocker):
+        lock.retry_times = 0
+        assert lock.acquire(autoextend=False)
+        deadline = lock.deadline
+        mocker.patch.object(lock, "_bump_node", return_value=False)
+        assert not lock.extend()
+        assert lock.deadline == deadline
+
+    def test_adopt(self, lock, mocker):
+        mocker.patch("redlock_plus.lock.time.time", return_value=100)
+        lease = Lease(lock.resource_name, "foo", 101)
+        assert lock.adopt(lease, autoextend=False)
+        assert lock.deadline == approx(monotonic() + 1, abs=0.05)
+
+    def test_release(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.release()
+        assert lock.deadline is None
+
+    def test_handoff(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.handoff()
+        assert lock.deadline is None
+
+
+class TestGuard:
+    def test_not_acquired(self, lock):
+        with raises(InvalidOperationError):
+            with lock.guard():
+                pass
+
+    def test_within_deadline(self, lock, mock):
+        assert lock.acquire(autoextend=False)
+        with lock.guard(on_expire=mock) as expired:
+            pass
+        assert not expired.is_set()
+        mock.assert_not_called()
+
+    def test_expired(self, lock, mock):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic() + 0.01
+        with raises(LockExpiredError):
+            with lock.guard(on_expire=mock) as expired:
+                assert expired.wait(1)
+        mock.assert_called_once_with()
+
+    def test_margin(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic() + 10
+        with raises(LockExpiredError):
+            with lock.guard(margin=10) as expired:
+                assert expired.wait(1)
+
+    def test_follows_extension(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic() + 0.05
+        with lock.guard() as expired:
+            lock.deadline = monotonic() + 10
+            assert not expired.wait(0.1)
+
+    def test_released_within(self, lock):
+        assert lock.acquire(autoextend=False)
+        with lock.guard() as expired:
+            lock.release()
+        assert not expired.is_set()
+
+    def test_propagates_exception(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic()
+        with raises(KeyError):
+            with lock.guard() as expired:
+                expired.wait(1)
+                raise KeyError
+
+    def test_no_redis_requests(self, lock, mocker):
+        assert lock.acquire(autoextend=False)
+        mocker.patch.object(lock, "_map_nodes")
+        with lock.guard():
+            pass
+        lock._map_nodes.assert_not_called()
+
+
+class TestRun:
+    def test_not_acquired(self, lock, mock):
+        with raises(InvalidOperationError):
+            lock.run(mock)
+        mock.assert_not_called()
+
+    def test_run(self, lock, mock):
+        assert lock.acquire(autoextend=False)
+        assert lock.run(mock, 1, foo=2) is mock.return_value
+        mock.assert_called_once_with(1, foo=2)
+
+    def test_runs_in_worker(self, lock):
+        assert lock.acquire(autoextend=False)
+        assert lock.run(threading.get_ident) != threading.get_ident()
+
+    def test_reraises(self, lock, mock):
+        assert lock.acquire(autoextend=False)
+        mock.side_effect = KeyError
+        with raises(KeyError):
+            lock.run(mock)
+
+    def test_expired(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic() + 0.01
+        with raises(LockExpiredError):
+            lock.run(sleep, 1)
+
+    def test_follows_extension(self, lock):
+        assert lock.acquire(autoextend=False)
+        lock.deadline = monotonic() + 0.01
+
+        def work():
+            lock.deadline = monotonic() + 10
+            sleep(0.05)
+            return True
+
+        assert lock.run(work)
+
+
 class TestLockAsContextManager:
     def test_enter_acquires(self, lock):
         with lock:
@@ -521,3 +1307,51 @@ class TestLockAsContextManager:
         with lock:
             assert lock.locked()
         assert not lock.locked()
+
+
+class TestSingleNodeLock:
+    @fixture
+    def lock(self, fake_redis_client, request):
+        lock = SingleNodeLock(
+            request.node.name, connection_details=[fake_redis_client()]
+        )
+        request.addfinalizer(lock.stop_autoextend)
+        return lock
+
+    def test_quorum(self, lock):
+        assert len(lock.redis_nodes) == 1
+        assert lock.quorum == 1
+
+    def test_quorum_majority(self, create_fake_nodes):
+        lock = SingleNodeLock("foo", nodes=create_fake_nodes(2))
+        assert lock.quorum == 2
+
+    def test_no_nodes(self):
+        with raises(InsufficientNodesError, match="At least 1 redis nodes"):
+            SingleNodeLock("foo", nodes=[])
+
+    def test_acquire_release(self, lock):
+        assert lock.acquire(autoextend=False)
+        assert lock.locked()
+        assert lock.extend()
+        lock.release()
+        assert not lock.locked()
+
+    def test_contention(self, lock):
+        other = SingleNodeLock(lock.resource_name, nodes=lock.redis_nodes)
+        assert lock.acquire(autoextend=False)
+        contention = other.acquire(blocking=False)
+        assert not contention
+        assert contention.quorum == 1
+        assert contention.retry_after > 0
+
+    def test_autoextend(self, lock):
+        assert lock.acquire()
+        assert lock._autoextend_thread.is_alive()
+        lock.release()
+
+    def test_no_threads(self, lock, mocker):
+        executor = mocker.patch("redlock_plus._util.ThreadPoolExecutor")
+        assert lock.acquire(autoextend=False)
+        lock.release()
+        executor.assert_not_called()
@@ -0,0 +1,159 @@
+import json
+
+from pytest import fixture
+
+import redlock_plus
+from redlock_plus import LockProfiler, ResourceStats
+
+
+@fixture
+def profiler():
+    return LockProfiler(capacity=3)
+
+
+@fixture
+def factory(fake_redis_client, profiler):
+    return redlock_plus.LockFactory(
+        [fake_redis_client(), fake_redis_client(), fake_redis_client()],
+        profiler=profiler,
+        retry_times=0,
+    )
+
+
+class TestLockProfiler:
+    def test_record(self, profiler):
+        profiler.record_acquire("a", True, 10)
+        profiler.record_acquire("a", False, 20)
+        profiler.record_extend("a")
+        profiler.record_release("a", 100)
+        assert profiler.top() == [ResourceStats("a", 2, 1, 30, 100, 1, 0)]
+
+    def test_untracked_ignored(self, profiler):
+        profiler.record_extend("a")
+        profiler.record_release("a", 100)
+        assert profiler.top() == []
+
+    def test_top(self, profiler):
+        for name, count in [("a", 1), ("b", 3), ("c", 2)]:
+            for _ in range(count):
+                profiler.record_acquire(name, True, 0)
+        assert [stats.resource_name for stats in profiler.top()] == ["b", "c", "a"]
+        assert [stats.resource_name for stats in profiler.top(2)] == ["b", "c"]
+
+    def test_space_saving(self, profiler):
+        for name, count in [("a", 1), ("b", 3), ("c", 2), ("d", 1)]:
+            for _ in range(count):
+                profiler.record_acquire(name, True, 0)
+        top = {stats.resource_name: stats for stats in profiler.top()}
+        assert set(top) == {"b", "c", "d"}
+        assert top["d"].attempts == 2
+        assert top["d"].error == 1
+        assert top["b"].error == 0
+
+    def test_evicts_fewest_attempts(self, profiler):
+        # the attempts of a and b grow after they were tracked
+        for name, count in [("a", 1), ("b", 1), ("c", 1), ("a", 4), ("b", 2)]:
+            for _ in range(count):
+                profiler.record_acquire(name, True, 0)
+        profiler.record_acquire("d", True, 0)
+        assert {stats.resource_name for stats in profiler.top()} == {"a", "b", "d"}
+        profiler.record_acquire("e", True, 0)
+        top = {stats.resource_name: stats for stats in profiler.top()}
+        assert set(top) == {"a", "b", "e"}
+        assert top["e"].attempts == 3
+
+    def test_hot_resource_survives(self, profiler):
+        for i in range(100):
+            profiler.record_acquire("hot", True, 0)
+            profiler.record_acquire(f"cold-{i}", True, 0)
+        assert profiler.top(1)[0].resource_name == "hot"
+
+    def test_sample_rate(self):
+        assert LockProfiler(sample_rate=1).sample()
+        assert not LockProfiler(sample_rate=0).sample()
+        samples = [LockProfiler(sample_rate=0.5).sample() for _ in range(100)]
+        assert 0 < sum(samples) < 100
+
+    def test_to_json(self, profiler):
+        profiler.record_acquire("a", True, 10)
+        assert json.loads(profiler.to_json()) == [
+            {
+                "resource_name": "a",
+                "attempts": 1,
+                "failures": 0,
+                "wait_time": 10,
+                "hold_time": 0,
+                "extends": 0,
+                "error": 0,
+            }
+        ]
+
+    def test_reset(self, profiler):
+        profiler.record_acquire("a", True, 10)
+        profiler.reset()
+        assert profiler.top() == []
+
+    def test_interval(self, mock, mocker):
+        mock_monotonic = mocker.patch(
+            "redlock_plus.stats.time.monotonic", return_value=0
+        )
+        profiler = LockProfiler(interval=10, callback=mock)
+        profiler.record_acquire("a", True, 0)
+        mock.assert_not_called()
+        mock_monotonic.return_value = 10
+        profiler.record_acquire("a", True, 0)
+        mock.assert_called_once_with([ResourceStats("a", 2, 0, 0, 0, 0, 0)])
+        profiler.record_acquire("a", True, 0)
+        mock.assert_called_once()
+
+
+class TestLockIntegration:
+    def test_acquire(self, factory, profiler):
+        lock = factory("a")
+        assert lock.acquire(autoextend=False)
+        assert not factory("a").acquire(blocking=False, autoextend=False)
+        (stats,) = profiler.top()
+        assert stats.attempts == 2
+        assert stats.failures == 1
+        assert stats.wait_time > 0
+
+    def test_hold_time(self, factory, profiler, mocker):
+        lock = factory("a")
+        assert lock.acquire(autoextend=False)
+        mocker.patch(
+            "redlock_plus.lock._monotonic_delta_ms", side_effect=lambda a, b: 50
+        )
+        lock.release()
+        assert profiler.top()[0].hold_time == 50
+        lock.release()
+        assert profiler.top()[0].hold_time == 50
+
+    def test_extend(self, factory, profiler):
+        lock = factory("a")
+        assert lock.acquire(autoextend=False)
+        assert lock.extend()
+        assert profiler.top()[0].extends == 1
+
+    def test_not_sampled(self, factory, profiler):
+        profiler.sample_rate = 0
+        lock = factory("a")
+        assert lock.acquire(autoextend=False)
+        assert lock.extend()
+        lock.release()
+        assert profiler.top() == []
+
+    def test_rlock(self, fake_redis_client, profiler, mocker):
+        factory = redlock_plus.RLockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()],
+            profiler=profiler,
+        )
+        lock = factory("a")
+        assert lock.acquire() and lock.acquire()
+        lock.release()
+        assert profiler.top()[0].hold_time == 0
+        mocker.patch(
+            "redlock_plus.lock._monotonic_delta_ms", side_effect=lambda a, b: 50
+        )
+        lock.release()
+        assert profiler.top()[0].attempts == 1
+        assert profiler.top()[0].hold_time == 50
@@ -0,0 +1,233 @@
+from time import monotonic, sleep, time
+
+import redis
+from pytest import fixture, mark, raises
+
+import redlock_plus
+from redlock_plus import InsufficientNodesError, RateLimiter, SlidingWindow, TokenBucket
+
+
+@fixture
+def redis_nodes(fake_redis_client):
+    return redlock_plus.init_redis_nodes(
+        [fake_redis_client(), fake_redis_client(), fake_redis_client()]
+    )
+
+
+@fixture
+def bucket(redis_nodes, request):
+    return TokenBucket(request.node.name, capacity=3, rate=10, nodes=redis_nodes)
+
+
+@fixture
+def window(redis_nodes, request):
+    return SlidingWindow(request.node.name, limit=3, window=200, nodes=redis_nodes)
+
+
+def disconnect(mocker, node, limiter):
+    mocker.patch.object(
+        node, limiter.script_name, side_effect=redis.exceptions.ConnectionError
+    )
+
+
+class TestInitialisation:
+    def test_insufficient_nodes(self, redis_nodes):
+        with raises(InsufficientNodesError):
+            TokenBucket("foo", 1, 1, nodes=redis_nodes[:2])
+
+    def test_single_node(self, redis_nodes):
+        bucket = TokenBucket("foo", 1, 1, nodes=redis_nodes[:1], quorum=False)
+        assert bucket.quorum == 1
+
+    def test_no_nodes(self):
+        with raises(ValueError):
+            TokenBucket("foo", 1, 1, nodes=[], quorum=False)
+
+    def test_nodes_and_connection_details_none(self):
+        with raises(ValueError):
+            SlidingWindow("foo", 1, 1)
+
+    def test_abstract(self, redis_nodes):
+        with raises(TypeError):
+            RateLimiter("foo", nodes=redis_nodes)
+
+    def test_shares_nodes_from_connection_details(self):
+        details = [{"host": "a"}, {"host": "b"}, {"host": "c"}]
+        bucket = TokenBucket("foo", 1, 1, connection_details=details)
+        window = SlidingWindow("bar", 1, 1, connection_details=details)
+        assert bucket.redis_nodes is window.redis_nodes
+        assert redlock_plus.NODE_REGISTRY.refcount(bucket.redis_nodes) == 2
+        bucket.close()
+        bucket.close()
+        assert redlock_plus.NODE_REGISTRY.refcount(bucket.redis_nodes) == 1
+
+    @mark.parametrize("cls", [TokenBucket, SlidingWindow])
+    @mark.parametrize("args", [(0, 1), (1, 0), (-1, 1)])
+    def test_invalid_arguments(self, redis_nodes, cls, args):
+        with raises(ValueError):
+            cls("foo", *args, nodes=redis_nodes)
+
+    def test_from_factory(self, fake_redis_client):
+        factory = redlock_plus.LockFactory(
+            [fake_redis_client(), fake_redis_client(), fake_redis_client()]
+        )
+        bucket = factory.token_bucket("foo", 5, 1, quorum=False)
+        assert (bucket.name, bucket.capacity, bucket.rate) == ("foo", 5, 1)
+        assert bucket.redis_nodes == factory.redis_nodes
+        assert bucket.quorum == 1
+        window = factory.sliding_window("bar", 5, 1000)
+        assert (window.name, window.limit, window.window) == ("bar", 5, 1000)
+        assert window.redis_nodes == factory.redis_nodes
+
+
+class TestTokenBucket:
+    def test_burst(self, bucket):
+        results = [bucket.acquire(blocking=False) for _ in range(4)]
+        assert [bool(result) for result in results] == [True, True, True, False]
+        assert [result.remaining for result in results] == [2, 1, 0, 0]
+        assert 0 < results[-1].retry_after <= 100
+
+    def test_batch(self, bucket):
+        assert bucket.acquire(2, blocking=False).remaining == 1
+        result = bucket.acquire(2, blocking=False)
+        assert not result
+        assert result.remaining == 1
+        assert 0 < result.retry_after <= 100
+
+    def test_over_capacity(self, bucket):
+        with raises(ValueError):
+            bucket.acquire(4, blocking=False)
+
+    def test_no_tokens(self, bucket):
+        for tokens in [0, -1]:
+            with raises(ValueError):
+                bucket.acquire(tokens, blocking=False)
+        assert not any(node.exists(bucket.name) for node in bucket.redis_nodes)
+
+    def test_refill(self, bucket):
+        assert bucket.acquire(3, blocking=False)
+        sleep(0.25)
+        assert bucket.acquire(2, blocking=False)
+
+    def test_denied_does_not_write(self, bucket):
+        assert bucket.acquire(3, blocking=False)
+        states = [node.hgetall(bucket.name) for node in bucket.redis_nodes]
+        assert not bucket.acquire(3, blocking=False)
+        assert [node.hgetall(bucket.name) for node in bucket.redis_nodes] == states
+
+    def test_expires(self, bucket):
+        assert bucket.acquire(blocking=False)
+        for node in bucket.redis_nodes:
+            assert 0 < node.pttl(bucket.name) <= 100
+
+
+class TestSlidingWindow:
+    def test_limit(self, window):
+        results = [window.acquire(blocking=False) for _ in range(4)]
+        assert [bool(result) for result in results] == [True, True, True, False]
+        assert [result.remaining for result in results] == [2, 1, 0, 0]
+        assert 0 < results[-1].retry_after <= 400
+
+    def test_batch(self, window):
+        assert window.acquire(3, blocking=False)
+        assert not window.acquire(blocking=False)
+
+    def test_over_limit(self, window):
+        with raises(ValueError):
+            window.acquire(4, blocking=False)
+        with raises(ValueError):
+            window.acquire(0, blocking=False)
+
+    def test_previous_window(self, window):
+        assert window.acquire(3, blocking=False)
+        start = int(window.redis_nodes[0].hget(window.name, "start"))
+        # halfway through the next window, half of the previous one still counts
+        sleep((start + 300) / 1000 - time())
+        result = window.acquire(2, blocking=False)
+        assert not result
+        assert 0 < result.retry_after <= 100
+        assert window.acquire(blocking=False)
+
+    def test_expires(self, window):
+        assert window.acquire(blocking=False)
+        for node in window.redis_nodes:
+            assert 0 < node.pttl(window.name) <= 400
+
+
+class TestQuorum:
+    @fixture
+    def bucket(self, fake_redis_client):
+        nodes = redlock_plus.init_redis_nodes([fake_redis_client() for _ in range(5)])
+        return TokenBucket("foo", capacity=3, rate=10, nodes=nodes)
+
+    def test_minority_down(self, bucket, mocker):
+        disconnect(mocker, bucket.redis_nodes[0], bucket)
+        disconnect(mocker, bucket.redis_nodes[1], bucket)
+        assert bucket.acquire(blocking=False)
+
+    def test_majority_down(self, bucket, mocker):
+        for node in bucket.redis_nodes[:3]:
+            disconnect(mocker, node, bucket)
+        result = bucket.acquire(blocking=False)
+        assert not result
+        assert result.retry_after is None
+
+    def test_split(self, bucket):
+        for node in bucket.redis_nodes[:3]:
+            node.redlock_token_bucket_script(keys=["foo"], args=[3, 0.01, 3])
+        result = bucket.acquire(blocking=False)
+        assert not result
+        assert result.remaining == 0
+        assert 0 < result.retry_after <= 100
+        # the minority that granted the token keeps it taken
+        assert bucket.redis_nodes[4].hget("foo", "tokens") == "2"
+
+    def test_minority_denies(self, bucket):
+        for node in bucket.redis_nodes[:2]:
+            node.redlock_token_bucket_script(keys=["foo"], args=[3, 0.01, 3])
+        result = bucket.acquire(blocking=False)
+        assert result
+        assert result.remaining == 2
+
+    def test_single_node_fallback(self, redis_nodes, mocker):
+        bucket = TokenBucket("foo", 1, 1, nodes=redis_nodes, quorum=False)
+        disconnect(mocker, redis_nodes[0], bucket)
+        assert bucket.acquire(blocking=False)
+        assert redis_nodes[1].exists("foo")
+        assert not redis_nodes[2].exists("foo")
+
+    def test_single_node_unreachable(self, redis_nodes, mocker):
+        bucket = TokenBucket("foo", 1, 1, nodes=redis_nodes[:1], quorum=False)
+        disconnect(mocker, redis_nodes[0], bucket)
+        result = bucket.acquire(blocking=False)
+        assert not result
+        assert result.retry_after is None
+
+
+class TestBlocking:
+    def test_waits(self, bucket):
+        assert bucket.acquire(3)
+        start = monotonic()
+        assert bucket.acquire(2)
+        assert monotonic() - start >= 0.15
+
+    def test_timeout(self, bucket):
+        assert bucket.acquire(3)
+        start = monotonic()
+        assert not bucket.acquire(3, timeout=0.1)
+        assert monotonic() - start < 0.1
+
+    def test_over_capacity(self, bucket):
+        with raises(ValueError):
+            bucket.acquire(4)
+
+    def test_zero_timeout(self, bucket):
+        # like Lock.acquire, a timeout of 0 blocks without a deadline
+        assert bucket.acquire(3)
+        start = monotonic()
+        assert bucket.acquire(1, timeout=0)
+        assert monotonic() - start >= 0.05
+
+    def test_non_blocking_timeout(self, bucket):
+        with raises(ValueError):
+            bucket.acquire(blocking=False, timeout=1)
@@ -112,3 +112,24 @@ class TestRelease:
         assert rlock.release() == "foo"
         assert rlock._acquired == 0
         mock_release.assert_called_once()
+
+
+class TestHandoff:
+    def test_resets_recursion(self, rlock, mocker):
+        assert rlock.acquire()
+        assert rlock.acquire()
+        mocker.patch("redlock_plus.Lock.handoff", return_value="foo")
+        assert rlock.handoff() == "foo"
+        assert rlock._acquired == 0
+
+
+class TestAdopt:
+    def test_sets_recursion(self, rlock, mocker):
+        mocker.patch("redlock_plus.Lock.adopt", return_value=10.0)
+        assert rlock.adopt("foo") == 10.0
+        assert rlock._acquired == 1
+
+    def test_not_adopted(self, rlock, mocker):
+        mocker.patch("redlock_plus.Lock.adopt", return_value=False)
+        assert rlock.adopt("foo") is False
+        assert rlock._acquired == 0
@@ -0,0 +1,209 @@
+from time import monotonic, sleep
+
+import redis
+from pytest import fixture, raises, mark
+
+import redlock_plus
+import redlock_plus.nodes
+from redlock_plus.testing import (
+    SimulatedNode,
+    StressReport,
+    run_stress_test,
+    simulated_nodes,
+)
+
+
+@fixture(autouse=True)
+def real_redis(monkeypatch):
+    # simulated nodes wrap real clients, undo the global patch of the conftest
+    monkeypatch.setattr(
+        "redlock_plus.nodes.redis.StrictRedis", redis.client.StrictRedis
+    )
+
+
+@fixture
+def node(fake_redis_client):
+    return SimulatedNode(fake_redis_client())
+
+
+@fixture
+def nodes(fake_redis_client):
+    return simulated_nodes([fake_redis_client() for _ in range(5)], seed=1)
+
+
+class TestSimulatedNode:
+    def test_shares_connection_pool(self, fake_redis_client):
+        client = fake_redis_client()
+        node = SimulatedNode(client)
+        node.set("foo", "bar")
+        assert client.get("foo") == "bar"
+
+    def test_latency(self, node):
+        node.latency = lambda rng: 0.05
+        start = monotonic()
+        node.get("foo")
+        assert monotonic() - start >= 0.05
+
+    def test_latency_pipeline(self, node):
+        node.latency = lambda rng: 0.05
+        pipeline = node.pipeline()
+        pipeline.get("foo")
+        start = monotonic()
+        assert pipeline.execute() == [None]
+        assert monotonic() - start >= 0.05
+
+    def test_request_timeout(self, node):
+        node.latency = lambda rng: 1
+        client = redlock_plus.nodes._TimeoutClient(node, 0.05)
+        start = monotonic()
+        with raises(redis.exceptions.TimeoutError):
+            client.execute_command("GET", "foo")
+        with raises(redis.exceptions.TimeoutError):
+            redlock_plus.nodes._bounded_pipeline(node, 0.05).get("foo").execute()
+        assert monotonic() - start < 1
+
+    def test_failure_rate(self, fake_redis_client):
+        def failures(seed):
+            node = SimulatedNode(fake_redis_client(), failure_rate=0.5, seed=seed)
+            results = []
+            for _ in range(20):
+                try:
+                    node.get("foo")
+                    results.append(False)
+                except redis.exceptions.ConnectionError:
+                    results.append(True)
+            return results
+
+        assert 0 < sum(failures(1)) < 20
+        assert failures(1) == failures(1)
+
+    def test_partition(self, node):
+        node.partition()
+        with raises(redis.exceptions.ConnectionError):
+            node.get("foo")
+        with raises(redis.exceptions.ConnectionError):
+            node.pipeline().get("foo").execute()
+        node.heal()
+        assert node.get("foo") is None
+
+    def test_flush_scripts(self, node):
+        script = node.register_script("return 1")
+        assert script() == 1
+        node.flush_scripts()
+        assert not node.script_exists(script.sha)[0]
+        assert script() == 1
+
+    def test_restart(self, node):
+        node.set("foo", "bar")
+        script = node.register_script("return 1")
+        script()
+        node.restart()
+        assert node.get("foo") is None
+        assert not node.script_exists(script.sha)[0]
+
+    def test_jump_clock(self, node):
+        node.set("expires", 1, px=1000)
+        node.set("survives", 1, px=5000)
+        node.set("persistent", 1)
+        node.jump_clock(2000)
+        assert node.get("expires") is None
+        assert 2000 < node.pttl("survives") <= 3000
+        assert node.get("persistent") == "1"
+
+    def test_jump_clock_server_time(self, node):
+        seconds, microseconds = node.time()
+        node.jump_clock(2500)
+        assert node.clock_offset == 2500
+        jumped_seconds, jumped_microseconds = node.time()
+        elapsed = (jumped_seconds - seconds) * 1000 + (
+            jumped_microseconds - microseconds
+        ) / 1000
+        assert 2500 <= elapsed < 3000
+
+    def test_jump_clock_timed_scripts(self, node):
+        node = redlock_plus.init_redis_nodes([node])[0]
+        node.set("foo", "token")
+        _, seconds, _ = node.redlock_get_ttl_timed_script(keys=["foo"], args=["token"])
+        node.jump_clock(5000)
+        _, jumped_seconds, _ = node.redlock_get_ttl_timed_script(
+            keys=["foo"], args=["token"]
+        )
+        assert int(jumped_seconds) - int(seconds) in (5, 6)
+
+
+class TestLockOnSimulatedNodes:
+    def test_acquire_majority(self, nodes):
+        nodes[0].partition()
+        nodes[1].partition()
+        lock = redlock_plus.Lock("foo", connection_details=nodes, ttl=1000)
+        assert lock.acquire(autoextend=False)
+        assert lock.release()
+
+    def test_acquire_minority(self, nodes):
+        for node in nodes[:3]:
+            node.partition()
+        lock = redlock_plus.Lock("foo", connection_details=nodes, retry_times=0)
+        assert not lock.acquire(blocking=False, autoextend=False)
+
+    def test_slow_minority(self, nodes):
+        for node in nodes[:2]:
+            node.latency = lambda rng: 1
+        lock = redlock_plus.Lock("foo", connection_details=nodes, ttl=10_000)
+        start = monotonic()
+        assert lock.acquire(autoextend=False)
+        assert monotonic() - start < 1
+        assert lock.release()
+
+    def test_clock_jump_expires_lock(self, nodes):
+        lock = redlock_plus.Lock("foo", connection_details=nodes, ttl=1000)
+        assert lock.acquire(autoextend=False)
+        for node in nodes:
+            node.jump_clock(1000)
+        assert not lock.locked()
+
+    def test_clock_jump_measured_by_monitor(self, nodes):
+        monitor = redlock_plus.ClockDriftMonitor(min_window=50)
+        lock = redlock_plus.Lock(
+            "foo", connection_details=nodes, ttl=10_000, clock_monitor=monitor
+        )
+        assert lock.acquire(autoextend=False)
+        assert lock.extend()
+        sleep(0.1)
+        nodes[0].jump_clock(1000)
+        # the measured drift exceeds the ttl, so the lock cannot be considered valid
+        assert not lock.extend()
+        assert monitor.drift_factor(nodes) > 1
+
+    def test_script_flush(self, nodes):
+        lock = redlock_plus.Lock("foo", connection_details=nodes, ttl=1000)
+        assert lock.acquire(autoextend=False)
+        for node in nodes:
+            node.flush_scripts()
+        assert lock.extend()
+
+
+class TestStressReport:
+    def test_throughput(self):
+        assert StressReport(6, 4, 0, 2).throughput == 5
+
+
+@mark.slow
+class TestRunStressTest:
+    def test(self, nodes):
+        factory = redlock_plus.LockFactory(nodes, ttl=1000, retry_times=0)
+        report = run_stress_test(
+            factory, ["a", "b"], workers=4, duration=0.5, hold_time=0.001, seed=1
+        )
+        assert report.acquired > 0
+        assert report.failed > 0
+        assert report.violations == 0
+        assert report.duration >= 0.5
+
+    def test_detects_violations(self, mocker):
+        # locks that never exclude each other
+        factory = mocker.Mock()
+        factory.return_value.acquire.return_value = 1000
+        report = run_stress_test(
+            factory, ["a"], workers=2, duration=0.2, hold_time=0.01
+        )
+        assert report.violations > 0
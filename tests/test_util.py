@@ -1,47 +1,190 @@
+import socket
+import threading
 import time
+from types import SimpleNamespace
 from unittest.mock import call
 
 import pytest
+import redis
 
 import redlock_plus
+import redlock_plus._util
+import redlock_plus.nodes
+import redlock_plus.scripts
 
 
 def test_sleep_ms(mocker):
-    mock_sleep = mocker.patch("redlock_plus.time.sleep")
+    mock_sleep = mocker.patch("redlock_plus._util.time.sleep")
     redlock_plus.sleep_ms(100)
     mock_sleep.assert_called_once_with(0.1)
 
 
+def test_new_lock_key():
+    key = redlock_plus._util._new_lock_key()
+    assert len(key) == 32
+    int(key, 16)
+    assert key != redlock_plus._util._new_lock_key()
+
+
+def test_clock_drift():
+    drift = 1000 * redlock_plus.CLOCK_DRIFT_FACTOR + 2
+    assert redlock_plus._util._clock_drift(1000) == drift
+
+
+def test_node_timeout():
+    assert redlock_plus._util._node_timeout(10_000) == 0.05
+    assert redlock_plus._util._node_timeout(100) == 0.01
+
+
+def test_factors_assigned_on_util(monkeypatch):
+    monkeypatch.setattr(redlock_plus._util, "CLOCK_DRIFT_FACTOR", 0.1)
+    monkeypatch.setattr(redlock_plus._util, "NODE_TIMEOUT_FACTOR", 0.01)
+    lock = redlock_plus.Lock("test_factors", connection_details=[{}] * 3, ttl=10_000)
+    assert lock._drift == 1002
+    assert lock._request_timeout == 0.1
+
+
+def test_factors_assigned_on_package(monkeypatch, fake_redis_client):
+    nodes = [fake_redis_client() for _ in range(3)]
+    lock = redlock_plus.Lock("foo", connection_details=nodes, ttl=10_000)
+    validity = lock.acquire(autoextend=False)
+    assert lock.release()
+    monkeypatch.setattr(redlock_plus, "CLOCK_DRIFT_FACTOR", 0.1)
+    monkeypatch.setattr(redlock_plus, "NODE_TIMEOUT_FACTOR", 0.01)
+    assert redlock_plus._util.CLOCK_DRIFT_FACTOR == 0.1
+    lock = redlock_plus.Lock("foo", connection_details=nodes, ttl=10_000)
+    assert lock._request_timeout == 0.1
+    # the drift grows from 102 to 1002 milliseconds
+    assert lock.acquire(autoextend=False) < validity - 800
+
+
+def test_scripts_exported():
+    assert redlock_plus.RELEASE_LUA_SCRIPT == redlock_plus.scripts.RELEASE_LUA_SCRIPT
+    assert redlock_plus.GET_TTL_LUA_SCRIPT == redlock_plus.scripts.GET_TTL_LUA_SCRIPT
+    assert redlock_plus.BUMP_LUA_SCRIPT == redlock_plus.scripts.BUMP_LUA_SCRIPT
+
+
+def test_validity(mocker):
+    mocker.patch("redlock_plus._util._monotonic_to_ms", side_effect=lambda ms: ms)
+    assert redlock_plus._util._validity(1000, 2, 25, 35) == 988
+    assert redlock_plus._util._validity(10, 2, 25, 35) == -2
+
+
+def test_remaining_ttls(mocker):
+    mocker.patch("redlock_plus._util._monotonic_to_ms", side_effect=lambda ms: ms)
+    remaining = redlock_plus._util._remaining_ttls([1000, None, 15, -1, 0], 2, 25, 35)
+    assert remaining == [988, 3]
+
+
 def test_monotonic_delta_ms(mocker):
-    mock_to_ms = mocker.patch("redlock_plus._monotonic_to_ms", return_value=2)
-    assert redlock_plus._monotonic_delta_ms(100, 25) == 2
+    mock_to_ms = mocker.patch("redlock_plus._util._monotonic_to_ms", return_value=2)
+    assert redlock_plus._util._monotonic_delta_ms(100, 25) == 2
     mock_to_ms.assert_called_once_with(75)
 
 
 @pytest.mark.py_version("< (3, 7)")
 def test_monotonic_to_ms_py_36():
-    assert redlock_plus._monotonic_to_ms(1) == 1000
+    assert redlock_plus._util._monotonic_to_ms(1) == 1000
 
 
 @pytest.mark.py_version(">= (3, 7)")
 def test_monotonic_to_ms_py_37():
-    assert redlock_plus._monotonic_to_ms(1_000_000) == 1
+    assert redlock_plus._util._monotonic_to_ms(1_000_000) == 1
 
 
 @pytest.mark.py_version("< (3, 7)")
 def test_monotonic_py_36():
-    assert redlock_plus.monotonic is time.monotonic
+    assert redlock_plus._util.monotonic is time.monotonic
 
 
 @pytest.mark.py_version(">= (3, 7)")
 def test_monotonic_py_37():
-    assert redlock_plus.monotonic is time.monotonic_ns
+    assert redlock_plus._util.monotonic is time.monotonic_ns
+
+
+class TestNodeLatency:
+    def test_no_samples(self):
+        assert redlock_plus.NodeLatency().p95 == float("inf")
+
+    def test_first_sample(self):
+        latency = redlock_plus.NodeLatency()
+        latency.record(10)
+        assert (latency.mean, latency.deviation) == (10, 5)
+        assert latency.p95 == 20
+
+    def test_record(self):
+        latency = redlock_plus.NodeLatency()
+        latency.record(10)
+        latency.record(18)
+        assert latency.mean == 11
+        assert latency.deviation == 5.75
+        assert latency.p95 == 22.5
+
+    def test_converges(self):
+        latency = redlock_plus.NodeLatency()
+        for _ in range(100):
+            latency.record(4)
+        assert latency.p95 == pytest.approx(4)
+
+
+class TestMapHedged:
+    @pytest.fixture
+    def nodes(self):
+        return [
+            SimpleNamespace(delay=0, redlock_latency=redlock_plus.NodeLatency())
+            for _ in range(5)
+        ]
+
+    @staticmethod
+    def call(node):
+        time.sleep(node.delay)
+        return True
+
+    def test_results(self, nodes):
+        assert redlock_plus._util._map_hedged(self.call, nodes, 3) == [True] * 5
+        assert all(node.redlock_latency.mean is not None for node in nodes)
+
+    def test_single_node(self, nodes, mock):
+        mock.return_value = "foo"
+        assert redlock_plus._util._map_hedged(mock, nodes[:1], 1) == ["foo"]
+        mock.assert_called_once_with(nodes[0])
+
+    def test_skips_slow_node(self, nodes):
+        for node in nodes:
+            node.redlock_latency.record(5)
+        nodes[0].delay = 0.5
+        start = time.monotonic()
+        results = redlock_plus._util._map_hedged(self.call, nodes, 3)
+        assert results == [None] + [True] * 4
+        assert time.monotonic() - start < 0.4
+
+    def test_waits_without_quorum(self, nodes):
+        for node in nodes[3:]:
+            node.redlock_latency.record(5)
+        # slow, but not slower than usual once the quorum is reached
+        for node in nodes[:3]:
+            node.redlock_latency.record(100)
+            node.delay = 0.1
+        assert redlock_plus._util._map_hedged(self.call, nodes, 3) == [True] * 5
+
+    def test_waits_for_unknown_latency(self, nodes):
+        for node in nodes[1:]:
+            node.redlock_latency.record(5)
+        nodes[0].delay = 0.1
+        assert redlock_plus._util._map_hedged(self.call, nodes, 3) == [True] * 5
+
+    def test_failures_do_not_count(self, nodes):
+        for node in nodes:
+            node.redlock_latency.record(5)
+        nodes[0].delay = 0.1
+        results = redlock_plus._util._map_hedged(lambda node: node.delay, nodes, 1)
+        assert results == [0.1, 0, 0, 0, 0]
 
 
 class TestInitRedisNodes:
     def test_create_instances_from_url(self, mocker, mock):
         mock_from_url = mocker.patch(
-            "redlock_plus.redis.StrictRedis.from_url", return_value=mock
+            "redlock_plus.nodes.redis.StrictRedis.from_url", return_value=mock
         )
         conf = {"url": "redis://localhost:1234/1", "foo": "bar"}
         node = redlock_plus.init_redis_nodes([conf])[0]
@@ -49,19 +192,333 @@ class TestInitRedisNodes:
         mock_from_url.assert_called_once_with(conf["url"], foo="bar")
 
     def test_register_scripts(self, mocker):
-        node = redlock_plus.redis.StrictRedis({"url": "redis://localhost:1234/1"})
+        node = redis.StrictRedis({"url": "redis://localhost:1234/1"})
         mock_register = mocker.patch(
-            "redlock_plus.redis.StrictRedis.register_script", side_effect=lambda a: a
+            "redis.StrictRedis.register_script", side_effect=lambda a: a
         )
         redlock_plus.init_redis_nodes([node])[0]
         mock_register.assert_has_calls(
             [
-                call(redlock_plus.RELEASE_LUA_SCRIPT),
-                call(redlock_plus.BUMP_LUA_SCRIPT),
-                call(redlock_plus.GET_TTL_LUA_SCRIPT),
+                call(redlock_plus.scripts.ACQUIRE_LUA_SCRIPT),
+                call(redlock_plus.scripts.RELEASE_LUA_SCRIPT),
+                call(redlock_plus.scripts.BUMP_LUA_SCRIPT),
+                call(redlock_plus.scripts.GET_TTL_LUA_SCRIPT),
             ],
             any_order=True,
         )
-        assert node.redlock_release_script == redlock_plus.RELEASE_LUA_SCRIPT
-        assert node.redlock_bump_script == redlock_plus.BUMP_LUA_SCRIPT
-        assert node.redlock_get_ttl_script == redlock_plus.GET_TTL_LUA_SCRIPT
+        assert node.redlock_acquire_script == redlock_plus.scripts.ACQUIRE_LUA_SCRIPT
+        assert node.redlock_release_script == redlock_plus.scripts.RELEASE_LUA_SCRIPT
+        assert node.redlock_bump_script == redlock_plus.scripts.BUMP_LUA_SCRIPT
+        assert node.redlock_get_ttl_script == redlock_plus.scripts.GET_TTL_LUA_SCRIPT
+
+    def test_latency(self, fake_redis_client):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        latency = node.redlock_latency
+        assert isinstance(latency, redlock_plus.NodeLatency)
+        assert redlock_plus.init_redis_nodes([node])[0].redlock_latency is latency
+
+    def test_subscriber(self, fake_redis_client):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        subscriber = node.redlock_subscriber
+        assert subscriber.node is node
+        assert redlock_plus.init_redis_nodes([node])[0].redlock_subscriber is subscriber
+
+
+class TestNodeRegistry:
+    @pytest.fixture
+    def registry(self):
+        return redlock_plus.NodeRegistry()
+
+    def test_shares_equal_details(self, registry):
+        nodes = registry.acquire([{"host": "a", "port": 1}, {"host": "b"}])
+        assert registry.acquire([{"port": 1, "host": "a"}, {"host": "b"}]) is nodes
+        assert registry.refcount(nodes) == 2
+
+    def test_different_details(self, registry):
+        nodes = registry.acquire([{"host": "a"}])
+        assert registry.acquire([{"host": "b"}]) is not nodes
+
+    def test_nested_details(self, registry):
+        details = [{"host": "a", "ssl": {"ca": ["x"]}}]
+        assert registry.acquire(details) is registry.acquire(details)
+
+    def test_clients_not_cached(self, registry, fake_redis_client):
+        details = [fake_redis_client()]
+        nodes = registry.acquire(details)
+        assert nodes == details
+        assert registry.acquire(details) is not nodes
+        assert registry.refcount(nodes) == 0
+
+    def test_unhashable_not_cached(self, registry):
+        class Unhashable:
+            __hash__ = None
+
+        assert registry._key([{"host": "a", "foo": Unhashable()}]) is None
+
+    def test_release(self, registry, mocker):
+        nodes = registry.acquire([{"host": "a"}])
+        assert registry.acquire([{"host": "a"}]) is nodes
+        mock_disconnect = mocker.patch.object(nodes[0].connection_pool, "disconnect")
+        registry.release(nodes)
+        assert registry.refcount(nodes) == 1
+        mock_disconnect.assert_not_called()
+        registry.release(nodes)
+        assert registry.refcount(nodes) == 0
+        mock_disconnect.assert_called_once_with()
+        assert registry.acquire([{"host": "a"}]) is not nodes
+
+    def test_release_closes_subscriber(self, registry, mocker):
+        nodes = registry.acquire([{"host": "a"}])
+        mocker.patch.object(nodes[0].connection_pool, "disconnect")
+        mock_close = mocker.patch.object(nodes[0].redlock_subscriber, "close")
+        registry.release(nodes)
+        mock_close.assert_called_once_with()
+
+    def test_connection_details(self, registry, fake_redis_client):
+        details = [{"host": "a"}, {"url": "redis://b"}]
+        nodes = registry.acquire(details)
+        assert registry.connection_details(nodes) == details
+        assert registry.connection_details([fake_redis_client()]) is None
+        registry.release(nodes)
+        assert registry.connection_details(nodes) is None
+
+    def test_release_untracked(self, registry, fake_redis_client):
+        registry.release([fake_redis_client()])
+
+    def test_release_later(self, registry, mocker):
+        nodes = registry.acquire([{"host": "a"}])
+        mock_disconnect = mocker.patch.object(nodes[0].connection_pool, "disconnect")
+        registry.release_later(nodes)
+        mock_disconnect.assert_not_called()
+        assert registry.refcount(nodes) == 0
+        mock_disconnect.assert_called_once_with()
+
+
+class TestTimeoutClient:
+    @pytest.fixture
+    def silent_port(self):
+        # accepts connections, but never replies
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        yield server.getsockname()[1]
+        server.close()
+
+    @pytest.fixture
+    def stalling_port(self):
+        # replies with the start of a bulk string, but never the rest of it
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        connections = []
+
+        def serve():
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            connections.append(connection)
+            connection.recv(1024)
+            connection.sendall(b"$10\r\nabc")
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        yield server.getsockname()[1]
+        server.close()
+        for connection in connections:
+            connection.close()
+        thread.join(1)
+
+    @staticmethod
+    def real_node(**kwargs):
+        # init_redis_nodes would see a fake client class
+        node = redis.Redis(**kwargs)
+        node.redlock_bounded_clients = redlock_plus.nodes._BoundedClients(node)
+        return node
+
+    def test_execute_command(self, fake_redis_client):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        client = redlock_plus.nodes._TimeoutClient(node, 1)
+        assert client.execute_command("SET", "foo", "bar") is True
+        assert client.execute_command("GET", "foo") == "bar"
+        assert node.get("foo") == "bar"
+
+    def test_loads_script(self, fake_redis_client):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        client = redlock_plus.nodes._TimeoutClient(node, 1)
+        assert node.redlock_acquire_script(
+            keys=["foo"], args=["token", 1000], client=client
+        )
+
+    def test_timeout(self, silent_port):
+        node = self.real_node(port=silent_port)
+        start_time = time.monotonic()
+        with pytest.raises(redis.exceptions.TimeoutError):
+            redlock_plus.nodes._TimeoutClient(node, 0.05).execute_command("PING")
+        assert time.monotonic() - start_time < 1
+        assert node.connection_pool.connection_kwargs.get("socket_timeout") is None
+        pool = node.redlock_bounded_clients.get(0.05).connection_pool
+        assert pool.connection_kwargs["socket_timeout"] == 0.05
+        # the reply may still arrive, so the connection is not reused
+        assert [c._sock for c in pool._available_connections] == [None]
+
+    def test_partial_reply(self, stalling_port):
+        node = self.real_node(port=stalling_port)
+        start_time = time.monotonic()
+        with pytest.raises(redis.exceptions.TimeoutError):
+            redlock_plus.nodes._TimeoutClient(node, 0.05).execute_command("GET", "foo")
+        assert time.monotonic() - start_time < 1
+
+    @pytest.fixture
+    def pong_port(self):
+        # replies to a single PING
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        connections = []
+
+        def serve():
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            connections.append(connection)
+            connection.recv(1024)
+            connection.sendall(b"+PONG\r\n")
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        yield server.getsockname()[1]
+        server.close()
+        for connection in connections:
+            connection.close()
+        thread.join(1)
+
+    def test_connect_timeout(self, pong_port, mocker):
+        node = self.real_node(port=pong_port, socket_connect_timeout=1)
+        connect_timeouts = []
+        connect = redis.connection.Connection._connect
+
+        def slow_connect(connection):
+            # a handshake taking longer than the request timeout
+            connect_timeouts.append(connection.socket_connect_timeout)
+            time.sleep(0.1)
+            return connect(connection)
+
+        mocker.patch.object(
+            redis.connection.Connection,
+            "_connect",
+            autospec=True,
+            side_effect=slow_connect,
+        )
+        client = redlock_plus.nodes._TimeoutClient(node, 0.05)
+        assert client.execute_command("PING") is True
+        # connecting keeps the connect timeout of the node
+        assert connect_timeouts == [1]
+
+    def test_shares_clients(self, fake_redis_client):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        clients = node.redlock_bounded_clients
+        assert clients.get(0.05) is clients.get(0.05)
+        assert clients.get(0.05) is not clients.get(0.1)
+
+    def test_round_deadline(self, fake_redis_client, mocker):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        spy = mocker.spy(node.redlock_bounded_clients, "get")
+        client = redlock_plus.nodes._TimeoutClient(node, 1, deadline=time.monotonic())
+        with pytest.raises(redis.exceptions.TimeoutError):
+            client.execute_command("PING")
+        spy.assert_not_called()
+
+    def test_deadline_passed(self, fake_redis_client, mocker):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        spy = mocker.spy(node.redlock_bounded_clients, "get")
+        with pytest.raises(redis.exceptions.TimeoutError):
+            redlock_plus.nodes._TimeoutClient(node, 0).execute_command("PING")
+        spy.assert_not_called()
+
+
+class TestNodeSubscriber:
+    @pytest.fixture
+    def node(self, fake_redis_client):
+        node = redlock_plus.init_redis_nodes([fake_redis_client()])[0]
+        yield node
+        node.redlock_subscriber.close()
+
+    @staticmethod
+    def publish(node, channel, event):
+        # subscriptions are confirmed asynchronously by the listening thread
+        for _ in range(20):
+            node.publish(channel, 1)
+            if event.wait(0.05):
+                return True
+        return False
+
+    def test_subscribe(self, node):
+        event = threading.Event()
+        node.redlock_subscriber.subscribe("foo", event)
+        assert self.publish(node, "foo", event)
+
+    def test_shares_connection(self, node, mocker):
+        spy = mocker.spy(node, "pubsub")
+        events = [threading.Event() for _ in range(3)]
+        for channel, event in zip(["foo", "foo", "bar"], events):
+            node.redlock_subscriber.subscribe(channel, event)
+        assert spy.call_count == 1
+        assert self.publish(node, "foo", events[0])
+        assert events[1].is_set()
+        assert not events[2].is_set()
+
+    def test_unsubscribe(self, node, mocker):
+        subscriber = node.redlock_subscriber
+        event, other = threading.Event(), threading.Event()
+        subscriber.subscribe("foo", event)
+        subscriber.subscribe("foo", other)
+        subscriber.subscribe("bar", event)
+        spy = mocker.spy(subscriber._pubsub, "unsubscribe")
+        subscriber.unsubscribe("foo", other)
+        spy.assert_not_called()
+        subscriber.unsubscribe("foo", event)
+        subscriber.unsubscribe("foo", event)
+        spy.assert_called_once_with("foo")
+        assert "foo" not in subscriber._events
+
+    def test_closes_unused_connection(self, node):
+        subscriber = node.redlock_subscriber
+        event = threading.Event()
+        subscriber.subscribe("foo", event)
+        thread = subscriber._thread
+        subscriber.unsubscribe("foo", event)
+        thread.join(1)
+        assert not thread.is_alive()
+        subscriber.subscribe("bar", event)
+        assert self.publish(node, "bar", event)
+
+    def test_close(self, node):
+        subscriber = node.redlock_subscriber
+        subscriber.subscribe("foo", threading.Event())
+        thread = subscriber._thread
+        subscriber.close()
+        thread.join(1)
+        assert not thread.is_alive()
+        assert subscriber._thread is None
+
+    def test_resubscribes_after_connection_lost(self, node):
+        subscriber = node.redlock_subscriber
+        event = threading.Event()
+        subscriber.subscribe("foo", event)
+        thread = subscriber._thread
+        thread.stop()  # as if the thread terminated on a connection error
+        thread.join(1)
+        subscriber.subscribe("bar", threading.Event())
+        assert subscriber._thread is not thread
+        assert self.publish(node, "foo", event)
+
+    def test_unreachable(self, node, mocker):
+        subscriber = node.redlock_subscriber
+        mocker.patch.object(
+            node, "pubsub", side_effect=redis.exceptions.ConnectionError
+        )
+        with pytest.raises(redis.exceptions.ConnectionError):
+            subscriber.subscribe("foo", threading.Event())
+        assert not subscriber._events